@@ -0,0 +1,285 @@
+import os
+import stat
+import socket
+import threading
+import logging
+import tempfile
+import itertools
+import time
+from spatialindex import GridIndex
+from boxarray import BoxArray, formatAnnotationText, pixelsToNormalized
+from profiler import Profiler
+
+
+log = logging.getLogger(__name__)
+
+
+#What the store holds for one image.
+class ImageAnnotations:
+	def __init__(self, annotationFileFullpath, imageWidth, imageHeight):
+		self.annotationFileFullpath = annotationFileFullpath
+		self.imageWidth = imageWidth
+		self.imageHeight = imageHeight
+		self.boxes = BoxArray()		#boxId -> (classId, boxX1, boxY1, boxX2, boxY2) in image coords
+		self.index = GridIndex()	#kept up to date with boxes, for finding the boxes under the mouse without looking at all of them
+		self.fileSignature = None	#detectConflicts:  the annotation file as we last saw it (see getFileSignature())
+		self.conflictFullpath = None	#where this image's boxes go once someone else has changed its annotation file
+
+
+	#All the boxes from the annotation file at once
+	def load(self, boxIds, classIds, normalized):
+		self.boxes = BoxArray.fromNormalized(boxIds, classIds, normalized, self.imageWidth, self.imageHeight)
+		for boxId, box in self.boxes.items():
+			self.index.insert(boxId, box[1], box[2], box[3], box[4])
+
+
+	def add(self, boxId, box):
+		self.boxes.append(boxId, *box)
+		self.index.insert(boxId, box[1], box[2], box[3], box[4])
+
+
+	def remove(self, boxId):
+		self.index.remove(boxId)
+		return self.boxes.remove(boxId)
+
+
+#Holds the boxes for the images you've been on in memory, each box with a stable id, so adding / removing a box is just a dict operation
+#instead of re-reading, fuzzy matching and rewriting the annotation file (and then parsing it again) every time.
+#A background writer thread writes out the images that changed ("dirty" images).  Every write goes to a temp file in the same directory
+#that is then renamed over the annotation file, so a slow or failing network drive never freezes the window and never leaves a half written .txt behind.
+#An image is taken out of dirty (under the lock) when a write of it starts, so a change made during the write makes it dirty again for the next pass.
+#If a write fails, the image goes back in dirty and it gets retried on the next pass.
+#
+#With detectConflicts (--team, several labelers on one directory) an annotation file is only replaced if it's still the file we read or last wrote.
+#If another labeler changed it in between, ours goes next to it as frameN.txt.conflict-host-pid instead of wiping out their boxes, and a warning
+#says so.  (The check and the rename aren't one atomic step, so this is the backstop - the leases in workqueue.py keep two labelers off the same image.)
+class AnnotationStore:
+	#onWrite(imageFilename, annotationFileFullpath, boxCount) is called from the writer thread after each annotation file is written (to keep the DatasetIndex up to date)
+	def __init__(self, flushDelay=1.0, onWrite=None, profiler=None, detectConflicts=False):
+		self.flushDelay = flushDelay	#seconds to wait after a change so a burst of clicks turns into one write
+		self.onWrite = onWrite
+		self.detectConflicts = detectConflicts
+		self.profiler = profiler or Profiler()	#times each annotation file write (--profile)
+		self.images = {}	#imageFilename -> ImageAnnotations
+		self.dirty = {}		#imageFilename -> time it was first changed since its last write
+		self.flushNow = set()	#images to write without waiting for flushDelay ('s' was pressed)
+		self.visited = set()	#images to write an (empty) annotation file for if they don't have one yet
+		self.writtenBoxCounts = {}	#imageFilename -> box count in the annotation file last written for it
+		self.boxIds = itertools.count(1)
+		self.lock = threading.Lock()
+		self.wakeUp = threading.Condition(self.lock)
+		self.writeLock = threading.Lock()	#one writeImages() at a time - the writer thread and flush() from the window
+		self.running = True
+		self.writer = threading.Thread(target=self.writeLoop, name="annotation-writer", daemon=True)
+		self.writer.start()
+
+
+	#Start keeping the boxes for an image (classIds + normalized boxes as parsed from its annotation file, see boxarray.readAnnotationFile()).
+	#If it's already held (you've been on it before) the in-memory boxes win - they may have changes that aren't written yet.
+	#Returns the live BoxArray, only change it through the store.
+	def open(self, imageFilename, annotationFileFullpath, imageWidth, imageHeight, classIds, normalized):
+		fileSignature = None
+		if self.detectConflicts and imageFilename not in self.images:
+			fileSignature = getFileSignature(annotationFileFullpath)	#not under the lock, it's a round trip on a network drive
+		with self.lock:
+			imageAnnotations = self.images.get(imageFilename)
+			if imageAnnotations is None:
+				imageAnnotations = ImageAnnotations(annotationFileFullpath, imageWidth, imageHeight)
+				imageAnnotations.load([next(self.boxIds) for i in range(len(classIds))], classIds, normalized)
+				imageAnnotations.fileSignature = fileSignature
+				self.images[imageFilename] = imageAnnotations
+			return imageAnnotations.boxes
+
+
+	def addBox(self, imageFilename, box):
+		with self.lock:
+			boxId = next(self.boxIds)
+			self.images[imageFilename].add(boxId, box)
+			self.markDirty(imageFilename)
+		return boxId
+
+
+	def removeBox(self, imageFilename, boxId):
+		with self.lock:
+			box = self.images[imageFilename].remove(boxId)
+			if box is not None:
+				self.markDirty(imageFilename)
+		return box
+
+
+	#Ids of the boxes that x, y is inside of (or on the edge of)
+	def getBoxIdsAt(self, imageFilename, x, y):
+		with self.lock:
+			return self.images[imageFilename].index.queryPoint(x, y)
+
+
+	#Ids of the boxes completely inside the region
+	def getBoxIdsInside(self, imageFilename, regionX1, regionY1, regionX2, regionY2):
+		with self.lock:
+			return self.images[imageFilename].index.queryRect(regionX1, regionY1, regionX2, regionY2, contained=True)
+
+
+	#Only call with self.lock held
+	def markDirty(self, imageFilename):
+		if imageFilename not in self.dirty:
+			self.dirty[imageFilename] = time.monotonic()
+		self.wakeUp.notify()
+
+
+	#Write this image out as soon as possible instead of after flushDelay (doesn't wait for the write).
+	def requestFlush(self, imageFilename):
+		with self.lock:
+			if imageFilename in self.dirty:
+				self.flushNow.add(imageFilename)
+				self.wakeUp.notify()
+
+
+	#You've looked at this image - if it has no annotation file yet, write one even if it has no boxes, so it counts as done
+	#(an empty annotation file is how YOLO is told an image has nothing in it).
+	def markVisited(self, imageFilename):
+		with self.lock:
+			self.visited.add(imageFilename)
+			self.wakeUp.notify()
+
+
+	#imageFilename -> how many boxes its annotation file got, for the files written since the store was made
+	def getWrittenBoxCounts(self):
+		with self.lock:
+			return dict(self.writtenBoxCounts)
+
+
+	def isDirty(self, imageFilename):
+		with self.lock:
+			return imageFilename in self.dirty
+
+
+	def writeLoop(self):
+		while True:
+			with self.lock:
+				readyImages = self.takeReadyImages()
+				while self.running and len(readyImages) == 0:
+					timeout = None
+					if self.dirty:
+						timeout = max(0.05, min(self.dirty.values()) + self.flushDelay - time.monotonic())
+					self.wakeUp.wait(timeout)
+					readyImages = self.takeReadyImages()
+				running = self.running
+			self.writeImages(readyImages)
+			if not running:
+				return
+
+
+	#Only call with self.lock held.  Takes the images to write out of dirty / visited, so nobody else writes them too:  the dirty images that
+	#have waited long enough (or were asked to be written now, or all of them with everything), then the visited ones that only need a file
+	#if they don't have one.  Returns [(imageFilename, onlyIfMissing)].
+	def takeReadyImages(self, everything=False):
+		now = time.monotonic()
+		readyImages = [imageFilename for imageFilename, dirtySince in self.dirty.items() if everything or imageFilename in self.flushNow or now - dirtySince >= self.flushDelay]
+		for imageFilename in readyImages:
+			del self.dirty[imageFilename]
+			self.flushNow.discard(imageFilename)
+			self.visited.discard(imageFilename)
+		missingImages = [imageFilename for imageFilename in self.visited if imageFilename not in self.dirty]
+		self.visited.difference_update(missingImages)
+		return [(imageFilename, False) for imageFilename in readyImages] + [(imageFilename, True) for imageFilename in missingImages]
+
+
+	#Snapshot the boxes under the lock, format + write outside of it so the window never waits on the disk.
+	def writeImages(self, readyImages):
+		with self.writeLock:
+			for imageFilename, onlyIfMissing in readyImages:
+				self.writeImage(imageFilename, onlyIfMissing)
+
+
+	def writeImage(self, imageFilename, onlyIfMissing):
+		with self.lock:
+			imageAnnotations = self.images[imageFilename]
+			classIds, coords = imageAnnotations.boxes.copyColumns()
+		if onlyIfMissing and os.path.exists(imageAnnotations.annotationFileFullpath):
+			return
+		try:
+			with self.profiler.stage("annotationWrite"):
+				text = formatAnnotationText(classIds, pixelsToNormalized(coords, imageAnnotations.imageWidth, imageAnnotations.imageHeight))
+				if self.detectConflicts:
+					self.writeUnlessChanged(imageFilename, imageAnnotations, text)
+				else:
+					writeFileAtomically(imageAnnotations.annotationFileFullpath, text)
+		except (OSError, ValueError) as e:
+			log.warning("Could not write " + str(imageAnnotations.annotationFileFullpath) + ", will retry: " + str(e))
+			with self.lock:
+				if imageFilename not in self.dirty:
+					self.dirty[imageFilename] = time.monotonic()	#retry after another flushDelay
+				self.wakeUp.notify()
+			return
+		if imageAnnotations.conflictFullpath is None:
+			with self.lock:
+				self.writtenBoxCounts[imageFilename] = len(classIds)
+		if self.onWrite is not None:
+			self.onWrite(imageFilename, imageAnnotations.annotationFileFullpath, len(classIds))
+
+
+	#detectConflicts:  writes the annotation file if nobody else has changed it since we last saw it, otherwise (and from then on) the conflict file
+	def writeUnlessChanged(self, imageFilename, imageAnnotations, text):
+		if imageAnnotations.conflictFullpath is None and getFileSignature(imageAnnotations.annotationFileFullpath) != imageAnnotations.fileSignature:
+			imageAnnotations.conflictFullpath = str(imageAnnotations.annotationFileFullpath) + ".conflict-" + socket.gethostname() + "-" + str(os.getpid())
+			log.warning("Someone else changed the annotation file for " + imageFilename + " while you had it open - your boxes are saved to "
+				+ imageAnnotations.conflictFullpath + " instead, merge them by hand")
+		if imageAnnotations.conflictFullpath is not None:
+			writeFileAtomically(imageAnnotations.conflictFullpath, text)
+			return
+		writeFileAtomically(imageAnnotations.annotationFileFullpath, text)
+		imageAnnotations.fileSignature = getFileSignature(imageAnnotations.annotationFileFullpath)
+
+
+	#Write everything that's dirty right now, on the calling thread.
+	def flush(self):
+		with self.lock:
+			readyImages = self.takeReadyImages(everything=True)
+		self.writeImages(readyImages)
+
+
+	#Stops the writer and writes anything that's still dirty - call before exiting or changes since the last write are lost.
+	def close(self):
+		with self.lock:
+			self.running = False
+			self.wakeUp.notify()
+		self.writer.join()
+		self.flush()
+		with self.lock:
+			if self.dirty:
+				log.warning("Could not write the annotations for: " + ", ".join(self.dirty))
+
+
+#What changes when anybody writes the file (the atomic rename makes a new inode every time), or None if there's no file
+def getFileSignature(fileFullpath):
+	try:
+		fileStat = os.stat(fileFullpath)
+	except FileNotFoundError:
+		return None
+	return (fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns)
+
+
+#Write to a temp file next to the target, fsync it and rename it over the target.  The rename is atomic, so anything reading the annotation file
+#sees either the old contents or the new contents, never half of a write.
+def writeFileAtomically(fileFullpath, text):
+	fileFullpath = str(fileFullpath)
+	directory, filename = os.path.split(fileFullpath)
+	#mkstemp() makes the file readable by its owner only - keep the permissions the annotation file already had so other labelers can still read it
+	try:
+		mode = stat.S_IMODE(os.stat(fileFullpath).st_mode)
+	except OSError:
+		mode = 0o644
+	fileDescriptor, tempFullpath = tempfile.mkstemp(prefix="." + filename + ".", suffix=".tmp", dir=directory or None)
+	try:
+		with os.fdopen(fileDescriptor, "w") as tempFile:
+			tempFile.write(text)
+			tempFile.flush()
+			os.fsync(tempFile.fileno())
+		os.chmod(tempFullpath, mode)
+		os.replace(tempFullpath, fileFullpath)
+	except BaseException:
+		try:
+			os.remove(tempFullpath)
+		except OSError:
+			pass
+		raise
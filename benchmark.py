@@ -0,0 +1,395 @@
+#Benchmarks for the labeler, so a change can be checked for making things faster or slower instead of guessed at.
+#
+#	replay:  makes directories of synthetic images (each --sizes x --boxes combination, the boxes already in annotation files), then runs the real
+#	         drawLoop() on them under SDL's dummy video driver (no window) and feeds it a scripted session one event per loop iteration:  dragging out
+#	         and adding boxes, deleting one with 'd', going to the previous image and saving + moving on with 's'.  Each kind of event is timed from
+#	         when drawLoop() gets it to when it comes back for the next one - handling it plus redrawing.  The script is the same every run (--seed).
+#	micro:   the box code the labeler runs (boxarray.py) on annotation files with --boxes boxes:  loading a file, removing a box and formatting
+#	         the file the background writer puts back.
+#	video:   splitvid.py frame extraction from a synthetic video, with grab() for the gaps and with seeking.
+#
+#Results (milliseconds per event / call / frame) go to a JSON file.  Give it the file from an earlier run with --baseline and it prints
+#what got faster or slower, and with --max-slowdown it exits with an error if anything got slower by more than that many percent.
+#
+#Examples:
+#	python benchmark.py -o before.json
+#	python benchmark.py -o after.json --baseline before.json --max-slowdown 10
+#	python benchmark.py --suite micro --boxes 10,1000
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")	#before pygame is imported, so no window opens
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import numpy as np  #comes with opencv-python
+import cv2  #pip install opencv-python
+import pygame   #pip install pygame
+import pygamelabeler
+from datasetfiles import iterInputFilenames, StreamingFilenameList, getLabels
+from boxarray import BoxArray, formatAnnotationText, readAnnotationFile, normalizedToPixels, pixelsToNormalized
+from viewport import getWindowSize
+from splitvid import extractSegment, getEncodeParams
+
+
+benchmarkLabels = ["plane", "bird", "balloon", "drone", "satellite"]
+
+
+def getArguments():
+	parser = argparse.ArgumentParser(description='Time the labeler on synthetic images and scripted input, and compare against an earlier run.')
+	parser.add_argument('-o', '--output', default='benchmark.json', help='JSON file to write the results to')
+	parser.add_argument('--baseline', default=None, help='Results JSON from an earlier run to compare against')
+	parser.add_argument('--max-slowdown', type=float, default=None, help='With --baseline:  exit with an error if any result got slower by more than this many percent')
+	parser.add_argument('--suite', choices=['all', 'replay', 'micro', 'video'], default='all', help='Which benchmarks to run')
+	parser.add_argument('--sizes', default='1280x720,3840x2160', help='Comma separated image sizes (WIDTHxHEIGHT) for the replay')
+	parser.add_argument('--boxes', default='0,200', help='Comma separated numbers of boxes already in each annotation file')
+	parser.add_argument('--images', type=int, default=12, help='Images per replay directory')
+	parser.add_argument('--adds-per-image', type=int, default=3, help='Boxes the replay drags out on each image')
+	parser.add_argument('--window-size', default='1280x720', help='Largest labeler window, as WIDTHxHEIGHT (bigger images are shown zoomed out)')
+	parser.add_argument('--repeat', type=int, default=3, help='Times to run each benchmark (all the timings are kept)')
+	parser.add_argument('--micro-calls', type=int, default=200, help='Calls per microbenchmark per repeat')
+	parser.add_argument('--video-frames', type=int, default=240, help='Frames in the synthetic video')
+	parser.add_argument('--video-stride', type=int, default=8, help='Extract every Nth frame of the synthetic video')
+	parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic images and the scripted session')
+	parser.add_argument('--work-dir', default=None, help='Where to make the synthetic data (default: a temporary directory, removed afterwards)')
+	return parser.parse_args()
+
+
+def parseSize(sizeString):
+	width, height = sizeString.lower().split("x")
+	return int(width), int(height)
+
+
+def parseList(listString, parse):
+	return [parse(value) for value in listString.split(",") if value.strip() != ""]
+
+
+#count / mean / p50 / p95 / min of a list of durations in seconds, as milliseconds
+def getSummary(durations):
+	milliseconds = np.array(durations, dtype=np.float64) * 1000
+	return {"count": len(milliseconds), "mean": float(np.mean(milliseconds)), "p50": float(np.percentile(milliseconds, 50)),
+		"p95": float(np.percentile(milliseconds, 95)), "min": float(np.min(milliseconds))}
+
+
+#Something to look at that jpeg doesn't squash to nothing:  a gradient sky, some blobs and a little noise
+def makeSyntheticImage(generator, width, height):
+	sky = np.linspace(generator.randint(120, 200), generator.randint(200, 255), height, dtype=np.float32)
+	image = np.repeat(np.repeat(sky[:, None, None], width, axis=1), 3, axis=2)
+	image[:, :, 0] *= 1.1
+	for i in range(8):
+		center = (generator.randrange(width), generator.randrange(height))
+		axes = (generator.randint(5, max(6, width // 20)), generator.randint(3, max(4, height // 40)))
+		cv2.ellipse(image, center, axes, generator.uniform(0, 180), 0, 360, (generator.randint(0, 120),) * 3, -1)
+	noise = np.random.default_rng(generator.randrange(1 << 30)).normal(0, 4, (height, width, 1)).astype(np.float32)
+	return np.clip(image + noise, 0, 255).astype(np.uint8)
+
+
+#(classIds, normalized) for boxCount random boxes
+def makeSyntheticBoxes(generator, boxCount):
+	classIds = np.array([generator.randrange(len(benchmarkLabels)) for i in range(boxCount)], dtype=np.int32)
+	normalized = np.array([[generator.uniform(0.1, 0.9), generator.uniform(0.1, 0.9), generator.uniform(0.01, 0.15), generator.uniform(0.01, 0.15)] for i in range(boxCount)],
+		dtype=np.float32).reshape(-1, 4)
+	return classIds, normalized
+
+
+def writeLabels(directory):
+	with open(os.path.join(directory, "labels.txt"), "w") as labelFile:
+		labelFile.write("\n".join(benchmarkLabels) + "\n")	#one label per line, like labels.txt
+
+
+#frame0.jpg ... with frameN.txt next to each one holding boxCount boxes
+def makeImageDirectory(directory, imageCount, width, height, boxCount, seed):
+	os.makedirs(directory, exist_ok=True)
+	writeLabels(directory)
+	generator = random.Random(seed)
+	for i in range(imageCount):
+		cv2.imwrite(os.path.join(directory, "frame%d.jpg" % i), makeSyntheticImage(generator, width, height), [cv2.IMWRITE_JPEG_QUALITY, 90])
+		with open(os.path.join(directory, "frame%d.txt" % i), "w") as annotationFile:
+			annotationFile.write(formatAnnotationText(*makeSyntheticBoxes(generator, boxCount)))
+
+
+#Stands in for the mouse and keyboard:  drawLoop() gets one scripted event every time it asks for input, and the time from handing it over to
+#the next time it asks is what handling that event (and redrawing after it) took.  Installed over pygame.event.get / wait and the mouse
+#position / focus functions while the replay runs.
+class EventReplay:
+	def __init__(self, script):
+		self.script = list(script)	#(category or None for untimed, event)
+		self.position = 0
+		self.mousePosition = (0, 0)
+		self.pending = None	#(category, start) of the event drawLoop() is working on
+		self.durations = {}	#category -> [seconds]
+		self.waited = False	#drawLoop() calls get() right after wait() for anything else that came in - nothing has, that's the next frame's
+
+
+	def nextEvents(self, *args, **kwargs):
+		if self.waited:
+			self.waited = False
+			return []
+		now = time.perf_counter()
+		if self.pending is not None:
+			category, start = self.pending
+			self.durations.setdefault(category, []).append(now - start)
+			self.pending = None
+		pygame.event.pump()
+		if self.position >= len(self.script):
+			return [pygame.event.Event(pygame.QUIT)]
+		category, event = self.script[self.position]
+		self.position += 1
+		if hasattr(event, "pos"):
+			self.mousePosition = event.pos
+		if category is not None:
+			self.pending = (category, time.perf_counter())
+		return [event]
+
+
+	def waitEvent(self, *args, **kwargs):
+		event = self.nextEvents()[0]
+		self.waited = True
+		return event
+
+
+	def install(self):
+		self.originals = (pygame.event.get, pygame.event.wait, pygame.mouse.get_pos, pygame.mouse.get_focused)
+		pygame.event.get = self.nextEvents
+		pygame.event.wait = self.waitEvent
+		pygame.mouse.get_pos = lambda: self.mousePosition
+		pygame.mouse.get_focused = lambda: True
+
+
+	def uninstall(self):
+		pygame.event.get, pygame.event.wait, pygame.mouse.get_pos, pygame.mouse.get_focused = self.originals
+
+
+def getKeyEvent(key):
+	return pygame.event.Event(pygame.KEYDOWN, key=getattr(pygame, "K_" + key), mod=0, unicode=key)
+
+
+def getClickEvent(x, y):
+	return pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(x, y))
+
+
+def getMotionEvent(x, y):
+	return pygame.event.Event(pygame.MOUSEMOTION, pos=(x, y), rel=(0, 0), buttons=(0, 0, 0))
+
+
+#The scripted session, in window coordinates:  on every image drag out addsPerImage boxes, delete the last one, and every fourth image
+#go back one ('p') and forward again before saving ('s').
+def getReplayScript(generator, imageCount, windowWidth, windowHeight, addsPerImage):
+	script = []
+	for imageNumber in range(imageCount):
+		for i in range(addsPerImage):
+			x1, y1 = generator.randrange(windowWidth - 60), generator.randrange(windowHeight - 60)
+			x2, y2 = x1 + generator.randint(10, 59), y1 + generator.randint(10, 59)
+			script.append(("startBox", getClickEvent(x1, y1)))
+			for step in range(1, 5):
+				script.append(("drag", getMotionEvent(x1 + (x2 - x1) * step // 4, y1 + (y2 - y1) * step // 4)))
+			script.append(("addBox", getClickEvent(x2, y2)))
+		if addsPerImage > 0:
+			script.append((None, getMotionEvent((x1 + x2) // 2, (y1 + y2) // 2)))
+			script.append(("deleteBox", getKeyEvent("d")))
+		if imageNumber % 4 == 3:
+			script.append(("previousImage", getKeyEvent("p")))
+			script.append(("saveAndNext", getKeyEvent("s")))
+		if imageNumber < imageCount - 1:
+			script.append(("saveAndNext", getKeyEvent("s")))
+	return script
+
+
+#One labeling session on directory (of imageWidth x imageHeight images), returns {category: [seconds]} plus the whole session as "session"
+def runReplay(directory, imageWidth, imageHeight, args, seed):
+	labelerArgs = pygamelabeler.getArguments(["-i", directory, "--window-size", args.window_size, "--fps", "0", "--no-index", "--log-level", "warning"])
+	filenamesList = StreamingFilenameList(iterInputFilenames(directory))
+	filenamesList.waitUntilComplete()
+	windowWidth, windowHeight = getWindowSize(imageWidth, imageHeight, parseSize(args.window_size))
+	replay = EventReplay(getReplayScript(random.Random(seed), len(filenamesList), windowWidth, windowHeight, args.adds_per_image))
+	replay.install()
+	sessionStart = time.perf_counter()
+	try:
+		pygamelabeler.drawLoop(filenamesList, directory, getLabels(directory, "labels.txt"), labelerArgs)
+	finally:
+		replay.uninstall()
+	replay.durations["session"] = [time.perf_counter() - sessionStart]
+	return replay.durations
+
+
+def runReplaySuite(args, workDirectory, results):
+	for width, height in parseList(args.sizes, parseSize):
+		for boxCount in parseList(args.boxes, int):
+			name = "replay/%dx%d/%dboxes" % (width, height, boxCount)
+			print("Running " + name)
+			durations = {}
+			for repeat in range(args.repeat):
+				#A fresh copy every time, the session before changed the annotation files
+				directory = os.path.join(workDirectory, "replay-%dx%d-%d" % (width, height, boxCount))
+				shutil.rmtree(directory, ignore_errors=True)
+				makeImageDirectory(directory, args.images, width, height, boxCount, args.seed)
+				for category, categoryDurations in runReplay(directory, width, height, args, args.seed + repeat).items():
+					durations.setdefault(category, []).extend(categoryDurations)
+			for category, categoryDurations in durations.items():
+				results[name + "/" + category] = getSummary(categoryDurations)
+
+
+#calls seconds per call:  calls in a row timed together (the functions are too quick to time one call), or one at a time when there's a
+#setup to run before each call that shouldn't be counted.
+def timeCalls(function, calls, repeat, setup=None):
+	durations = []
+	for i in range(repeat):
+		if setup is None:
+			start = time.perf_counter()
+			for j in range(calls):
+				function()
+			durations.append((time.perf_counter() - start) / calls)
+			continue
+		for j in range(calls):
+			setup()
+			start = time.perf_counter()
+			function()
+			durations.append(time.perf_counter() - start)
+	return durations
+
+
+def runMicroSuite(args, workDirectory, results):
+	directory = os.path.join(workDirectory, "micro")
+	os.makedirs(directory, exist_ok=True)
+	annotationFullpath = os.path.join(directory, "frame0.txt")
+	imageWidth, imageHeight = 1920, 1080
+	generator = random.Random(args.seed)
+
+	print("Running micro/pixelsToNormalized")
+	results["micro/pixelsToNormalized"] = getSummary(timeCalls(
+		lambda: pixelsToNormalized((100.5, 200.25, 180.0, 260.75), imageWidth, imageHeight), args.micro_calls * 50, args.repeat))
+
+	for boxCount in parseList(args.boxes, int):
+		classIds, normalized = makeSyntheticBoxes(generator, max(1, boxCount))
+		with open(annotationFullpath, "w") as annotationFile:
+			annotationFile.write(formatAnnotationText(classIds, normalized))
+		boxIds = list(range(len(classIds)))
+		boxes = None
+		def makeBoxes():
+			nonlocal boxes
+			boxes = BoxArray.fromNormalized(boxIds, classIds, normalized, imageWidth, imageHeight)
+		makeBoxes()
+		name = "micro/%s/%dboxes"
+		print("Running micro benchmarks on " + str(len(classIds)) + " boxes")
+		results[name % ("readAnnotationFile+normalizedToPixels", len(classIds))] = getSummary(timeCalls(
+			lambda: normalizedToPixels(readAnnotationFile(annotationFullpath)[1], imageWidth, imageHeight), args.micro_calls, args.repeat))
+		results[name % ("BoxArray.remove", len(classIds))] = getSummary(timeCalls(
+			lambda: boxes.remove(boxIds[0]), args.micro_calls, args.repeat, makeBoxes))
+		results[name % ("BoxArray.toAnnotationText", len(classIds))] = getSummary(timeCalls(
+			lambda: boxes.toAnnotationText(imageWidth, imageHeight), args.micro_calls, args.repeat))
+
+
+#Returns the video's file name, or None if OpenCV can't write one here
+def makeSyntheticVideo(videoFullpath, frameCount, width, height, seed):
+	writer = cv2.VideoWriter(videoFullpath, cv2.VideoWriter_fourcc(*"mp4v"), 30, (width, height))
+	if not writer.isOpened():
+		return None
+	background = makeSyntheticImage(random.Random(seed), width, height)
+	for frameNumber in range(frameCount):
+		frame = np.roll(background, frameNumber * 2, axis=1)	#slow pan, so the frames aren't all the same to the encoder
+		writer.write(frame)
+	writer.release()
+	return videoFullpath
+
+
+def runVideoSuite(args, workDirectory, results):
+	width, height = parseList(args.sizes, parseSize)[0]
+	videoFullpath = makeSyntheticVideo(os.path.join(workDirectory, "synthetic.mp4"), args.video_frames, width, height, args.seed)
+	if videoFullpath is None:
+		print("Skipping the video benchmarks, OpenCV can't write an mp4v video here.")
+		return
+	frameNumbers = list(range(0, args.video_frames, max(1, args.video_stride)))
+	encodeParams = getEncodeParams("jpg", 95, 3)
+	#grabThreshold above the stride = grab() through the gaps, 0 = seek to every frame
+	for name, grabThreshold in (("grab", 100), ("seek", 0)):
+		print("Running video/extract-" + name)
+		durations = []
+		for repeat in range(args.repeat):
+			outputDirectory = os.path.join(workDirectory, "frames-" + name)
+			shutil.rmtree(outputDirectory, ignore_errors=True)
+			os.makedirs(outputDirectory)
+			start = time.perf_counter()
+			stats = extractSegment(videoFullpath, frameNumbers, outputDirectory, grabThreshold, 4, 16, "jpg", encodeParams)
+			durations.append((time.perf_counter() - start) / max(1, stats["frames"]))
+		results["video/extract-%s/%dx%d/per-frame" % (name, width, height)] = getSummary(durations)
+
+
+def getMachineInfo():
+	return {"platform": platform.platform(), "python": platform.python_version(), "processor": platform.processor(), "cpus": os.cpu_count(),
+		"numpy": np.__version__, "opencv": cv2.__version__, "pygame": pygame.version.ver}
+
+
+#Prints old vs new p50 for every result in both, returns the names that got slower by more than maxSlowdown percent
+def compareToBaseline(results, baseline, maxSlowdown):
+	slower = []
+	print("Compared to the baseline (p50 milliseconds):")
+	print("\t%-64s %10s %10s %8s" % ("benchmark", "baseline", "now", "change"))
+	for name in sorted(results):
+		if name not in baseline:
+			continue
+		old, new = baseline[name]["p50"], results[name]["p50"]
+		change = 0.0
+		if old > 0:
+			change = 100 * (new - old) / old
+		marker = ""
+		if maxSlowdown is not None and change > maxSlowdown:
+			marker = "  <-- slower"
+			slower.append(name)
+		print("\t%-64s %10.4f %10.4f %+7.1f%%%s" % (name, old, new, change, marker))
+	missing = [name for name in baseline if name not in results]
+	if len(missing) > 0:
+		print("\t(" + str(len(missing)) + " baseline results weren't run this time)")
+	return slower
+
+
+def printResults(results):
+	print("\t%-64s %8s %10s %10s %10s" % ("benchmark (milliseconds)", "count", "p50", "p95", "mean"))
+	for name in sorted(results):
+		result = results[name]
+		print("\t%-64s %8d %10.4f %10.4f %10.4f" % (name, result["count"], result["p50"], result["p95"], result["mean"]))
+
+
+def main():
+	args = getArguments()
+	logging.basicConfig(format="%(message)s", level=logging.WARNING)
+	baseline = None
+	if args.baseline is not None:
+		try:
+			with open(args.baseline, "r") as baselineFile:
+				baseline = json.load(baselineFile)["results"]
+		except (OSError, ValueError, KeyError) as e:
+			exit("Could not read the baseline " + str(args.baseline) + ": " + str(e))
+
+	workDirectory = args.work_dir or tempfile.mkdtemp(prefix="pygamelabeler-benchmark-")
+	os.makedirs(workDirectory, exist_ok=True)
+	results = {}
+	try:
+		if args.suite in ("all", "micro"):
+			runMicroSuite(args, workDirectory, results)
+		if args.suite in ("all", "video"):
+			runVideoSuite(args, workDirectory, results)
+		if args.suite in ("all", "replay"):
+			runReplaySuite(args, workDirectory, results)	#last, drawLoop() prints a lot
+	finally:
+		if args.work_dir is None:
+			shutil.rmtree(workDirectory, ignore_errors=True)
+
+	settings = {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "max_slowdown", "work_dir")}
+	with open(args.output, "w") as outputFile:
+		json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"), "machine": getMachineInfo(), "settings": settings, "results": results}, outputFile, indent=1)
+	print("Results:")
+	printResults(results)
+	print("Wrote " + str(len(results)) + " results to " + str(args.output))
+
+	if baseline is not None:
+		slower = compareToBaseline(results, baseline, args.max_slowdown)
+		if len(slower) > 0:
+			exit(str(len(slower)) + " benchmarks got more than " + str(args.max_slowdown) + "% slower.")
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,196 @@
+import io
+import numpy as np  #comes with opencv-python
+
+
+#Boxes for one image kept as columns instead of a python list per box:  int class ids + float32 x1, y1, x2, y2 in image (pixel) coords.
+#Converting to and from the YOLO normalized format (and parsing / writing annotation files) is done for all the boxes at once with numpy
+#instead of one box at a time, and the class is an index into labels.txt instead of the label string (no more labels.index(label) per box).
+#
+#In YOLO annotation files, each line is:  classIndex normalizedBoxCenterX normalizedBoxCenterY normalizedBoxWidth normalizedBoxHeight
+#centerX = (x1 + x2) / 2 / imageWidth, width = (x2 - x1) / imageWidth, the same for y with the height (pixelsToNormalized() below).
+#
+#Nothing in here needs pygame, so the batch tools can use it too.
+
+
+#Annotation file text -> (classIds, normalized, badLines):  normalized is an (N, 4) float32 array of centerX, centerY, width, height for the good
+#lines, badLines is [(lineNumber, what's wrong)] for the ones that aren't 5 numbers with a whole number class first (line numbers count from 1,
+#blank lines included, blank lines are fine).
+#Every line is split up front to count its values, but the numbers are still converted all at once by numpy - only a file with a bad line
+#goes through the lines one at a time to say which ones.
+def parseAnnotationLines(text):
+	fieldsPerLine = [line.split() for line in text.splitlines()]
+	if all(len(fields) in (0, 5) for fields in fieldsPerLine):
+		try:
+			values = np.array(text.split(), dtype=np.float64).reshape(-1, 5)
+		except ValueError:
+			values = None	#something that isn't a number - find it below
+		if values is not None:
+			classColumn = values[:, 0]
+			if (np.isfinite(classColumn) & (classColumn == np.floor(classColumn))).all():
+				return classColumn.astype(np.int32), values[:, 1:].astype(np.float32), []
+
+	rows, badLines = [], []
+	for lineNumber, fields in enumerate(fieldsPerLine, 1):
+		if len(fields) == 0:
+			continue
+		if len(fields) != 5:
+			badLines.append((lineNumber, "needs 5 values (class centerX centerY width height), got " + str(len(fields))))
+			continue
+		try:
+			row = [float(field) for field in fields]
+		except ValueError:
+			badLines.append((lineNumber, "not a number: " + " ".join(fields)))
+			continue
+		if not (np.isfinite(row[0]) and row[0] == np.floor(row[0])):
+			badLines.append((lineNumber, "the class should be a whole number, got " + fields[0]))
+			continue
+		rows.append(row)
+	values = np.array(rows, dtype=np.float64).reshape(-1, 5)
+	return values[:, 0].astype(np.int32), values[:, 1:].astype(np.float32), badLines
+
+
+#Annotation file text -> (classIds, normalized), or ValueError naming the first bad line
+def parseAnnotationText(text):
+	classIds, normalized, badLines = parseAnnotationLines(text)
+	if len(badLines) > 0:
+		lineNumber, problem = badLines[0]
+		raise ValueError("line " + str(lineNumber) + ": " + problem + (" (and " + str(len(badLines) - 1) + " more bad lines)" if len(badLines) > 1 else ""))
+	return classIds, normalized
+
+
+#A missing annotation file just means the image doesn't have any boxes yet.
+#Without onBadLine a bad line is a ValueError, with it the good lines are returned and onBadLine(lineNumber, problem) is called for each bad one.
+def readAnnotationFile(annotationFileFullpath, onBadLine=None):
+	try:
+		with open(annotationFileFullpath, "r") as annotationFile:
+			text = annotationFile.read()
+	except FileNotFoundError:
+		return np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32)
+	if onBadLine is None:
+		return parseAnnotationText(text)
+	classIds, normalized, badLines = parseAnnotationLines(text)
+	for lineNumber, problem in badLines:
+		onBadLine(lineNumber, problem)
+	return classIds, normalized
+
+
+#6 decimal places is a millionth of the image width - well under a pixel even on an 8K frame.
+def formatAnnotationText(classIds, normalized):
+	if len(classIds) == 0:
+		return ""
+	text = io.StringIO()
+	rows = np.column_stack((classIds.astype(np.float64), normalized.astype(np.float64)))
+	np.savetxt(text, rows, fmt=["%d", "%.6f", "%.6f", "%.6f", "%.6f"], delimiter=" ")
+	return text.getvalue()
+
+
+#(N, 4) centerX, centerY, width, height (0 to 1) -> (N, 4) x1, y1, x2, y2 in pixels
+def normalizedToPixels(normalized, imageWidth, imageHeight):
+	normalized = np.asarray(normalized, dtype=np.float32).reshape(-1, 4)
+	scale = np.array([imageWidth, imageHeight], dtype=np.float32)
+	centers = normalized[:, 0:2] * scale
+	halfSizes = normalized[:, 2:4] * scale / 2
+	return np.hstack((centers - halfSizes, centers + halfSizes))
+
+
+#(N, 4) x1, y1, x2, y2 in pixels -> (N, 4) centerX, centerY, width, height (0 to 1)
+def pixelsToNormalized(pixels, imageWidth, imageHeight):
+	pixels = np.asarray(pixels, dtype=np.float32).reshape(-1, 4)
+	scale = np.array([imageWidth, imageHeight], dtype=np.float32)
+	sizes = pixels[:, 2:4] - pixels[:, 0:2]
+	centers = pixels[:, 0:2] + sizes / 2
+	return np.hstack((centers / scale, sizes / scale))
+
+
+#Growable columns with a stable id per box.  Works like the boxId -> box dict it replaced in the labeler:  boxes[boxId], boxes.items(), boxes.values()
+#and iterating give (classId, boxX1, boxY1, boxX2, boxY2) tuples.
+#Appending is amortized O(1) (the arrays double when they fill up).  Removing moves the last box into the removed box's row, so it's O(1) too,
+#but the order of the boxes changes.
+class BoxArray:
+	def __init__(self, capacity=16):
+		self.count = 0
+		self.boxIds = np.zeros(capacity, dtype=np.int64)
+		self.classIds = np.zeros(capacity, dtype=np.int32)
+		self.coords = np.zeros((capacity, 4), dtype=np.float32)	#x1, y1, x2, y2 in pixels
+		self.rows = {}	#boxId -> row
+
+
+	@classmethod
+	def fromNormalized(cls, boxIds, classIds, normalized, imageWidth, imageHeight):
+		boxArray = cls(max(16, len(classIds)))
+		count = len(classIds)
+		boxArray.boxIds[:count] = boxIds
+		boxArray.classIds[:count] = classIds
+		boxArray.coords[:count] = normalizedToPixels(normalized, imageWidth, imageHeight)
+		boxArray.count = count
+		boxArray.rows = {int(boxId): row for row, boxId in enumerate(boxArray.boxIds[:count].tolist())}
+		return boxArray
+
+
+	def append(self, boxId, classId, boxX1, boxY1, boxX2, boxY2):
+		if self.count == len(self.boxIds):
+			capacity = max(16, len(self.boxIds) * 2)
+			self.boxIds = np.resize(self.boxIds, capacity)
+			self.classIds = np.resize(self.classIds, capacity)
+			self.coords = np.resize(self.coords, (capacity, 4))
+		row = self.count
+		self.boxIds[row] = boxId
+		self.classIds[row] = classId
+		self.coords[row] = (boxX1, boxY1, boxX2, boxY2)
+		self.rows[boxId] = row
+		self.count += 1
+
+
+	#Returns the removed box, or None if there's no box with that id
+	def remove(self, boxId):
+		row = self.rows.pop(boxId, None)
+		if row is None:
+			return None
+		box = self.getRow(row)
+		last = self.count - 1
+		if row != last:
+			self.boxIds[row] = self.boxIds[last]
+			self.classIds[row] = self.classIds[last]
+			self.coords[row] = self.coords[last]
+			self.rows[int(self.boxIds[row])] = row
+		self.count -= 1
+		return box
+
+
+	def getRow(self, row):
+		boxX1, boxY1, boxX2, boxY2 = self.coords[row].tolist()
+		return (int(self.classIds[row]), boxX1, boxY1, boxX2, boxY2)
+
+
+	def __getitem__(self, boxId):
+		return self.getRow(self.rows[boxId])
+
+
+	def __contains__(self, boxId):
+		return boxId in self.rows
+
+
+	def __len__(self):
+		return self.count
+
+
+	def items(self):
+		return zip(self.boxIds[:self.count].tolist(), self.values())
+
+
+	def values(self):
+		return [(classId, boxX1, boxY1, boxX2, boxY2) for classId, (boxX1, boxY1, boxX2, boxY2) in zip(self.classIds[:self.count].tolist(), self.coords[:self.count].tolist())]
+
+
+	def __iter__(self):
+		return iter(self.values())
+
+
+	#A copy of the live columns - the background writer formats this while the window keeps changing the real thing.
+	def copyColumns(self):
+		return self.classIds[:self.count].copy(), self.coords[:self.count].copy()
+
+
+	def toAnnotationText(self, imageWidth, imageHeight):
+		classIds, coords = self.copyColumns()
+		return formatAnnotationText(classIds, pixelsToNormalized(coords, imageWidth, imageHeight))
@@ -0,0 +1,254 @@
+import os
+import io
+import json
+import time
+import tarfile
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from PIL import Image   #pip install pillow
+from datasetfiles import getAnnotationFileName
+from boxarray import readAnnotationFile, normalizedToPixels
+from annotationstore import writeFileAtomically
+
+
+#Packs a labeled directory into a few big files for the training cluster instead of hundreds of thousands of little ones:
+#	- tar shards in the WebDataset layout:  every image is a "sample" of files sharing a key (its path minus the extension), in order:
+#	      frame123.jpg    the image, byte for byte (not re-encoded)
+#	      frame123.txt    its YOLO annotation file as it is (empty for an image without one)
+#	      frame123.json   the same boxes parsed:  {"width", "height", "boxes": [[classId, x1, y1, x2, y2] in pixels], "labels": [class names]}
+#	  shard-000000.tar, shard-000001.tar ... each with --shard-size images.
+#	- annotations.json in the COCO format (category id = line in labels.txt + 1, bbox = [x, y, width, height] in pixels).
+#
+#Each shard is written by its own worker process, which streams the images from disk into the tar one at a time, so memory stays at about one
+#image per process however big the directory is.  The main process only ever holds the box lists for the few shards in flight while it writes the
+#COCO file out in order.
+#
+#manifest.json in the output directory remembers a fingerprint (names + mtimes + sizes of every image and annotation file in it) for each shard,
+#and is rewritten as each shard finishes.  Exporting again only rewrites the shards whose fingerprint changed - so after labeling some more, or
+#after an export that was interrupted, only what's different is written.  Shards are cut in the listing order, so adding frames at the end only
+#touches the last shard (adding them in the middle moves everything after them over, and those shards get rewritten).
+
+
+manifestFilename = "manifest.json"
+cocoFilename = "annotations.json"
+
+
+def getShardFilename(shardNumber):
+	return "shard-%06d.tar" % shardNumber
+
+
+#WebDataset splits a member's name at the first dot of the file name into key + extension, so the key can't have any dots of its own
+def getSampleKey(imageFilename):
+	directory, filename = os.path.split(os.path.splitext(imageFilename)[0])
+	return os.path.join(directory, filename.replace(".", "_")).replace(os.sep, "/")
+
+
+def getStatOrNone(fileFullpath):
+	try:
+		return os.stat(fileFullpath)
+	except OSError:
+		return None
+
+
+#Everything that would change a shard's contents:  the file names and the mtime / size of each image and annotation file
+def getShardFingerprint(inputDirectory, imageFilenames):
+	fingerprint = hashlib.blake2b(digest_size=16)
+	for imageFilename in imageFilenames:
+		for fileStat in (getStatOrNone(os.path.join(inputDirectory, imageFilename)), getStatOrNone(getAnnotationFileName(inputDirectory, imageFilename))):
+			fingerprint.update(repr((imageFilename, None if fileStat is None else (fileStat.st_mtime_ns, fileStat.st_size))).encode())
+	return fingerprint.hexdigest()
+
+
+#What the COCO file needs for one image:  (imageFilename, width, height, classIds, normalized).  Only reads the image header.
+def getImageRecord(inputDirectory, imageFilename):
+	with Image.open(os.path.join(inputDirectory, imageFilename)) as image:
+		imageWidth, imageHeight = image.size
+	classIds, normalized = readAnnotationFile(getAnnotationFileName(inputDirectory, imageFilename))
+	return imageFilename, imageWidth, imageHeight, classIds, normalized
+
+
+def addTarMember(tar, name, data, mtime):
+	tarInfo = tarfile.TarInfo(name)
+	tarInfo.size = len(data)
+	tarInfo.mtime = mtime
+	tar.addfile(tarInfo, io.BytesIO(data))
+
+
+#Runs in a worker process.  Writes the shard to a temp file and renames it into place, so a shard is never left half written.
+#Returns the records for the COCO file, plus the problems (images that couldn't be read / annotation files that couldn't be parsed - those are left out).
+def writeShard(inputDirectory, imageFilenames, shardFullpath, labels):
+	records, problems = [], []
+	tempFullpath = shardFullpath + ".tmp"
+	with tarfile.open(tempFullpath, "w") as tar:
+		for imageFilename in imageFilenames:
+			imageFullpath = os.path.join(inputDirectory, imageFilename)
+			try:
+				record = getImageRecord(inputDirectory, imageFilename)
+				annotationFullpath = getAnnotationFileName(inputDirectory, imageFilename)
+				annotationText = b""
+				if os.path.exists(annotationFullpath):
+					with open(annotationFullpath, "rb") as annotationFile:
+						annotationText = annotationFile.read()
+			except (OSError, ValueError) as e:
+				problems.append(imageFilename + ": " + str(e))
+				continue
+			imageFilename, imageWidth, imageHeight, classIds, normalized = record
+			key = getSampleKey(imageFilename)
+			imageStat = os.stat(imageFullpath)
+			tarInfo = tarfile.TarInfo(key + os.path.splitext(imageFilename)[1].lower())
+			tarInfo.size = imageStat.st_size
+			tarInfo.mtime = int(imageStat.st_mtime)
+			with open(imageFullpath, "rb") as imageFile:
+				tar.addfile(tarInfo, imageFile)	#copied across in blocks, never all in memory
+			addTarMember(tar, key + ".txt", annotationText, int(imageStat.st_mtime))
+			pixels = normalizedToPixels(normalized, imageWidth, imageHeight)
+			boxes = [[classId] + [round(value, 2) for value in box] for classId, box in zip(classIds.tolist(), pixels.tolist())]
+			sampleJson = {"width": imageWidth, "height": imageHeight, "boxes": boxes, "labels": [labels[classId] if 0 <= classId < len(labels) else None for classId in classIds.tolist()]}
+			addTarMember(tar, key + ".json", json.dumps(sampleJson).encode(), int(imageStat.st_mtime))
+			records.append(record)
+	os.replace(tempFullpath, shardFullpath)
+	return records, problems
+
+
+#Runs in a worker process, for shards that haven't changed but whose boxes the COCO file still needs
+def readShardRecords(inputDirectory, imageFilenames):
+	records, problems = [], []
+	for imageFilename in imageFilenames:
+		try:
+			records.append(getImageRecord(inputDirectory, imageFilename))
+		except (OSError, ValueError) as e:
+			problems.append(imageFilename + ": " + str(e))
+	return records, problems
+
+
+#Writes the COCO file a piece at a time as the shards come in, instead of building one huge dict
+class CocoWriter:
+	def __init__(self, cocoFullpath, labels):
+		self.cocoFullpath = cocoFullpath
+		self.tempFullpath = cocoFullpath + ".tmp"
+		self.cocoFile = open(self.tempFullpath, "w")
+		self.labels = labels
+		self.imageCount = 0
+		self.annotationCount = 0
+		self.unknownClassCount = 0
+		self.annotationsFile = open(self.tempFullpath + ".annotations", "w+")	#annotations come after all the images in the file, so they wait here
+		categories = [{"id": classId + 1, "name": label, "supercategory": "none"} for classId, label in enumerate(labels)]
+		self.cocoFile.write('{"info": ' + json.dumps({"description": "exported by datasettool.py", "date_created": time.strftime("%Y-%m-%d %H:%M:%S")})
+			+ ', "categories": ' + json.dumps(categories) + ', "images": [')
+
+
+	def addRecords(self, records):
+		for imageFilename, imageWidth, imageHeight, classIds, normalized in records:
+			self.imageCount += 1
+			imageId = self.imageCount
+			self.cocoFile.write((",\n" if imageId > 1 else "\n") + json.dumps({"id": imageId, "file_name": imageFilename.replace(os.sep, "/"), "width": imageWidth, "height": imageHeight}))
+			pixels = normalizedToPixels(normalized, imageWidth, imageHeight)
+			for classId, (boxX1, boxY1, boxX2, boxY2) in zip(classIds.tolist(), pixels.tolist()):
+				if classId < 0 or classId >= len(self.labels):
+					self.unknownClassCount += 1
+					continue
+				self.annotationCount += 1
+				boxWidth, boxHeight = boxX2 - boxX1, boxY2 - boxY1
+				annotation = {"id": self.annotationCount, "image_id": imageId, "category_id": classId + 1, "bbox": [round(boxX1, 2), round(boxY1, 2), round(boxWidth, 2), round(boxHeight, 2)],
+					"area": round(boxWidth * boxHeight, 2), "iscrowd": 0}
+				self.annotationsFile.write((",\n" if self.annotationCount > 1 else "\n") + json.dumps(annotation))
+
+
+	def close(self):
+		self.cocoFile.write('\n], "annotations": [')
+		self.annotationsFile.seek(0)
+		for chunk in iter(lambda: self.annotationsFile.read(1024 * 1024), ""):
+			self.cocoFile.write(chunk)
+		self.cocoFile.write('\n]}\n')
+		self.cocoFile.close()
+		self.annotationsFile.close()
+		os.remove(self.tempFullpath + ".annotations")
+		os.replace(self.tempFullpath, self.cocoFullpath)
+
+
+def readManifest(outputDirectory):
+	try:
+		with open(os.path.join(outputDirectory, manifestFilename), "r") as manifestFile:
+			return json.load(manifestFile)
+	except (OSError, ValueError):
+		return None
+
+
+def writeManifest(outputDirectory, manifest):
+	writeFileAtomically(os.path.join(outputDirectory, manifestFilename), json.dumps(manifest, indent=1))
+
+
+#imageFilenames in the order they should be in the shards.  writeTar / writeCoco pick the outputs.  Returns a dict of counts for the report.
+def exportDataset(inputDirectory, imageFilenames, labels, outputDirectory, shardSize=1000, workers=1, writeTar=True, writeCoco=True):
+	os.makedirs(outputDirectory, exist_ok=True)
+	shardSize = max(1, shardSize)
+	shards = [imageFilenames[i:i + shardSize] for i in range(0, len(imageFilenames), shardSize)]
+	settings = {"shardSize": shardSize, "labels": labels, "format": 1}
+
+	oldManifest = readManifest(outputDirectory)
+	oldShards = {}
+	leftoverShards = set()
+	if oldManifest is not None:
+		leftoverShards = set(oldManifest.get("shards", {}))
+		if oldManifest.get("settings") == settings:
+			oldShards = oldManifest.get("shards", {})
+	manifest = {"settings": settings, "shards": {}}
+
+	#A stat of every file - on a network drive that's the slow part, so do a bunch at once
+	with ThreadPoolExecutor(max_workers=16) as executor:
+		fingerprints = list(executor.map(lambda shard: getShardFingerprint(inputDirectory, shard), shards))
+
+	counts = {"images": len(imageFilenames), "shards": len(shards), "shardsWritten": 0, "shardsUnchanged": 0, "problems": []}
+	cocoWriter = None
+	if writeCoco:
+		cocoWriter = CocoWriter(os.path.join(outputDirectory, cocoFilename), labels)
+
+	#Only a few shards in flight at a time, and their results are used in order - that's what keeps the memory bounded
+	with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+		pending = []
+		nextShard = 0
+		while nextShard < len(shards) or len(pending) > 0:
+			while nextShard < len(shards) and len(pending) < max(1, workers) * 2:
+				shardName = getShardFilename(nextShard)
+				shardFullpath = os.path.join(outputDirectory, shardName)
+				oldShard = oldShards.get(shardName)
+				unchanged = oldShard is not None and oldShard.get("fingerprint") == fingerprints[nextShard] and os.path.exists(shardFullpath)
+				future = None
+				if writeTar and not unchanged:
+					future = executor.submit(writeShard, inputDirectory, shards[nextShard], shardFullpath, labels)
+				elif writeCoco:
+					future = executor.submit(readShardRecords, inputDirectory, shards[nextShard])
+				pending.append((nextShard, shardName, writeTar and not unchanged, future))
+				nextShard += 1
+
+			shardNumber, shardName, written, future = pending.pop(0)
+			records, problems = [], []
+			if future is not None:
+				records, problems = future.result()
+			counts["problems"].extend(problems)
+			if cocoWriter is not None:
+				cocoWriter.addRecords(records)
+			if written:
+				counts["shardsWritten"] += 1
+				print("Wrote " + shardName + " (" + str(len(shards[shardNumber])) + " images)")
+			elif writeTar:
+				counts["shardsUnchanged"] += 1
+			if writeTar:
+				manifest["shards"][shardName] = {"fingerprint": fingerprints[shardNumber], "images": len(shards[shardNumber]), "first": shards[shardNumber][0], "last": shards[shardNumber][-1]}
+				if written:
+					writeManifest(outputDirectory, dict(manifest, shards=dict(oldShards, **manifest["shards"])))	#interrupted here, the next run picks up after this shard
+
+	#Shards left over from an export with more images (or smaller shards) than this one
+	if writeTar:
+		for shardName in leftoverShards:
+			if shardName not in manifest["shards"]:
+				try:
+					os.remove(os.path.join(outputDirectory, shardName))
+				except OSError:
+					pass
+		writeManifest(outputDirectory, manifest)
+	if cocoWriter is not None:
+		cocoWriter.close()
+		counts["annotations"] = cocoWriter.annotationCount
+		counts["unknownClassBoxes"] = cocoWriter.unknownClassCount
+	return counts
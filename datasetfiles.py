@@ -0,0 +1,153 @@
+import os
+import re
+import logging
+import threading
+from pathlib import Path
+from PIL import Image   #pip install pillow
+from dedupe import iterUniqueFilenames  #near duplicate frames (see dedupe.py)
+
+
+log = logging.getLogger(__name__)
+
+
+#Where the images, labels and annotation files are on disk.  No pygame in here, so the batch tools and the dataset index can use these too.
+
+
+image_extensions = {".jpg", ".jpeg", ".bmp" , ".png", ".webp"}  # I'm just detecting jpeg, bitmap, png and webp (splitvid.py can write webp)
+# I would use imghdr, but I saw a big discussion about the python maintainers deprecating it
+
+
+#"frame10.jpg" -> ["frame", 10, ".jpg"], so frame9.jpg sorts before frame10.jpg
+def getNaturalSortKey(filename):
+	return [int(part) if part.isdigit() else part for part in re.split(r'([0-9]+)', filename.lower())]
+
+
+#Yields the image filenames (relative to mypath) one directory at a time with os.scandir() - which gets the file types along with the names,
+#so no extra stat per file - instead of building the whole list up front.
+#order:  "natural" (frame9 before frame10), "name" (plain string order) or "none" (whatever order the file system gives them, the fastest).
+#Each directory is sorted on its own and its subdirectories come after its files, so the order is the same every time.
+#Hidden directories (starting with '.') are skipped.  extensions (lower case) picks which files count - the batch tools use it to find the .txt annotation files.
+def iterInputFilenames(mypath, recursive=False, order="natural", relativeDirectory="", extensions=image_extensions):
+	filenames = []
+	subdirectories = []
+	#https://stackoverflow.com/questions/3207219/how-do-i-list-all-files-of-a-directory
+	with os.scandir(os.path.join(mypath, relativeDirectory)) as entries:
+		for entry in entries:
+			if entry.is_file():
+				#https://stackoverflow.com/questions/541390/extracting-extension-from-filename-in-python/
+				name, extension = os.path.splitext(entry.name)
+				if extension.lower() in extensions:  #.JPG counts too
+					filenames.append(entry.name)
+			elif recursive and entry.is_dir() and not entry.name.startswith("."):
+				subdirectories.append(entry.name)
+
+	if order == "natural":
+		filenames.sort(key=getNaturalSortKey)
+		subdirectories.sort(key=getNaturalSortKey)
+	elif order == "name":
+		filenames.sort()
+		subdirectories.sort()
+
+	for filename in filenames:
+		yield os.path.join(relativeDirectory, filename)
+	for subdirectory in subdirectories:
+		yield from iterInputFilenames(mypath, recursive, order, os.path.join(relativeDirectory, subdirectory), extensions)
+
+
+#duplicateThreshold:  leave out images whose perceptual hash is within this many bits of an earlier image's (None keeps them all)
+def getInputFilenames(mypath, recursive=False, order="natural", duplicateThreshold=None):
+	filenames = iterInputFilenames(mypath, recursive, order)
+	if duplicateThreshold is not None:
+		filenames = iterUniqueFilenames(mypath, filenames, duplicateThreshold)
+	return list(filenames)
+
+
+#A list of filenames that fills itself in from a background thread, so the labeler can show the first image while the rest of a huge
+#directory is still being listed.  len() and [] work on whatever has been found so far, waitFor() blocks until a position exists
+#(or discovery is finished and it doesn't).  A plain list is taken as already complete.
+class StreamingFilenameList:
+	def __init__(self, filenames, batchSize=256):
+		self.filenames = []
+		self.complete = False
+		self.condition = threading.Condition()
+		if isinstance(filenames, list):
+			self.filenames = filenames
+			self.complete = True
+			return
+		self.batchSize = batchSize
+		self.thread = threading.Thread(target=self.discover, args=(filenames,), name="discovery", daemon=True)
+		self.thread.start()
+
+
+	def discover(self, filenames):
+		batch = []
+		try:
+			for filename in filenames:
+				batch.append(filename)
+				if len(batch) >= self.batchSize or len(self.filenames) == 0:	#the first one goes out right away
+					self.addBatch(batch)
+					batch = []
+		except OSError as e:
+			log.warning("Stopped looking for images: " + str(e))
+		finally:
+			self.addBatch(batch)
+			with self.condition:
+				self.complete = True
+				self.condition.notify_all()
+
+
+	def addBatch(self, batch):
+		with self.condition:
+			self.filenames.extend(batch)
+			self.condition.notify_all()
+
+
+	def __len__(self):
+		return len(self.filenames)
+
+
+	def __getitem__(self, position):
+		return self.filenames[position]
+
+
+	def waitFor(self, position):
+		with self.condition:
+			while len(self.filenames) <= position and not self.complete:
+				self.condition.wait()
+			return position < len(self.filenames)
+
+
+	def waitUntilComplete(self):
+		with self.condition:
+			while not self.complete:
+				self.condition.wait()
+		return self.filenames
+	
+
+#You are expected to put your labels in a file named "labels.txt" in the input directory.  See the example labels.txt given for format.
+def getLabels(inputDirectory, labelFileName):
+	labels = None
+	with open(os.path.join(inputDirectory, labelFileName)) as f:
+		labels = f.read().splitlines()
+	return labels
+			
+
+#The annotation file for a given image will have the same filename, except the prefix will be .txt  (so there will be a separate annotation file for each image that holds all the label box details)
+def getAnnotationFileName(inputDirectory, imageFilename):
+	inputDirectory = Path(inputDirectory)
+	filename, extension = os.path.splitext(imageFilename)  #get the image extension off the image file name
+	
+	annotationFilename = filename + ".txt" #the image annotation file has the same first part of the name but the extension is ".txt" instead of the image extension.
+
+	annotationFileFullpath = inputDirectory / annotationFilename
+	
+	return annotationFileFullpath
+
+
+#https://stackoverflow.com/questions/6444548/how-do-i-get-the-picture-size-with-pil
+#Image.open() only reads the file header - the pixels aren't decoded until something asks for them, so this is cheap even for huge images.
+#Use this when you need an image's dimensions without showing it (the labeler's loadDataset() gets them off the decoded surface instead).
+def getImageSize(inputDirectory, imageFilename):
+	with Image.open(os.path.join(inputDirectory, imageFilename)) as image:
+		imageWidth, imageHeight = image.size
+	return imageWidth, imageHeight
@@ -0,0 +1,171 @@
+import os
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datasetfiles import getAnnotationFileName, getImageSize
+
+
+log = logging.getLogger(__name__)
+
+
+#A small SQLite file in the input directory that remembers, for every image:  its size, its mtime, whether it has an annotation file
+#(and that file's mtime) and how many boxes are in it.
+#On startup refresh() only re-reads the images / annotation files whose mtime changed since last time, so even with hundreds of
+#thousands of images the labeler knows straight away which ones are done - it can jump to the first image you haven't labeled yet,
+#or only show the images with boxes / without boxes, instead of you pressing 's' through thousands of finished images.
+#
+#"unlabeled" means there's no annotation file yet.  "empty" means there is one but it has no boxes (you looked, there was nothing to label).
+class DatasetIndex:
+	def __init__(self, inputDirectory, indexFilename=".pygamelabeler-index.sqlite", workers=8):
+		self.inputDirectory = inputDirectory
+		self.workers = workers
+		self.lock = threading.Lock()	#the annotation writer thread updates the index too
+		self.closed = False		#refresh() can still be running in the background when the labeler exits
+		self.connection = sqlite3.connect(os.path.join(inputDirectory, indexFilename), check_same_thread=False)
+		with self.lock, self.connection:
+			self.connection.execute("CREATE TABLE IF NOT EXISTS images (filename TEXT PRIMARY KEY, position INTEGER, width INTEGER, height INTEGER, "
+				"imageMtime REAL, imageSize INTEGER, labeled INTEGER, annotationMtime REAL, boxCount INTEGER)")
+			self.connection.execute("CREATE INDEX IF NOT EXISTS imagesByLabeled ON images (labeled, position)")
+			self.connection.execute("CREATE INDEX IF NOT EXISTS imagesByBoxCount ON images (boxCount, position)")
+			self.connection.execute("CREATE INDEX IF NOT EXISTS imagesByPosition ON images (position)")
+
+
+	#Brings the index up to date with filenames (in the order the labeler shows them).  Returns how many images had to be (re)read,
+	#or None if the index was closed before it finished.
+	def refresh(self, filenames):
+		with self.lock:
+			if self.closed:
+				return None
+			known = {}
+			for filename, position, imageMtime, imageSize, annotationMtime in self.connection.execute("SELECT filename, position, imageMtime, imageSize, annotationMtime FROM images"):
+				known[filename] = (position, imageMtime, imageSize, annotationMtime)
+		indexedAnnotationMtimes = {filename: row[3] for filename, row in known.items()}
+
+		positionUpdates = []
+		changed = []	#(position, filename, imageStat, annotationStat, needsImageSize) for anything that has to be re-read
+		for position, filename in enumerate(filenames):
+			row = known.pop(filename, None)
+			try:
+				imageStat = os.stat(os.path.join(self.inputDirectory, filename))
+			except OSError:
+				continue
+			annotationStat = getStatOrNone(getAnnotationFileName(self.inputDirectory, filename))
+			annotationMtime = None
+			if annotationStat is not None:
+				annotationMtime = annotationStat.st_mtime
+			if row is None:
+				changed.append((position, filename, imageStat, annotationStat, True))
+			elif row[1] != imageStat.st_mtime or row[2] != imageStat.st_size:
+				changed.append((position, filename, imageStat, annotationStat, True))
+			elif row[3] != annotationMtime:
+				changed.append((position, filename, imageStat, annotationStat, False))
+			elif row[0] != position:
+				positionUpdates.append((position, filename))
+
+		#The header probes + box counts are all small reads, so do a bunch at once (this is what makes the first run over a network drive bearable)
+		with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+			rows = list(executor.map(self.readImage, changed))
+
+		with self.lock:
+			if self.closed:
+				return None
+			with self.connection:
+				rows = self.keepNewerAnnotations(rows, indexedAnnotationMtimes)
+				self.connection.executemany("INSERT OR REPLACE INTO images (filename, position, width, height, imageMtime, imageSize, labeled, annotationMtime, boxCount) "
+					"VALUES (?, ?, COALESCE(?, (SELECT width FROM images WHERE filename = ?)), COALESCE(?, (SELECT height FROM images WHERE filename = ?)), ?, ?, ?, ?, ?)", rows)
+				self.connection.executemany("UPDATE images SET position = ? WHERE filename = ?", positionUpdates)
+				self.connection.executemany("DELETE FROM images WHERE filename = ?", [(filename,) for filename in known])	#images that aren't there any more
+		return len(changed)
+
+
+	#updateAnnotation() can write an annotation file while refresh() is reading the files.  Its stat was taken after the write, so it's newer
+	#than the one refresh() took (or refresh() found no file at all) - keep what it put in the index instead of the rows' labeled /
+	#annotationMtime / boxCount.  Only call with self.lock held.
+	def keepNewerAnnotations(self, rows, indexedAnnotationMtimes):
+		written = {}
+		for filename, labeled, annotationMtime, boxCount in self.connection.execute("SELECT filename, labeled, annotationMtime, boxCount FROM images WHERE annotationMtime IS NOT NULL"):
+			if annotationMtime != indexedAnnotationMtimes.get(filename):
+				written[filename] = (labeled, annotationMtime, boxCount)	#changed since refresh() read the index
+		keptRows = []
+		for row in rows:
+			current = written.get(row[0])
+			if current is not None and (row[9] is None or current[1] > row[9]):
+				row = row[:8] + current
+			keptRows.append(row)
+		return keptRows
+
+
+	#Runs in the refresh() thread pool
+	def readImage(self, changedImage):
+		position, filename, imageStat, annotationStat, needsImageSize = changedImage
+		imageWidth, imageHeight = None, None	#None keeps the size that's already in the index (only the annotation file changed)
+		if needsImageSize:
+			try:
+				imageWidth, imageHeight = getImageSize(self.inputDirectory, filename)
+			except OSError as e:
+				log.warning("Could not read the size of " + str(filename) + ": " + str(e))
+		labeled, annotationMtime, boxCount = 0, None, 0
+		if annotationStat is not None:
+			labeled, annotationMtime = 1, annotationStat.st_mtime
+			boxCount = countBoxes(getAnnotationFileName(self.inputDirectory, filename))
+		return (filename, position, imageWidth, filename, imageHeight, filename, imageStat.st_mtime, imageStat.st_size, labeled, annotationMtime, boxCount)
+
+
+	#Called by the AnnotationStore after it writes an annotation file, so the index never has to re-read a file the labeler wrote itself.
+	#Inserts the row if refresh() hasn't gotten to the image yet (it fills in the rest, and keeps this write - see keepNewerAnnotations()).
+	def updateAnnotation(self, imageFilename, annotationFileFullpath, boxCount):
+		annotationStat = getStatOrNone(annotationFileFullpath)
+		if annotationStat is None:
+			return
+		with self.lock:
+			if self.closed:
+				return
+			with self.connection:
+				self.connection.execute("INSERT INTO images (filename, labeled, annotationMtime, boxCount) VALUES (?, 1, ?, ?) "
+					"ON CONFLICT(filename) DO UPDATE SET labeled = 1, annotationMtime = excluded.annotationMtime, boxCount = excluded.boxCount",
+					(imageFilename, annotationStat.st_mtime, boxCount))
+
+
+	#Position (in the filenames given to refresh()) of the first image without an annotation file, or None if they're all done
+	def getFirstUnlabeledPosition(self):
+		with self.lock:
+			row = self.connection.execute("SELECT position FROM images WHERE labeled = 0 ORDER BY position LIMIT 1").fetchone()
+		if row is None:
+			return None
+		return row[0]
+
+
+	#"all", "labeled" (has boxes), "empty" (annotation file with no boxes) or "unlabeled" (no annotation file), in the order given to refresh()
+	def getFilenames(self, filterName):
+		conditions = {"all": "1", "labeled": "boxCount > 0", "empty": "labeled = 1 AND boxCount = 0", "unlabeled": "labeled = 0"}
+		with self.lock:
+			return [row[0] for row in self.connection.execute("SELECT filename FROM images WHERE " + conditions[filterName] + " ORDER BY position")]
+
+
+	def getCounts(self):
+		with self.lock:
+			total, labeled, withBoxes = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(labeled), 0), COALESCE(SUM(boxCount > 0), 0) FROM images").fetchone()
+		return total, labeled, withBoxes
+
+
+	def close(self):
+		with self.lock:
+			self.closed = True
+			self.connection.close()
+
+
+def getStatOrNone(fileFullpath):
+	try:
+		return os.stat(fileFullpath)
+	except OSError:
+		return None
+
+
+#Non-blank lines - one box per line
+def countBoxes(annotationFileFullpath):
+	try:
+		with open(annotationFileFullpath, "r") as annotationFile:
+			return sum(1 for line in annotationFile if line.strip())
+	except OSError:
+		return 0
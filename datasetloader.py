@@ -0,0 +1,182 @@
+import os
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np  #comes with opencv-python
+from PIL import Image  #pip install pillow
+from datasetfiles import iterInputFilenames, getLabels, getAnnotationFileName
+from boxarray import readAnnotationFile, normalizedToPixels
+from tilestore import TileStore
+
+
+log = logging.getLogger(__name__)
+
+
+#A labeled directory for training / evaluation scripts to iterate over, without copying the YOLO parsing out of the labeler (no pygame in here):
+#
+#	from datasetloader import YoloDataset
+#	dataset = YoloDataset("frames/", imageSize=(640, 640), cacheDirectory="/scratch/cache", shardIndex=rank, shardCount=worldSize)
+#	for epoch in range(epochs):
+#		dataset.setEpoch(epoch)
+#		for image, classIds, boxes in dataset:
+#			...	#image:  (height, width, 3) uint8 RGB.  classIds:  (N,) int32 lines of labels.txt.  boxes:  (N, 4) float32 x1, y1, x2, y2 in the image's pixels.
+#	dataset.close()
+#
+#Images are decoded (and resized) by a pool of threads, at most prefetch images ahead of the one you're on - PIL lets go of the GIL while it
+#decodes, so the threads really do run at the same time, and memory stays at prefetch images however big the directory is.
+#imageSize=(width, height) stretches every image to that size (the boxes are scaled with it, they're stored normalized anyway).  Letterboxing and
+#augmentation are left to the training script.  With a cacheDirectory too, the resized images are kept in a TileStore (tilestore.py) there,
+#so from the second epoch on (and in the next run) an image is a slice of a memory mapped file instead of a decode.  Images that changed
+#since (mtime / size) are decoded again.  The annotation files are always read fresh, they're small and they change while you label.
+#
+#Sharding:  the images are listed in the same (natural) order everywhere and shard i of n gets every n-th one starting at i, so the shards are
+#the same in every process and every epoch without them having to talk to each other, and each shard has its own cache files.
+#For n training processes with k loader workers each, use shardIndex = rank * k + workerId, shardCount = n * k.  shuffle=True shuffles the
+#order within a shard with (seed, epoch), so every process gets a different order each epoch and the same one when you run it again.
+#evenShards=True drops the last image from the longer shards, for training setups that hang when one process has an extra batch.
+
+
+#Decoded and made the right size.  draft() has the jpeg decoder scale down while it decodes when the image is going to be shrunk anyway.
+def decodeImage(imageFullpath, imageSize=None):
+	with Image.open(imageFullpath) as image:
+		if imageSize is not None:
+			image.draft("RGB", imageSize)
+		image = image.convert("RGB")
+		if imageSize is not None and image.size != tuple(imageSize):
+			image = image.resize(imageSize, Image.BILINEAR)
+	return np.asarray(image)
+
+
+#Labeled images (an annotation file, even an empty one) in the order every shard agrees on
+def getDatasetFilenames(inputDirectory, recursive=False, includeUnlabeled=False):
+	filenames = iterInputFilenames(inputDirectory, recursive, "natural")
+	if includeUnlabeled:
+		return list(filenames)
+	return [filename for filename in filenames if os.path.exists(getAnnotationFileName(inputDirectory, filename))]
+
+
+class YoloDataset:
+	#boxFormat:  "pixels" (x1, y1, x2, y2 in the returned image) or "normalized" (the YOLO centerX, centerY, width, height from 0 to 1, as in the files)
+	def __init__(self, inputDirectory, imageSize=None, cacheDirectory=None, shardIndex=0, shardCount=1, shuffle=False, seed=0, evenShards=False,
+			workers=4, prefetch=16, recursive=False, includeUnlabeled=False, boxFormat="pixels", labelsFilename="labels.txt"):
+		if not 0 <= shardIndex < shardCount:
+			raise ValueError("shardIndex should be from 0 to shardCount - 1, got " + str(shardIndex) + " of " + str(shardCount))
+		if cacheDirectory is not None and imageSize is None:
+			raise ValueError("cacheDirectory needs an imageSize - the cache keeps every image at the same size")
+		if boxFormat not in ("pixels", "normalized"):
+			raise ValueError("boxFormat should be \"pixels\" or \"normalized\", got " + str(boxFormat))
+		self.inputDirectory = inputDirectory
+		self.imageSize = None if imageSize is None else (int(imageSize[0]), int(imageSize[1]))
+		self.cacheDirectory = cacheDirectory
+		self.shardIndex = shardIndex
+		self.shardCount = shardCount
+		self.shuffle = shuffle
+		self.seed = seed
+		self.workers = workers
+		self.prefetch = max(1, prefetch)
+		self.boxFormat = boxFormat
+		self.epoch = 0
+		self.skipped = {}	#imageFilename -> why, for the images left out because they (or their annotation files) couldn't be read
+		self.labels = getLabels(inputDirectory, labelsFilename) if os.path.exists(os.path.join(inputDirectory, labelsFilename)) else None
+
+		allFilenames = getDatasetFilenames(inputDirectory, recursive, includeUnlabeled)
+		self.filenames = allFilenames[shardIndex::shardCount]
+		if evenShards:
+			self.filenames = self.filenames[:len(allFilenames) // shardCount]
+		self.store = None	#opened on the first pass, not here - a dataset made before a fork() shouldn't share the SQLite connection
+
+
+	def __len__(self):
+		return len(self.filenames)
+
+
+	def setEpoch(self, epoch):
+		self.epoch = epoch
+
+
+	#Positions in self.filenames in the order this epoch goes through them
+	def getOrder(self):
+		if not self.shuffle:
+			return list(range(len(self.filenames)))
+		return np.random.default_rng([self.seed, self.epoch, self.shardIndex]).permutation(len(self.filenames)).tolist()
+
+
+	#Per input directory, image size and shard, so several datasets / shard layouts can share a cacheDirectory
+	def getCacheBasePath(self):
+		directoryKey = hashlib.blake2b(os.path.abspath(self.inputDirectory).encode(), digest_size=8).hexdigest()
+		return os.path.join(self.cacheDirectory, "%s-%dx%d-shard%dof%d" % ((directoryKey,) + self.imageSize + (self.shardIndex, self.shardCount)))
+
+
+	def openCache(self):
+		if self.cacheDirectory is not None and self.store is None:
+			os.makedirs(self.cacheDirectory, exist_ok=True)
+			self.store = TileStore(self.getCacheBasePath(), self.imageSize[0], self.imageSize[1])
+
+
+	def getImage(self, imageFilename):
+		imageFullpath = os.path.join(self.inputDirectory, imageFilename)
+		if self.store is None:
+			return decodeImage(imageFullpath, self.imageSize)
+		imageStat = os.stat(imageFullpath)
+		image = self.store.getTile(imageFilename, imageStat)
+		if image is None:
+			image = decodeImage(imageFullpath, self.imageSize)
+			self.store.putTile(imageFilename, imageStat, image)
+		return image
+
+
+	#(image, classIds, boxes), or None for an image that can't be read or an annotation file with a bad line (a line that isn't
+	#5 numbers with a whole number class, see boxarray.parseAnnotationLines()) - training on half a file's boxes would teach the model
+	#that the rest aren't there.  Each one is logged once as a warning (the "datasetloader" logger) and kept in self.skipped with the reason.
+	def loadSample(self, imageFilename):
+		try:
+			classIds, normalized = readAnnotationFile(getAnnotationFileName(self.inputDirectory, imageFilename))	#first, a broken one skips the decode
+			image = self.getImage(imageFilename)
+		except (OSError, ValueError, Image.DecompressionBombError) as e:
+			if imageFilename not in self.skipped:
+				log.warning("Skipping " + str(imageFilename) + ": " + str(e))
+			self.skipped[imageFilename] = str(e)
+			return None
+		if self.boxFormat == "normalized":
+			return image, classIds, normalized
+		return image, classIds, normalizedToPixels(normalized, image.shape[1], image.shape[0])
+
+
+	#One pass over the shard.  Stopping early (break) is fine, the decodes in flight are finished and dropped.
+	def __iter__(self):
+		self.openCache()
+		order = iter(self.getOrder())
+		executor = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="loader")
+		pending = deque()
+		try:
+			for position in order:
+				pending.append(executor.submit(self.loadSample, self.filenames[position]))
+				if len(pending) >= self.prefetch:
+					break
+			while len(pending) > 0:
+				sample = pending.popleft().result()
+				position = next(order, None)
+				if position is not None:
+					pending.append(executor.submit(self.loadSample, self.filenames[position]))
+				if sample is not None:
+					yield sample
+		finally:
+			executor.shutdown(wait=True, cancel_futures=True)
+			if self.store is not None:
+				self.store.commit()
+
+
+	def close(self):
+		if self.store is not None:
+			self.store.close()
+			self.store = None
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, excType, excValue, traceback):
+		self.close()
+		return False
@@ -0,0 +1,217 @@
+import os
+import re
+import json
+import errno
+import shutil
+import hashlib
+try:
+	import fcntl  #for reflinks, not on Windows
+except ImportError:
+	fcntl = None
+import numpy as np  #comes with opencv-python
+from datasetfiles import getAnnotationFileName
+from boxarray import readAnnotationFile
+from annotationstore import writeFileAtomically
+
+
+#Builds the layout YOLO trainers expect out of a labeled directory, without copying the images:
+#	output/images/train/frame123.jpg    output/labels/train/frame123.txt    (and val / test)
+#	output/data.yaml
+#The files are hardlinks (default - same disk only), symlinks, reflinks (copy-on-write clones, btrfs / xfs) or plain copies.
+#Only images with an annotation file go in (an empty one is an image with nothing in it, which YOLO wants some of too).
+#
+#The split is made of groups, not images:  frames close together in the same video look nearly the same, and one of them in train with its
+#neighbor in val makes val look a lot better than it is.  A group is every frame of a video ("video") or every --chunk-frames frame numbers
+#of it ("chunk", the default), and a whole group always goes to the same split.  A video is the directory + the file name without the frame
+#number (so frames split out by splitvid.py into one directory are one video).
+#
+#The groups are handed out to the splits so each class ends up split about as asked (the groups with the most of a class go first, each one to
+#the split that is furthest short of its share of that group's classes) - ties broken by a hash of the group name + --seed, so it's the same
+#every time.  split.json in the output remembers which split every group went to:  packaging again keeps them where they were, only new
+#groups are handed out, and only files that are new / changed / moved are relinked (--reshuffle starts the split over).
+
+
+splitNames = ["train", "val", "test"]
+splitManifestFilename = "split.json"
+
+
+#"sub/frame1234.jpg" -> ("sub/frame", 1234).  No number -> (name, None).
+def getVideoAndFrame(imageFilename):
+	stem = os.path.splitext(imageFilename)[0]
+	match = re.search(r'([0-9]+)(?!.*[0-9])', os.path.basename(stem))
+	if match is None:
+		return stem, None
+	directory = os.path.dirname(stem)
+	name = os.path.basename(stem)
+	return os.path.join(directory, name[:match.start()] + name[match.end():]), int(match.group(1))
+
+
+def getGroupKey(imageFilename, groupBy, chunkFrames):
+	if groupBy == "image":
+		return imageFilename
+	video, frameNumber = getVideoAndFrame(imageFilename)
+	if groupBy == "video" or frameNumber is None:
+		return video
+	return video + "#" + str(frameNumber // max(1, chunkFrames))
+
+
+#Same order for the same seed on every machine (python's hash() of a string isn't)
+def getTieBreaker(groupKey, seed):
+	return hashlib.blake2b((str(seed) + "/" + groupKey).encode(), digest_size=8).hexdigest()
+
+
+#groupCounts:  groupKey -> counts array (boxes per class, then images).  assignments:  groupKey -> split name for the groups already placed (kept as is).
+#Returns assignments with every group in it.
+def assignSplits(groupCounts, fractions, assignments, seed):
+	assignments = dict(assignments)
+	totals = np.sum(list(groupCounts.values()), axis=0).astype(np.float64)
+	totals[totals == 0] = 1
+	current = {splitName: np.zeros(len(totals)) for splitName in splitNames}
+	for groupKey, splitName in assignments.items():
+		current[splitName] += groupCounts[groupKey]
+
+	#Groups holding the biggest share of some class first - they're the hard ones to place, the little ones even it out at the end
+	newGroups = [groupKey for groupKey in groupCounts if groupKey not in assignments]
+	newGroups.sort(key=lambda groupKey: (-float(np.max(groupCounts[groupKey] / totals)), getTieBreaker(groupKey, seed)))
+	for groupKey in newGroups:
+		shares = groupCounts[groupKey] / totals
+		bestSplit, bestScore = None, None
+		for splitName in splitNames:
+			if fractions[splitName] <= 0:
+				continue
+			score = float(np.sum(shares * (fractions[splitName] * totals - current[splitName]) / totals))	#how far short this split is, on this group's classes
+			if bestScore is None or score > bestScore:
+				bestSplit, bestScore = splitName, score
+		assignments[groupKey] = bestSplit
+		current[bestSplit] += groupCounts[groupKey]
+	return assignments
+
+
+#reflink:  a copy-on-write clone (the FICLONE ioctl), which shares the blocks like a hardlink but is a separate file if either one is changed
+def reflinkFile(sourceFullpath, targetFullpath):
+	if fcntl is None:
+		raise OSError("reflinks aren't supported on this platform, use --link hardlink / symlink / copy")
+	ficlone = 0x40049409
+	with open(sourceFullpath, "rb") as sourceFile, open(targetFullpath, "wb") as targetFile:
+		fcntl.ioctl(targetFile.fileno(), ficlone, sourceFile.fileno())
+	shutil.copystat(sourceFullpath, targetFullpath)
+
+
+#Is targetFullpath already what linking sourceFullpath would make?
+def isUpToDate(sourceFullpath, targetFullpath, linkType):
+	try:
+		if linkType == "symlink":
+			return os.path.islink(targetFullpath) and os.readlink(targetFullpath) == os.path.abspath(sourceFullpath)
+		if os.path.islink(targetFullpath):
+			return False
+		sourceStat, targetStat = os.stat(sourceFullpath), os.stat(targetFullpath)
+	except OSError:
+		return False
+	if linkType == "hardlink":
+		return (sourceStat.st_dev, sourceStat.st_ino) == (targetStat.st_dev, targetStat.st_ino)
+	return sourceStat.st_size == targetStat.st_size and sourceStat.st_mtime_ns == targetStat.st_mtime_ns
+
+
+#The annotation store writes annotation files by renaming a new file over the old one, which leaves a hardlink pointing at the old contents -
+#isUpToDate() sees the different inode and the file is linked again.
+def linkFile(sourceFullpath, targetFullpath, linkType):
+	os.makedirs(os.path.dirname(targetFullpath), exist_ok=True)
+	if os.path.lexists(targetFullpath):
+		os.remove(targetFullpath)
+	if linkType == "hardlink":
+		os.link(sourceFullpath, targetFullpath)
+	elif linkType == "symlink":
+		os.symlink(os.path.abspath(sourceFullpath), targetFullpath)
+	elif linkType == "reflink":
+		reflinkFile(sourceFullpath, targetFullpath)
+	else:
+		shutil.copy2(sourceFullpath, targetFullpath)
+
+
+#YAML without needing pyyaml:  a JSON string is a valid YAML string
+def formatDataYaml(outputDirectory, labels, fractions):
+	lines = ["path: " + json.dumps(os.path.abspath(outputDirectory))]
+	for splitName in splitNames:
+		if fractions[splitName] > 0:
+			lines.append(splitName + ": " + json.dumps("images/" + splitName))
+	lines.append("nc: " + str(len(labels)))
+	lines.append("names:")
+	lines.extend("  " + str(classId) + ": " + json.dumps(label) for classId, label in enumerate(labels))
+	return "\n".join(lines) + "\n"
+
+
+def readSplitManifest(outputDirectory):
+	try:
+		with open(os.path.join(outputDirectory, splitManifestFilename), "r") as manifestFile:
+			return json.load(manifestFile)
+	except (OSError, ValueError):
+		return None
+
+
+#imageFilenames:  the labeled images.  Returns (per split {"images", "boxes" per class}, counts of what was done) for the report.
+def packageDataset(inputDirectory, imageFilenames, labels, outputDirectory, fractions, linkType="hardlink", groupBy="chunk", chunkFrames=9000, seed=0, reshuffle=False):
+	os.makedirs(outputDirectory, exist_ok=True)
+	groupCounts = {}
+	imageGroups = {}
+	imageBoxes = {}
+	problems = []
+	for imageFilename in imageFilenames:
+		try:
+			classIds, normalized = readAnnotationFile(getAnnotationFileName(inputDirectory, imageFilename))
+		except (OSError, ValueError) as e:
+			problems.append(imageFilename + ": " + str(e))
+			continue
+		groupKey = getGroupKey(imageFilename, groupBy, chunkFrames)
+		counts = np.zeros(len(labels) + 1)
+		known = classIds[(classIds >= 0) & (classIds < len(labels))]
+		np.add.at(counts, known, 1)
+		counts[-1] = 1	#the image itself, so groups with no boxes get split up too
+		groupCounts[groupKey] = groupCounts.get(groupKey, 0) + counts
+		imageGroups[imageFilename] = groupKey
+		imageBoxes[imageFilename] = counts
+
+	oldManifest = readSplitManifest(outputDirectory)
+	settings = {"groupBy": groupBy, "chunkFrames": chunkFrames, "seed": seed, "fractions": fractions}
+	assignments = {}
+	oldFiles = []
+	if oldManifest is not None:
+		oldFiles = oldManifest.get("files", [])
+		if not reshuffle and oldManifest.get("settings") == settings:
+			assignments = {groupKey: splitName for groupKey, splitName in oldManifest.get("groups", {}).items() if groupKey in groupCounts}
+	assignments = assignSplits(groupCounts, fractions, assignments, seed)
+
+	done = {"linked": 0, "unchanged": 0, "removed": 0, "problems": problems}
+	splitStats = {splitName: {"images": 0, "groups": 0, "boxes": np.zeros(len(labels) + 1)} for splitName in splitNames}
+	for groupKey, splitName in assignments.items():
+		splitStats[splitName]["groups"] += 1
+	files = []
+	for imageFilename, groupKey in imageGroups.items():
+		splitName = assignments[groupKey]
+		splitStats[splitName]["images"] += 1
+		splitStats[splitName]["boxes"] += imageBoxes[imageFilename]
+		annotationFilename = os.path.relpath(getAnnotationFileName("", imageFilename))
+		for sourceFullpath, relativeTarget in ((os.path.join(inputDirectory, imageFilename), os.path.join("images", splitName, imageFilename)),
+				(os.path.join(inputDirectory, annotationFilename), os.path.join("labels", splitName, annotationFilename))):
+			targetFullpath = os.path.join(outputDirectory, relativeTarget)
+			files.append(relativeTarget)
+			if isUpToDate(sourceFullpath, targetFullpath, linkType):
+				done["unchanged"] += 1
+				continue
+			try:
+				linkFile(sourceFullpath, targetFullpath, linkType)
+			except OSError as e:
+				if e.errno == errno.EXDEV:
+					raise OSError("can't hardlink across file systems - put the output on the same disk as the images, or use --link symlink / reflink / copy")
+				raise
+			done["linked"] += 1
+
+	#Files from the last packaging that aren't wanted any more (image gone, or its group moved to another split with --reshuffle)
+	wanted = set(files)
+	for relativeTarget in oldFiles:
+		if relativeTarget not in wanted and os.path.lexists(os.path.join(outputDirectory, relativeTarget)):
+			os.remove(os.path.join(outputDirectory, relativeTarget))
+			done["removed"] += 1
+
+	writeFileAtomically(os.path.join(outputDirectory, "data.yaml"), formatDataYaml(outputDirectory, labels, fractions))
+	writeFileAtomically(os.path.join(outputDirectory, splitManifestFilename), json.dumps({"settings": settings, "groups": assignments, "files": files}, indent=1))
+	return splitStats, done
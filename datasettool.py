@@ -0,0 +1,342 @@
+#Batch jobs over a labeled directory that don't need the labeler window (no pygame, so they run fine over ssh on the machine with the data).
+#
+#Examples:
+#	python datasettool.py validate -i frames/
+#	python datasettool.py validate -i frames/ --recursive --workers 16 --json report.json
+#	python datasettool.py dedupe -i frames/ --threshold 4 --move-to frames-duplicates/
+#	python datasettool.py export -i frames/ -o /mnt/cluster/skyset/ --shard-size 2000 --workers 8
+#	python datasettool.py package -i frames/ -o skyset-yolo/ --split 0.8,0.1,0.1
+#	python datasettool.py thumbnails -i frames/ --workers 16
+import os
+import shutil
+import sys
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datasetfiles import iterInputFilenames, getLabels, getAnnotationFileName
+from datasetvalidation import validateChunk, getEmptyStats, mergeStats, addProblem, sizeBins
+from dedupe import HashIndex, findDuplicates
+from datasetexport import exportDataset
+from datasetpackage import packageDataset, splitNames
+from thumbnailcache import ThumbnailCache
+
+
+def getArguments():
+	parser = argparse.ArgumentParser(description='Batch tools for a directory of images + YOLO annotation files.')
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	validate = subparsers.add_parser('validate', help='Check every annotation file for problems and print box statistics')
+	validate.add_argument('-i', '--input', default=os.getcwd(), help='Directory with the images, annotation files and labels.txt')
+	validate.add_argument('--labels', default='labels.txt', help='Labels file in the input directory')
+	validate.add_argument('--recursive', action='store_true', help='Also check the subdirectories')
+	validate.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of processes')
+	validate.add_argument('--chunk-size', type=int, default=1000, help='Annotation files per task handed to a process')
+	validate.add_argument('--min-size', type=float, default=0.0, help='Boxes with a width or height (as a fraction of the image) at or below this are degenerate')
+	validate.add_argument('--duplicate-iou', type=float, default=0.95, help='Boxes of the same class that overlap by at least this much are duplicates')
+	validate.add_argument('--tolerance', type=float, default=1e-4, help='How far past the image edge a box can go before it counts as out of range (rounding)')
+	validate.add_argument('--max-problems', type=int, default=20, help='Problems of each type to print (all of them go in the JSON)')
+	validate.add_argument('--json', default=None, help='Write the full report (every problem + the statistics) to this file')
+
+	dedupe = subparsers.add_parser('dedupe', help='Find near duplicate images (perceptual hash), optionally move the unlabeled ones out of the way')
+	dedupe.add_argument('-i', '--input', default=os.getcwd(), help='Directory with the images')
+	dedupe.add_argument('--recursive', action='store_true', help='Also look in the subdirectories')
+	dedupe.add_argument('--threshold', type=int, default=4, help='Images whose hashes differ in at most this many bits (of 64) are duplicates')
+	dedupe.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of threads decoding images to hash them')
+	dedupe.add_argument('--move-to', default=None, help="Move the duplicates that don't have an annotation file to this directory (labeled images are never moved)")
+	dedupe.add_argument('--max-groups', type=int, default=20, help='Number of the biggest duplicate groups to print')
+	dedupe.add_argument('--json', default=None, help='Write every duplicate and the image it duplicates to this file')
+
+	export = subparsers.add_parser('export', help='Pack the images + boxes into WebDataset style tar shards and / or a COCO JSON file')
+	export.add_argument('-i', '--input', default=os.getcwd(), help='Directory with the images, annotation files and labels.txt')
+	export.add_argument('-o', '--output', required=True, help='Directory to write the shards, annotations.json and manifest.json to')
+	export.add_argument('--labels', default='labels.txt', help='Labels file in the input directory')
+	export.add_argument('--recursive', action='store_true', help='Also export the subdirectories')
+	export.add_argument('--format', choices=['tar', 'coco', 'both'], default='both', help='tar: shard-NNNNNN.tar files.  coco: annotations.json.  both')
+	export.add_argument('--shard-size', type=int, default=1000, help='Images per tar shard')
+	export.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of processes writing shards')
+	export.add_argument('--include-unlabeled', action='store_true', help='Also export the images without an annotation file (by default only labeled images are)')
+
+	package = subparsers.add_parser('package', help='Build the images/train, labels/train ... layout + data.yaml for YOLO trainers out of links, not copies')
+	package.add_argument('-i', '--input', default=os.getcwd(), help='Directory with the images, annotation files and labels.txt')
+	package.add_argument('-o', '--output', required=True, help='Directory to build the layout in')
+	package.add_argument('--labels', default='labels.txt', help='Labels file in the input directory')
+	package.add_argument('--recursive', action='store_true', help='Also package the subdirectories')
+	package.add_argument('--split', default='0.8,0.1,0.1', help='Fractions for train,val,test (test can be 0)')
+	package.add_argument('--link', choices=['hardlink', 'symlink', 'reflink', 'copy'], default='hardlink', help='How the files get into the layout (hardlink needs the output on the same disk)')
+	package.add_argument('--group-by', choices=['chunk', 'video', 'image'], default='chunk', help='What is kept together in one split:  --chunk-frames frame numbers of a video, a whole video, or nothing')
+	package.add_argument('--chunk-frames', type=int, default=9000, help='Frame numbers per group with --group-by chunk (9000 is 5 minutes of 30 fps video)')
+	package.add_argument('--seed', type=int, default=0, help='Changes which of the equally good splits groups go to')
+	package.add_argument('--reshuffle', action='store_true', help='Hand out every group again instead of keeping the split from the last packaging')
+
+	thumbnails = subparsers.add_parser('thumbnails', help="Make the thumbnails for the labeler's grid overview ('g') ahead of time")
+	thumbnails.add_argument('-i', '--input', default=os.getcwd(), help='Directory with the images')
+	thumbnails.add_argument('--recursive', action='store_true', help='Also the images in subdirectories (use it if you label with --recursive)')
+	thumbnails.add_argument('--thumbnail-size', default='160x90', help='WIDTHxHEIGHT, the same as the labeler\'s --thumbnail-size (a different size makes them all again)')
+	thumbnails.add_argument('--workers', type=int, default=os.cpu_count(), help='Threads decoding images')
+	return parser.parse_args()
+
+
+#Images and annotation files are paired up by name (minus the extension), the same way getAnnotationFileName() does it
+def getDatasetFiles(inputDirectory, labelsFilename, recursive):
+	imageFilenames = list(iterInputFilenames(inputDirectory, recursive, "name"))
+	annotationFilenames = [filename for filename in iterInputFilenames(inputDirectory, recursive, "name", extensions={".txt"}) if filename != labelsFilename]
+	return imageFilenames, annotationFilenames
+
+
+#Percent bar for the histograms
+def getBar(count, total, width=40):
+	if total == 0:
+		return ""
+	return "#" * int(round(width * count / total))
+
+
+def printHistogram(title, histogram):
+	print(title)
+	total = int(histogram.sum())
+	for i, count in enumerate(histogram.tolist()):
+		print("\t%5.3f - %5.3f  %8d  %s" % (sizeBins[i], sizeBins[i + 1], count, getBar(count, total)))
+
+
+def printValidationReport(stats, labels, imageCount, unlabeledCount, maxProblems, elapsed):
+	print("Checked " + str(stats["files"]) + " annotation files (" + str(stats["boxes"]) + " boxes) in " + str(round(elapsed, 2)) + " seconds ("
+		+ str(round(stats["files"] / max(elapsed, 1e-9))) + " files/s).")
+	print(str(imageCount) + " images, " + str(unlabeledCount) + " without an annotation file, " + str(stats["emptyFiles"]) + " annotation files with no boxes, "
+		+ "at most " + str(stats["maxBoxesPerFile"]) + " boxes in one file.")
+
+	print("\nBoxes per class:")
+	for classId, label in enumerate(labels):
+		count = int(stats["classCounts"][classId])
+		print("\t%3d %-20s %8d  %s" % (classId, label, count, getBar(count, stats["boxes"])))
+	for classId, count in sorted(stats["unknownClassCounts"].items()):
+		print("\t%3d %-20s %8d" % (classId, "(not in labels.txt)", count))
+
+	print("")
+	printHistogram("Box widths (fraction of the image width):", stats["widthHistogram"])
+	printHistogram("Box heights (fraction of the image height):", stats["heightHistogram"])
+
+	problemsByType = {}
+	for problem in stats["problems"]:
+		problemsByType.setdefault(problem["type"], []).append(problem)
+	if len(problemsByType) == 0:
+		print("\nNo problems found.")
+		return
+	print("\nProblems:")
+	for problemType, problems in sorted(problemsByType.items()):
+		print("\t" + problemType + ": " + str(len(problems)))
+		for problem in problems[:maxProblems]:
+			where = problem["file"]
+			if problem["box"] is not None:
+				where += " box " + str(problem["box"])
+			print("\t\t" + where + ":  " + problem["detail"])
+		if len(problems) > maxProblems:
+			print("\t\t... " + str(len(problems) - maxProblems) + " more")
+
+
+#Everything in stats as plain lists / dicts so it can go in a JSON file
+def getValidationJson(stats, labels, inputDirectory, imageCount, unlabeledCount):
+	return {
+		"inputDirectory": str(inputDirectory),
+		"images": imageCount,
+		"imagesWithoutAnnotations": unlabeledCount,
+		"annotationFiles": stats["files"],
+		"emptyAnnotationFiles": stats["emptyFiles"],
+		"boxes": stats["boxes"],
+		"maxBoxesPerFile": stats["maxBoxesPerFile"],
+		"classCounts": {label: int(stats["classCounts"][classId]) for classId, label in enumerate(labels)},
+		"unknownClassCounts": {str(classId): count for classId, count in stats["unknownClassCounts"].items()},
+		"sizeBins": sizeBins,
+		"widthHistogram": stats["widthHistogram"].tolist(),
+		"heightHistogram": stats["heightHistogram"].tolist(),
+		"classSizeHistograms": {label: stats["classSizeHistogram"][classId].tolist() for classId, label in enumerate(labels)},
+		"problems": stats["problems"],
+	}
+
+
+#Exit code is 1 if there were any problems, so it can be used to stop a training script from starting on a broken dataset
+def validate(args):
+	if not os.path.isdir(args.input):
+		exit("Input directory does not exist: " + str(args.input))
+	try:
+		labels = getLabels(args.input, args.labels)
+	except OSError as e:
+		exit("Could not read the labels file: " + str(e))
+
+	startTime = time.perf_counter()
+	imageFilenames, annotationFilenames = getDatasetFiles(args.input, args.labels, args.recursive)
+	imageNames = set(os.path.splitext(filename)[0] for filename in imageFilenames)
+	annotationNames = set(os.path.splitext(filename)[0] for filename in annotationFilenames)
+	unlabeledCount = len(imageNames - annotationNames)
+
+	stats = getEmptyStats(len(labels))
+	for annotationFilename in annotationFilenames:
+		if os.path.splitext(annotationFilename)[0] not in imageNames:
+			addProblem(stats["problems"], annotationFilename, None, "orphan", "no image with the same name")
+
+	chunkSize = max(1, args.chunk_size)
+	chunks = [annotationFilenames[i:i + chunkSize] for i in range(0, len(annotationFilenames), chunkSize)]
+	print("Checking " + str(len(annotationFilenames)) + " annotation files in " + str(len(chunks)) + " chunks with " + str(args.workers) + " processes.")
+	with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+		futures = [executor.submit(validateChunk, args.input, chunk, len(labels), args.min_size, args.duplicate_iou, args.tolerance) for chunk in chunks]
+		for future in futures:
+			mergeStats(stats, future.result())
+	elapsed = time.perf_counter() - startTime
+
+	printValidationReport(stats, labels, len(imageFilenames), unlabeledCount, args.max_problems, elapsed)
+	if args.json is not None:
+		with open(args.json, "w") as jsonFile:
+			json.dump(getValidationJson(stats, labels, args.input, len(imageFilenames), unlabeledCount), jsonFile, indent=1)
+		print("Wrote " + str(args.json))
+	if len(stats["problems"]) > 0:
+		sys.exit(1)
+
+
+#Groups are in the order the images are listed (natural order, so a frame is compared with the frames before it in the video)
+def dedupe(args):
+	if not os.path.isdir(args.input):
+		exit("Input directory does not exist: " + str(args.input))
+	startTime = time.perf_counter()
+	imageFilenames = list(iterInputFilenames(args.input, args.recursive, "natural"))
+	hashIndex = HashIndex(args.input, args.workers)
+	hashes = hashIndex.getHashes(imageFilenames)
+	duplicates = [(filename, keptFilename) for filename, keptFilename in findDuplicates(imageFilenames, hashes, args.threshold) if keptFilename is not None]
+	elapsed = time.perf_counter() - startTime
+
+	groups = {}
+	for filename, keptFilename in duplicates:
+		groups.setdefault(keptFilename, []).append(filename)
+	print("Hashed " + str(len(imageFilenames)) + " images in " + str(round(elapsed, 2)) + " seconds:  " + str(len(imageFilenames) - len(duplicates)) + " kept, "
+		+ str(len(duplicates)) + " near duplicates of " + str(len(groups)) + " of them (threshold " + str(args.threshold) + " bits).")
+	for keptFilename, group in sorted(groups.items(), key=lambda item: -len(item[1]))[:args.max_groups]:
+		print("\t" + keptFilename + ":  " + str(len(group)) + " duplicates (" + group[0] + (" ... " + group[-1] if len(group) > 1 else "") + ")")
+	if len(groups) > args.max_groups:
+		print("\t... " + str(len(groups) - args.max_groups) + " more groups")
+
+	if args.json is not None:
+		with open(args.json, "w") as jsonFile:
+			json.dump({"inputDirectory": str(args.input), "threshold": args.threshold, "images": len(imageFilenames), "duplicates": dict(duplicates)}, jsonFile, indent=1)
+		print("Wrote " + str(args.json))
+
+	if args.move_to is not None:
+		moved, labeled = [], 0
+		for filename, keptFilename in duplicates:
+			if os.path.exists(getAnnotationFileName(args.input, filename)):
+				labeled += 1	#somebody already spent time on it, leave it where it is
+				continue
+			destination = os.path.join(args.move_to, filename)
+			os.makedirs(os.path.dirname(destination), exist_ok=True)
+			shutil.move(os.path.join(args.input, filename), destination)
+			moved.append(filename)
+		hashIndex.forget(moved)
+		print("Moved " + str(len(moved)) + " duplicates to " + str(args.move_to) + " (" + str(labeled) + " left in place because they have an annotation file).")
+	hashIndex.close()
+
+
+#Only rewrites the shards that changed since the last export to the same directory (see datasetexport.py)
+def export(args):
+	if not os.path.isdir(args.input):
+		exit("Input directory does not exist: " + str(args.input))
+	try:
+		labels = getLabels(args.input, args.labels)
+	except OSError as e:
+		exit("Could not read the labels file: " + str(e))
+
+	startTime = time.perf_counter()
+	imageFilenames = list(iterInputFilenames(args.input, args.recursive, "natural"))
+	if not args.include_unlabeled:
+		imageFilenames = [filename for filename in imageFilenames if os.path.exists(getAnnotationFileName(args.input, filename))]
+	print("Exporting " + str(len(imageFilenames)) + " images to " + str(args.output) + " with " + str(args.workers) + " processes.")
+	counts = exportDataset(args.input, imageFilenames, labels, args.output, args.shard_size, args.workers, args.format in ('tar', 'both'), args.format in ('coco', 'both'))
+	elapsed = time.perf_counter() - startTime
+
+	if args.format in ('tar', 'both'):
+		print(str(counts["shards"]) + " shards:  " + str(counts["shardsWritten"]) + " written, " + str(counts["shardsUnchanged"]) + " unchanged since the last export.")
+	if args.format in ('coco', 'both'):
+		print(str(counts["annotations"]) + " boxes in annotations.json.")
+		if counts["unknownClassBoxes"] > 0:
+			print(str(counts["unknownClassBoxes"]) + " boxes left out of annotations.json because their class number isn't in " + str(args.labels))
+	for problem in counts["problems"]:
+		print("Skipped " + problem)
+	print("Took " + str(round(elapsed, 2)) + " seconds.")
+	if len(counts["problems"]) > 0:
+		sys.exit(1)
+
+
+#"0.8,0.1,0.1" -> {"train": 0.8, "val": 0.1, "test": 0.1}
+def getSplitFractions(splitString):
+	try:
+		values = [float(value) for value in splitString.split(",")]
+	except ValueError:
+		values = []
+	if len(values) not in (2, 3) or min(values) < 0 or values[0] <= 0:
+		exit("--split should be train,val or train,val,test fractions, like 0.8,0.1,0.1 - got: " + str(splitString))
+	values = values + [0.0] * (3 - len(values))
+	return {splitName: value / sum(values) for splitName, value in zip(splitNames, values)}
+
+
+def package(args):
+	if not os.path.isdir(args.input):
+		exit("Input directory does not exist: " + str(args.input))
+	try:
+		labels = getLabels(args.input, args.labels)
+	except OSError as e:
+		exit("Could not read the labels file: " + str(e))
+	fractions = getSplitFractions(args.split)
+
+	startTime = time.perf_counter()
+	imageFilenames = [filename for filename in iterInputFilenames(args.input, args.recursive, "natural") if os.path.exists(getAnnotationFileName(args.input, filename))]
+	if len(imageFilenames) == 0:
+		exit("No labeled images in " + str(args.input))
+	try:
+		splitStats, done = packageDataset(args.input, imageFilenames, labels, args.output, fractions, args.link, args.group_by, args.chunk_frames, args.seed, args.reshuffle)
+	except OSError as e:
+		exit("Could not package: " + str(e))
+
+	print("Packaged " + str(len(imageFilenames)) + " labeled images into " + str(args.output) + " in " + str(round(time.perf_counter() - startTime, 2)) + " seconds:  "
+		+ str(done["linked"]) + " files linked, " + str(done["unchanged"]) + " already there, " + str(done["removed"]) + " removed.")
+	print("\t%-20s" % "" + "".join("%12s" % splitName for splitName in splitNames))
+	for title, getValue in [("groups", lambda stats: stats["groups"]), ("images", lambda stats: stats["images"])] + \
+			[(label, lambda stats, classId=classId: int(stats["boxes"][classId])) for classId, label in enumerate(labels)]:
+		print("\t%-20s" % title + "".join("%12d" % getValue(splitStats[splitName]) for splitName in splitNames))
+	for splitName in splitNames:
+		if fractions[splitName] > 0 and splitStats[splitName]["images"] == 0:
+			print("WARNING:  nothing went to " + splitName + " - there aren't enough groups to go around (try a smaller --chunk-frames, or --group-by chunk instead of video).")
+	for problem in done["problems"]:
+		print("Skipped " + problem)
+	print("Wrote " + os.path.join(args.output, "data.yaml"))
+
+
+def thumbnails(args):
+	if not os.path.isdir(args.input):
+		exit("Input directory does not exist: " + str(args.input))
+	try:
+		tileWidth, tileHeight = [int(value) for value in args.thumbnail_size.lower().split("x")]
+	except ValueError:
+		exit("--thumbnail-size should look like 160x90, got: " + str(args.thumbnail_size))
+
+	startTime = time.perf_counter()
+	imageFilenames = list(iterInputFilenames(args.input, args.recursive, "natural"))
+	cache = ThumbnailCache(args.input, tileWidth, tileHeight, workers=args.workers)
+	cache.buildAll(imageFilenames)
+	while not cache.isIdle():
+		time.sleep(0.5)
+	cache.close()
+	print("Thumbnails for " + str(len(imageFilenames)) + " images are up to date, took " + str(round(time.perf_counter() - startTime, 2)) + " seconds.")
+
+
+def main():
+	args = getArguments()
+	if args.command == 'validate':
+		validate(args)
+	elif args.command == 'dedupe':
+		dedupe(args)
+	elif args.command == 'export':
+		export(args)
+	elif args.command == 'package':
+		package(args)
+	elif args.command == 'thumbnails':
+		thumbnails(args)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,157 @@
+import os
+import numpy as np  #comes with opencv-python
+from boxarray import parseAnnotationLines
+
+
+#Checks YOLO annotation files without opening anything in the GUI, and adds up what's in them (boxes per class, box sizes).
+#Nothing in here needs pygame.  validateChunk() is what runs in each worker process of "python datasettool.py validate" - it gets a list of
+#annotation files and gives back stats that mergeStats() adds together, so the work splits evenly across however many cores there are.
+#
+#The problems it looks for (the "type" of each problem):
+#	malformed       a line isn't 5 numbers with a whole number class first (one problem per bad line, the file's boxes aren't checked)
+#	unreadable      the file can't be opened
+#	outOfRange      a value is outside 0 - 1, or the box sticks out past the edge of the image
+#	degenerate      the box has no width / height (or less than --min-size), or isn't a number
+#	unknownClass    the class number isn't a line in labels.txt
+#	duplicate       two boxes of the same class overlap by at least --duplicate-iou (usually the same box clicked twice)
+#	orphan          there's no image with the same name as the annotation file
+
+
+#Box sizes for the histograms, as a fraction of the image width / height
+sizeBins = [0.0, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+
+#Images with more boxes than this only get checked for exact duplicates - the overlap check compares every pair of boxes
+maxPairwiseBoxes = 2048
+
+
+def getEmptyStats(classCount):
+	binCount = len(sizeBins) - 1
+	return {
+		"files": 0,
+		"boxes": 0,
+		"emptyFiles": 0,
+		"maxBoxesPerFile": 0,
+		"classCounts": np.zeros(classCount, dtype=np.int64),
+		"unknownClassCounts": {},	#class number -> count, for the ones that aren't in labels.txt
+		"widthHistogram": np.zeros(binCount, dtype=np.int64),
+		"heightHistogram": np.zeros(binCount, dtype=np.int64),
+		"classSizeHistogram": np.zeros((classCount, binCount), dtype=np.int64),	#per class, by sqrt(width * height)
+		"problems": [],
+	}
+
+
+def mergeStats(total, stats):
+	for key in ["files", "boxes", "emptyFiles"]:
+		total[key] += stats[key]
+	total["maxBoxesPerFile"] = max(total["maxBoxesPerFile"], stats["maxBoxesPerFile"])
+	for key in ["classCounts", "widthHistogram", "heightHistogram", "classSizeHistogram"]:
+		total[key] += stats[key]
+	for classId, count in stats["unknownClassCounts"].items():
+		total["unknownClassCounts"][classId] = total["unknownClassCounts"].get(classId, 0) + count
+	total["problems"].extend(stats["problems"])
+	return total
+
+
+#Which bin of sizeBins each value falls in (anything over 1 goes in the last bin, anything under 0 in the first)
+def getSizeBinIndexes(values):
+	return np.clip(np.digitize(values, sizeBins[1:-1]), 0, len(sizeBins) - 2)
+
+
+#(N, 4) centerX, centerY, width, height -> (N, N) intersection over union of every pair of boxes
+def getPairwiseIou(normalized):
+	boxX1 = normalized[:, 0] - normalized[:, 2] / 2
+	boxY1 = normalized[:, 1] - normalized[:, 3] / 2
+	boxX2 = normalized[:, 0] + normalized[:, 2] / 2
+	boxY2 = normalized[:, 1] + normalized[:, 3] / 2
+	intersectionWidth = np.clip(np.minimum(boxX2[:, None], boxX2[None, :]) - np.maximum(boxX1[:, None], boxX1[None, :]), 0, None)
+	intersectionHeight = np.clip(np.minimum(boxY2[:, None], boxY2[None, :]) - np.maximum(boxY1[:, None], boxY1[None, :]), 0, None)
+	intersection = intersectionWidth * intersectionHeight
+	area = normalized[:, 2] * normalized[:, 3]
+	union = area[:, None] + area[None, :] - intersection
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return np.where(union > 0, intersection / union, 0)
+
+
+#Row numbers of the boxes that duplicate an earlier box in the same file, and the row they duplicate
+def findDuplicates(classIds, normalized, duplicateIou):
+	if len(classIds) < 2:
+		return []
+	if len(classIds) > maxPairwiseBoxes:
+		rows = np.column_stack((classIds.astype(np.float64), np.round(normalized.astype(np.float64), 6)))
+		unique, firstRows, inverse = np.unique(rows, axis=0, return_index=True, return_inverse=True)
+		inverse = inverse.reshape(-1)
+		return [(row, int(firstRows[inverse[row]])) for row in range(len(classIds)) if firstRows[inverse[row]] != row]
+	sameClass = classIds[:, None] == classIds[None, :]
+	overlapping = np.triu(sameClass & (getPairwiseIou(normalized) >= duplicateIou), k=1)
+	duplicateRows = np.nonzero(overlapping.any(axis=0))[0]
+	return [(int(row), int(np.argmax(overlapping[:, row]))) for row in duplicateRows]
+
+
+def addProblem(problems, annotationFilename, box, problemType, detail):
+	problems.append({"file": annotationFilename, "box": box, "type": problemType, "detail": detail})
+
+
+#Checks one parsed annotation file.  box numbers in the problems start at 1 and count boxes (lines that aren't blank), not raw lines.
+def checkBoxes(annotationFilename, classIds, normalized, classCount, minSize, duplicateIou, tolerance, problems):
+	boxX1 = normalized[:, 0] - normalized[:, 2] / 2
+	boxY1 = normalized[:, 1] - normalized[:, 3] / 2
+	boxX2 = normalized[:, 0] + normalized[:, 2] / 2
+	boxY2 = normalized[:, 1] + normalized[:, 3] / 2
+	finite = np.isfinite(normalized).all(axis=1)
+	degenerate = ~finite | (normalized[:, 2] <= minSize) | (normalized[:, 3] <= minSize)
+	outOfRange = finite & (((normalized < -tolerance) | (normalized > 1 + tolerance)).any(axis=1)
+		| (boxX1 < -tolerance) | (boxY1 < -tolerance) | (boxX2 > 1 + tolerance) | (boxY2 > 1 + tolerance))
+	unknownClass = (classIds < 0) | (classIds >= classCount)
+
+	#Only look up the (few) bad rows one at a time
+	for row in np.nonzero(degenerate)[0].tolist():
+		addProblem(problems, annotationFilename, row + 1, "degenerate", "width " + str(normalized[row, 2]) + ", height " + str(normalized[row, 3]))
+	for row in np.nonzero(outOfRange)[0].tolist():
+		addProblem(problems, annotationFilename, row + 1, "outOfRange", "x1 %.4f y1 %.4f x2 %.4f y2 %.4f" % (boxX1[row], boxY1[row], boxX2[row], boxY2[row]))
+	for row in np.nonzero(unknownClass)[0].tolist():
+		addProblem(problems, annotationFilename, row + 1, "unknownClass", "class " + str(int(classIds[row])) + " but labels.txt has " + str(classCount) + " labels")
+	for row, firstRow in findDuplicates(classIds, normalized, duplicateIou):
+		addProblem(problems, annotationFilename, row + 1, "duplicate", "same class as box " + str(firstRow + 1) + " and overlaps it")
+
+
+#Adds one file's boxes to the class counts and size histograms
+def addBoxStats(stats, classIds, normalized, classCount):
+	stats["boxes"] += len(classIds)
+	stats["maxBoxesPerFile"] = max(stats["maxBoxesPerFile"], len(classIds))
+	if len(classIds) == 0:
+		stats["emptyFiles"] += 1
+		return
+	known = (classIds >= 0) & (classIds < classCount)
+	stats["classCounts"] += np.bincount(classIds[known], minlength=classCount)[:classCount]
+	for classId in classIds[~known].tolist():
+		stats["unknownClassCounts"][classId] = stats["unknownClassCounts"].get(classId, 0) + 1
+
+	finite = np.isfinite(normalized).all(axis=1)
+	widths = normalized[finite, 2]
+	heights = normalized[finite, 3]
+	stats["widthHistogram"] += np.bincount(getSizeBinIndexes(widths), minlength=len(sizeBins) - 1)
+	stats["heightHistogram"] += np.bincount(getSizeBinIndexes(heights), minlength=len(sizeBins) - 1)
+	known = known & finite
+	sizes = np.sqrt(np.clip(normalized[known, 2] * normalized[known, 3], 0, None))
+	np.add.at(stats["classSizeHistogram"], (classIds[known], getSizeBinIndexes(sizes)), 1)
+
+
+#Runs in a worker process
+def validateChunk(inputDirectory, annotationFilenames, classCount, minSize, duplicateIou, tolerance):
+	stats = getEmptyStats(classCount)
+	for annotationFilename in annotationFilenames:
+		stats["files"] += 1
+		try:
+			with open(os.path.join(inputDirectory, annotationFilename), "r") as annotationFile:
+				text = annotationFile.read()
+		except (OSError, UnicodeDecodeError) as e:
+			addProblem(stats["problems"], annotationFilename, None, "unreadable", str(e))
+			continue
+		classIds, normalized, badLines = parseAnnotationLines(text)
+		for lineNumber, problem in badLines:
+			addProblem(stats["problems"], annotationFilename, None, "malformed", "line " + str(lineNumber) + ": " + problem)
+		if len(badLines) > 0:
+			continue	#the box numbers wouldn't match the lines
+		checkBoxes(annotationFilename, classIds, normalized, classCount, minSize, duplicateIou, tolerance, stats["problems"])
+		addBoxStats(stats, classIds, normalized, classCount)
+	return stats
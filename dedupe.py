@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np  #comes with opencv-python
+import cv2  #pip install opencv-python
+
+
+log = logging.getLogger(__name__)
+
+
+#Fixed stride extraction from sky footage gives long runs of frames that are all the same empty sky.  Each one is disk space, a decode in the
+#labeler and a press of 's', for nothing.  This finds them with a perceptual hash (dHash):  the image shrunk to 9x8 grayscale, one bit per pixel for
+#"brighter than the pixel to its left" - 64 bits that barely change with jpeg noise or small exposure drift, so near-identical frames have hashes
+#only a few bits apart (the Hamming distance).
+#
+#A frame is a duplicate of the first frame before it (in the order given) whose hash is within the threshold - so a long run of the same sky keeps
+#its first frame, and a slowly changing one keeps a frame every time it has drifted past the threshold.  Those "kept" hashes go in a BK-tree,
+#so looking one up doesn't compare against every frame so far.
+#
+#The hashes are kept in a small SQLite file in the directory (.pygamelabeler-hashes.sqlite) by filename + mtime + size, so only new / changed
+#images are ever decoded again.  No pygame in here, the batch tools use it too.
+
+
+hashIndexFilename = ".pygamelabeler-hashes.sqlite"
+
+
+#(N, 8, 9) grayscale images -> N 64 bit hashes, all in one go
+def getDHashes(smallImages):
+	bits = smallImages[:, :, 1:] > smallImages[:, :, :-1]	#(N, 8, 8)
+	packed = np.packbits(bits.reshape(len(smallImages), 64), axis=1)	#(N, 8) bytes, first bit is the top bit
+	return [int(hashValue) for hashValue in packed.view(">u8").reshape(-1)]
+
+
+#Any image (BGR or grayscale numpy) -> the 9x8 grayscale the hash is worked out from.  INTER_AREA averages, so noise mostly cancels out.
+def getSmallImage(image):
+	if image.ndim == 3:
+		image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+	return cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+
+
+def getFrameHash(image):
+	return getDHashes(getSmallImage(image)[None])[0]
+
+
+#The 9x8 image straight from the file, or None if it can't be read.  IMREAD_REDUCED_GRAYSCALE_8 has the jpeg decoder only do 1/8 of the work
+#(it skips most of the inverse DCT) - the hash is made from 72 pixels, so the detail it throws away doesn't matter.
+def readSmallImage(imageFullpath):
+	image = cv2.imread(imageFullpath, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+	if image is None:
+		return None
+	return getSmallImage(image)
+
+
+def getHammingDistance(hash1, hash2):
+	return bin(hash1 ^ hash2).count("1")
+
+
+#SQLite integers are signed 64 bit
+def toSigned(hashValue):
+	if hashValue >= 1 << 63:
+		return hashValue - (1 << 64)
+	return hashValue
+
+
+def toUnsigned(hashValue):
+	if hashValue < 0:
+		return hashValue + (1 << 64)
+	return hashValue
+
+
+#Burkhard-Keller tree:  every child of a node is filed under its distance to that node, and the triangle inequality means a search for everything
+#within maxDistance of a hash only has to go down the children filed between (distance - maxDistance) and (distance + maxDistance).
+class BKTree:
+	def __init__(self):
+		self.root = None	#[hash, item, {distance: child node}]
+		self.size = 0
+
+
+	def add(self, hashValue, item):
+		self.size += 1
+		if self.root is None:
+			self.root = [hashValue, item, {}]
+			return
+		node = self.root
+		while True:
+			distance = getHammingDistance(hashValue, node[0])
+			child = node[2].get(distance)
+			if child is None:
+				node[2][distance] = [hashValue, item, {}]
+				return
+			node = child
+
+
+	#[(distance, item)] for everything within maxDistance, closest first
+	def search(self, hashValue, maxDistance):
+		matches = []
+		nodes = [] if self.root is None else [self.root]
+		while nodes:
+			node = nodes.pop()
+			distance = getHammingDistance(hashValue, node[0])
+			if distance <= maxDistance:
+				matches.append((distance, node[1]))
+			for childDistance, child in node[2].items():
+				if distance - maxDistance <= childDistance <= distance + maxDistance:
+					nodes.append(child)
+		matches.sort(key=lambda match: match[0])
+		return matches
+
+
+	def __len__(self):
+		return self.size
+
+
+#Decides, one image at a time in order, whether it's a duplicate of one that was kept before it
+class DuplicateGrouper:
+	def __init__(self, threshold):
+		self.threshold = threshold
+		self.kept = BKTree()
+
+
+	#Returns the kept image this is a duplicate of, or None (then it's kept itself).  hashValue None (unreadable image) is always kept.
+	def check(self, item, hashValue):
+		if hashValue is None:
+			return None
+		matches = self.kept.search(hashValue, self.threshold)
+		if len(matches) > 0:
+			return matches[0][1]
+		self.kept.add(hashValue, item)
+		return None
+
+
+#filename -> hash for one directory, only hashing the images that are new or changed since last time
+class HashIndex:
+	def __init__(self, inputDirectory, workers=8):
+		self.inputDirectory = inputDirectory
+		self.workers = workers
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(os.path.join(inputDirectory, hashIndexFilename), check_same_thread=False)
+		with self.lock, self.connection:
+			self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (filename TEXT PRIMARY KEY, mtime REAL, size INTEGER, hash INTEGER)")
+
+
+	#Hashes for filenames, in the same order (None for anything that can't be read)
+	def getHashes(self, filenames):
+		with self.lock:
+			known = {}
+			for start in range(0, len(filenames), 500):	#SQLite's limit on ? parameters
+				batch = filenames[start:start + 500]
+				query = "SELECT filename, mtime, size, hash FROM hashes WHERE filename IN (" + ",".join("?" * len(batch)) + ")"
+				for filename, mtime, size, hashValue in self.connection.execute(query, batch):
+					known[filename] = (mtime, size, hashValue)
+
+		hashes = [None] * len(filenames)
+		changed = []	#(position, filename, stat)
+		for position, filename in enumerate(filenames):
+			try:
+				imageStat = os.stat(os.path.join(self.inputDirectory, filename))
+			except OSError:
+				continue
+			row = known.get(filename)
+			if row is not None and row[0] == imageStat.st_mtime and row[1] == imageStat.st_size:
+				hashes[position] = toUnsigned(row[2])
+			else:
+				changed.append((position, filename, imageStat))
+		if len(changed) == 0:
+			return hashes
+
+		#cv2.imread() lets go of the GIL while it decodes, so threads are enough
+		with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+			smallImages = list(executor.map(lambda change: readSmallImage(os.path.join(self.inputDirectory, change[1])), changed))
+		readable = [i for i, smallImage in enumerate(smallImages) if smallImage is not None]
+		rows = []
+		if len(readable) > 0:
+			newHashes = getDHashes(np.stack([smallImages[i] for i in readable]))
+			for i, hashValue in zip(readable, newHashes):
+				position, filename, imageStat = changed[i]
+				hashes[position] = hashValue
+				rows.append((filename, imageStat.st_mtime, imageStat.st_size, toSigned(hashValue)))
+		for i, smallImage in enumerate(smallImages):
+			if smallImage is None:
+				log.warning("Could not read " + str(changed[i][1]) + " to hash it")
+		with self.lock, self.connection:
+			self.connection.executemany("INSERT OR REPLACE INTO hashes (filename, mtime, size, hash) VALUES (?, ?, ?, ?)", rows)
+		return hashes
+
+
+	#For images that have been moved / deleted
+	def forget(self, filenames):
+		with self.lock, self.connection:
+			self.connection.executemany("DELETE FROM hashes WHERE filename = ?", [(filename,) for filename in filenames])
+
+
+	def close(self):
+		with self.lock:
+			self.connection.close()
+
+
+#[(filename, the kept filename it duplicates or None)] for filenames in order
+def findDuplicates(filenames, hashes, threshold):
+	grouper = DuplicateGrouper(threshold)
+	return [(filename, grouper.check(filename, hashValue)) for filename, hashValue in zip(filenames, hashes)]
+
+
+#Lists of filenames, starting small and doubling up to batchSize - so the first few come through without waiting on a whole batch
+def iterBatches(filenames, batchSize, firstBatchSize=8):
+	batch = []
+	wanted = min(firstBatchSize, batchSize)
+	for filename in filenames:
+		batch.append(filename)
+		if len(batch) >= wanted:
+			yield batch
+			batch = []
+			wanted = min(wanted * 2, batchSize)
+	if len(batch) > 0:
+		yield batch
+
+
+#Passes filenames (a list or a generator, like iterInputFilenames()) through, leaving out the duplicates.  Hashes a batch at a time, so it can
+#sit behind the labeler's background listing and the first image still shows up right away.
+def iterUniqueFilenames(inputDirectory, filenames, threshold, batchSize=256, workers=8):
+	hashIndex = HashIndex(inputDirectory, workers)
+	grouper = DuplicateGrouper(threshold)
+	hidden = 0
+	try:
+		for batch in iterBatches(filenames, batchSize):
+			for filename, hashValue in zip(batch, hashIndex.getHashes(batch)):
+				if grouper.check(filename, hashValue) is None:
+					yield filename
+				else:
+					hidden += 1
+	finally:
+		hashIndex.close()
+	print("Hid " + str(hidden) + " near duplicate images (" + str(len(grouper.kept)) + " kept).")
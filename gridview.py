@@ -0,0 +1,152 @@
+import pygame
+
+
+#'g':  the images as a grid of thumbnails (from the ThumbnailCache, see thumbnailcache.py) instead of one at a time, to find the ones worth
+#labeling without pressing 's' through thousands of frames.  Each tile has a badge with how many boxes its annotation file has (none = not labeled
+#yet, a gray 0 = looked at, nothing in it).  Click a tile to label that image, the mouse wheel / Page Up / Page Down / Home / End scroll,
+#'g' or Escape goes back to the image you were on.
+#Only the tiles on screen are drawn, and only when something changed (scrolling, or more tiles were made).  The box counts come from the
+#ThumbnailCache's threads (countBoxes=True) - a tile without a count yet has no badge until they get to it.
+class GridView:
+	def __init__(self, window, filenamesList, thumbnailCache, currentPosition, myfont, gap=4, badgeColor=(255, 220, 0), currentColor=(255, 0, 0)):
+		self.window = window
+		self.filenamesList = filenamesList
+		self.thumbnailCache = thumbnailCache
+		self.currentPosition = currentPosition
+		self.myfont = myfont
+		self.gap = gap
+		self.badgeColor = badgeColor
+		self.currentColor = currentColor
+		windowWidth, windowHeight = window.get_size()
+		self.cellWidth = thumbnailCache.tileWidth + gap
+		self.cellHeight = thumbnailCache.tileHeight + gap
+		self.columns = max(1, (windowWidth - gap) // self.cellWidth)
+		self.visibleRows = max(1, (windowHeight - gap) // self.cellHeight)
+		self.firstRow = 0
+		self.scrollTo(currentPosition // self.columns - self.visibleRows // 2)
+		self.tileSurfaces = {}	#filename -> converted surface, for the tiles that have been on screen
+		self.boxCounts = thumbnailCache.getBoxCounts()	#filename -> box count, or None with no annotation file.  Not there = not counted yet.
+		self.badges = {}		#box count -> rendered badge
+		self.wantsClose = False
+		self.needsRedraw = True
+
+
+	def getRowCount(self):
+		return (len(self.filenamesList) + self.columns - 1) // self.columns
+
+
+	def scrollTo(self, firstRow):
+		firstRow = max(0, min(firstRow, self.getRowCount() - self.visibleRows))
+		if firstRow != self.firstRow:
+			self.firstRow = firstRow
+			self.needsRedraw = True
+
+
+	def getVisiblePositions(self):
+		return range(self.firstRow * self.columns, min(len(self.filenamesList), (self.firstRow + self.visibleRows) * self.columns))
+
+
+	#Position in the filenames list of the tile at a window position, or None
+	def getPositionAt(self, x, y):
+		column, row = (x - self.gap) // self.cellWidth, (y - self.gap) // self.cellHeight
+		if column < 0 or column >= self.columns or row < 0 or row >= self.visibleRows:
+			return None
+		position = (self.firstRow + row) * self.columns + column
+		if position >= len(self.filenamesList):
+			return None
+		return position
+
+
+	#Returns the position of the image to open, or None.  Sets wantsClose for 'g' / Escape.
+	def handleEvent(self, event):
+		if event.type == pygame.MOUSEBUTTONDOWN:
+			if event.button == 1:
+				return self.getPositionAt(*event.pos)
+			if event.button == 4:
+				self.scrollTo(self.firstRow - 3)
+			if event.button == 5:
+				self.scrollTo(self.firstRow + 3)
+		if event.type == pygame.MOUSEMOTION:
+			position = self.getPositionAt(*event.pos)
+			if position is not None:
+				filename = self.filenamesList[position]
+				status = ""
+				if filename in self.boxCounts:
+					boxCount = self.boxCounts[filename]
+					status = "  (not labeled)" if boxCount is None else "  (" + str(boxCount) + " boxes)"
+				pygame.display.set_caption("Overview:  " + filename + status)
+		if event.type == pygame.KEYDOWN:
+			if event.key in (pygame.K_g, pygame.K_ESCAPE):
+				self.wantsClose = True
+			if event.key == pygame.K_PAGEUP:
+				self.scrollTo(self.firstRow - self.visibleRows)
+			if event.key == pygame.K_PAGEDOWN:
+				self.scrollTo(self.firstRow + self.visibleRows)
+			if event.key == pygame.K_HOME:
+				self.scrollTo(0)
+			if event.key == pygame.K_END:
+				self.scrollTo(self.getRowCount())
+		return None
+
+
+	#The cache finished some tiles / box counts (called with what its onReady got)
+	def tilesReady(self, filenames, boxCounts):
+		visible = set(self.filenamesList[position] for position in self.getVisiblePositions())
+		for filename in filenames:
+			self.tileSurfaces.pop(filename, None)	#made again because the image changed
+			if filename in visible:
+				self.needsRedraw = True
+		self.boxCounts.update(boxCounts)
+		if not visible.isdisjoint(boxCounts):
+			self.needsRedraw = True
+
+
+	def getTileSurface(self, filename):
+		surface = self.tileSurfaces.get(filename)
+		if surface is None:
+			tile = self.thumbnailCache.getTile(filename)
+			if tile is None:
+				return None
+			if len(self.tileSurfaces) > 4096:
+				self.tileSurfaces.clear()	#scrolled through a lot of them - the cache has them all anyway
+			surface = self.tileSurfaces[filename] = pygame.image.frombuffer(tile.tobytes(), (tile.shape[1], tile.shape[0]), "RGB").convert()
+		return surface
+
+
+	def getBadge(self, boxCount):
+		badge = self.badges.get(boxCount)
+		if badge is None:
+			color, textColor = (self.badgeColor, (0, 0, 0)) if boxCount > 0 else ((90, 90, 90), (255, 255, 255))
+			text = self.myfont.render(str(boxCount), True, textColor)
+			badge = self.badges[boxCount] = pygame.Surface((text.get_width() + 6, text.get_height() + 2))
+			badge.fill(color)
+			badge.blit(text, (3, 1))
+		return badge
+
+
+	def render(self):
+		if not self.needsRedraw:
+			return
+		self.needsRedraw = False
+		self.window.fill((30, 30, 30))
+		visibleFilenames = []
+		for position in self.getVisiblePositions():
+			filename = self.filenamesList[position]
+			visibleFilenames.append(filename)
+			row, column = divmod(position - self.firstRow * self.columns, self.columns)
+			x, y = self.gap + column * self.cellWidth, self.gap + row * self.cellHeight
+			surface = self.getTileSurface(filename)
+			if surface is None:
+				pygame.draw.rect(self.window, (60, 60, 60), (x, y, self.thumbnailCache.tileWidth, self.thumbnailCache.tileHeight))
+			else:
+				self.window.blit(surface, (x, y))
+			boxCount = self.boxCounts.get(filename)
+			if boxCount is not None:
+				badge = self.getBadge(boxCount)
+				self.window.blit(badge, (x + self.thumbnailCache.tileWidth - badge.get_width(), y))
+			if position == self.currentPosition:
+				pygame.draw.rect(self.window, self.currentColor, (x - 2, y - 2, self.thumbnailCache.tileWidth + 4, self.thumbnailCache.tileHeight + 4), 2)
+		pygame.display.flip()
+		#The ones on screen first (missing or maybe out of date), then the next screenful so scrolling down finds them ready
+		nextPositions = range(self.getVisiblePositions().stop, min(len(self.filenamesList), self.getVisiblePositions().stop + self.visibleRows * self.columns))
+		self.thumbnailCache.request(visibleFilenames + [self.filenamesList[position] for position in nextPositions])
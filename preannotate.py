@@ -0,0 +1,231 @@
+import os
+import sys
+import hashlib
+import importlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np  #comes with opencv-python
+import cv2  #pip install opencv-python
+from annotationstore import writeFileAtomically
+
+
+log = logging.getLogger(__name__)
+
+
+#Suggested boxes ("proposals") from a detector model, drawn in blue in the labeler - put the mouse in one and press 'a' to turn it into a real box.
+#The model runs in a pool of background processes on the images the prefetcher is loading, so it's usually done before you get to the image,
+#and the labeler never waits on it (if it isn't done yet the proposals just show up when they are).
+#Proposals are cached on disk keyed by a hash of the image contents + the model version, so going back to an image (or opening the directory again
+#next week with the same model) doesn't run the model again.
+#
+#A detector is either:
+#	- a model file OpenCV's dnn module can read (.onnx), treated as a YOLO export:  OnnxYoloDetector below, CPU only
+#	- "some.module:SomeClass" for anything else.  The class gets the DetectorOptions in its constructor and needs:
+#		version              a string that changes whenever the model / its settings change (it's part of the cache key)
+#		detect(imageBGR)     -> (classIds (N,) ints, scores (N,) floats, normalized (N, 4) centerX centerY width height, 0 to 1)
+
+
+class DetectorOptions:
+	def __init__(self, inputSize=640, scoreThreshold=0.25, nmsThreshold=0.45, outputFormat="yolov8"):
+		self.inputSize = inputSize
+		self.scoreThreshold = scoreThreshold
+		self.nmsThreshold = nmsThreshold
+		self.outputFormat = outputFormat	#"yolov8" (no objectness, (1, 4 + classes, N)) or "yolov5" ((1, N, 5 + classes))
+
+
+	def getVersion(self):
+		return "%d-%g-%g-%s" % (self.inputSize, self.scoreThreshold, self.nmsThreshold, self.outputFormat)
+
+
+#YOLO exported to ONNX, run with cv2.dnn on the CPU.  The image is stretched to inputSize x inputSize (no letterboxing), so the model's output
+#coordinates divided by inputSize are already normalized to the original image.
+class OnnxYoloDetector:
+	def __init__(self, modelFullpath, options):
+		self.options = options
+		self.net = cv2.dnn.readNet(modelFullpath)
+		self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+		self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+		self.version = getFileHash(modelFullpath) + "-" + options.getVersion()
+
+
+	def detect(self, imageBGR):
+		inputSize = self.options.inputSize
+		blob = cv2.dnn.blobFromImage(imageBGR, 1 / 255.0, (inputSize, inputSize), swapRB=True, crop=False)
+		self.net.setInput(blob)
+		output = self.net.forward()[0]
+		if self.options.outputFormat == "yolov8":
+			output = output.T	#(4 + classes, N) -> (N, 4 + classes)
+			classScores = output[:, 4:]
+		else:
+			classScores = output[:, 5:] * output[:, 4:5]	#class probability times objectness
+		classIds = np.argmax(classScores, axis=1)
+		scores = classScores[np.arange(len(classIds)), classIds]
+		keep = scores >= self.options.scoreThreshold
+		classIds, scores, normalized = classIds[keep], scores[keep], output[keep, 0:4] / inputSize
+		if len(classIds) == 0:
+			return getEmptyProposals()
+
+		#Non maximum suppression per class (NMSBoxes wants x, y, width, height)
+		rects = np.column_stack((normalized[:, 0:2] - normalized[:, 2:4] / 2, normalized[:, 2:4]))
+		indexes = np.array(cv2.dnn.NMSBoxesBatched(rects.tolist(), scores.tolist(), classIds.tolist(), self.options.scoreThreshold, self.options.nmsThreshold), dtype=np.int64).reshape(-1)
+		return classIds[indexes].astype(np.int32), scores[indexes].astype(np.float32), np.clip(normalized[indexes], 0, 1).astype(np.float32)
+
+
+def getEmptyProposals():
+	return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32), np.zeros((0, 4), dtype=np.float32)
+
+
+def getFileHash(fileFullpath):
+	fileHash = hashlib.blake2b(digest_size=16)
+	with open(fileFullpath, "rb") as hashedFile:
+		for chunk in iter(lambda: hashedFile.read(1024 * 1024), b""):
+			fileHash.update(chunk)
+	return fileHash.hexdigest()
+
+
+#"model.onnx" or "some.module:SomeClass"
+def createDetector(detectorSpec, options):
+	if os.path.isfile(detectorSpec):
+		return OnnxYoloDetector(detectorSpec, options)
+	moduleName, separator, className = detectorSpec.partition(":")
+	if separator == "":
+		raise ValueError("--detector should be a model file or module:Class, got: " + str(detectorSpec))
+	sys.path.insert(0, os.getcwd())	#so a plugin next to your images can be found
+	return getattr(importlib.import_module(moduleName), className)(options)
+
+
+#Each worker process loads the model once and keeps it
+workerDetector = None
+
+
+#logLevel:  the labeler's (--log-level) - a spawned process starts with logging not set up
+def initWorker(detectorSpec, options, threadsPerWorker, logLevel):
+	global workerDetector
+	logging.basicConfig(format="%(message)s", level=logLevel)
+	cv2.setNumThreads(threadsPerWorker)
+	workerDetector = createDetector(detectorSpec, options)
+
+
+def getCacheFullpath(cacheDirectory, modelVersion, contentHash):
+	return os.path.join(cacheDirectory, modelVersion, contentHash[:2], contentHash + ".txt")
+
+
+#Same as a YOLO annotation file with the score on the end of each line
+def readProposalFile(proposalFileFullpath):
+	with open(proposalFileFullpath, "r") as proposalFile:
+		values = np.array(proposalFile.read().split(), dtype=np.float64)
+	if len(values) % 6 != 0:
+		raise ValueError("proposal lines need 6 values each")
+	values = values.reshape(-1, 6)
+	return values[:, 0].astype(np.int32), values[:, 5].astype(np.float32), values[:, 1:5].astype(np.float32)
+
+
+def formatProposals(classIds, scores, normalized):
+	return "".join("%d %.6f %.6f %.6f %.6f %.4f\n" % (classId, centerX, centerY, width, height, score)
+		for classId, (centerX, centerY, width, height), score in zip(classIds.tolist(), normalized.tolist(), scores.tolist()))
+
+
+#Runs in a worker process.  Either imageFullpath (an image file) or frame (a BGR numpy image, for video input) is given.
+def detectImage(imageFullpath, frame, cacheDirectory):
+	if frame is None:
+		with open(imageFullpath, "rb") as imageFile:
+			data = imageFile.read()
+		contentHash = hashlib.blake2b(data, digest_size=16).hexdigest()
+	else:
+		contentHash = hashlib.blake2b(frame.tobytes() + str(frame.shape).encode(), digest_size=16).hexdigest()
+
+	cacheFullpath = getCacheFullpath(cacheDirectory, workerDetector.version, contentHash)
+	if os.path.exists(cacheFullpath):
+		try:
+			return readProposalFile(cacheFullpath)
+		except ValueError:
+			pass	#half written by something else / corrupt, just run the model again
+
+	if frame is None:
+		frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+		if frame is None:
+			raise OSError("could not decode " + str(imageFullpath))
+	classIds, scores, normalized = workerDetector.detect(frame)
+	try:
+		os.makedirs(os.path.dirname(cacheFullpath), exist_ok=True)
+		writeFileAtomically(cacheFullpath, formatProposals(classIds, scores, normalized))
+	except OSError as e:
+		log.warning("Could not cache proposals in " + str(cacheFullpath) + ": " + str(e))
+	return classIds, scores, normalized
+
+
+#Drops the proposals that are already labeled:  there's a box of the same class overlapping them by at least iouThreshold (the proposal was accepted
+#earlier, or you drew the same box yourself).  All the boxes are x1, y1, x2, y2 pixels.  Returns a mask of the proposals to keep.
+def getUnlabeledProposals(proposalClassIds, proposalPixels, boxClassIds, boxPixels, iouThreshold=0.5):
+	if len(proposalClassIds) == 0 or len(boxClassIds) == 0:
+		return np.ones(len(proposalClassIds), dtype=bool)
+	intersectionWidth = np.clip(np.minimum(proposalPixels[:, None, 2], boxPixels[None, :, 2]) - np.maximum(proposalPixels[:, None, 0], boxPixels[None, :, 0]), 0, None)
+	intersectionHeight = np.clip(np.minimum(proposalPixels[:, None, 3], boxPixels[None, :, 3]) - np.maximum(proposalPixels[:, None, 1], boxPixels[None, :, 1]), 0, None)
+	intersection = intersectionWidth * intersectionHeight
+	proposalAreas = (proposalPixels[:, 2] - proposalPixels[:, 0]) * (proposalPixels[:, 3] - proposalPixels[:, 1])
+	boxAreas = (boxPixels[:, 2] - boxPixels[:, 0]) * (boxPixels[:, 3] - boxPixels[:, 1])
+	union = proposalAreas[:, None] + boxAreas[None, :] - intersection
+	with np.errstate(divide="ignore", invalid="ignore"):
+		iou = np.where(union > 0, intersection / union, 0)
+	labeled = ((iou >= iouThreshold) & (proposalClassIds[:, None] == boxClassIds[None, :])).any(axis=1)
+	return ~labeled
+
+
+#What the labeler talks to.  request() is called from the prefetcher threads as images are loaded, get() from the draw loop.
+#onReady(imageFilename) is called (from a pool thread) when an image's proposals are done, so the window can wake up and draw them.
+class ProposalEngine:
+	def __init__(self, detectorSpec, cacheDirectory, options, workers=1, onReady=None):
+		self.cacheDirectory = cacheDirectory
+		self.onReady = onReady
+		self.proposals = {}		#imageFilename -> (classIds, scores, normalized)
+		self.pending = set()
+		self.lock = threading.Lock()	#request() is called from several prefetch threads
+		threadsPerWorker = max(1, (os.cpu_count() or 1) // max(1, workers))
+		#spawn, not fork:  the labeler has display / prefetch threads running, and a forked child could inherit one of their locks held
+		self.executor = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn"),
+			initializer=initWorker, initargs=(detectorSpec, options, threadsPerWorker, logging.getLogger().getEffectiveLevel()))
+
+
+	def request(self, imageFilename, imageFullpath=None, frame=None):
+		with self.lock:
+			if imageFilename in self.proposals or imageFilename in self.pending:
+				return
+			self.pending.add(imageFilename)
+		try:
+			future = self.executor.submit(detectImage, imageFullpath, frame, self.cacheDirectory)
+		except BaseException as e:
+			with self.lock:
+				self.pending.discard(imageFilename)	#or it could never be asked for again
+			if isinstance(e, RuntimeError):
+				return	#shut down, we're exiting
+			raise
+		future.add_done_callback(lambda future: self.finished(imageFilename, future))
+
+
+	def finished(self, imageFilename, future):
+		proposals = None
+		if not future.cancelled():
+			try:
+				proposals = future.result()
+			except Exception as e:
+				log.warning("Detector failed on " + str(imageFilename) + ": " + str(e))
+				proposals = getEmptyProposals()
+		with self.lock:
+			self.pending.discard(imageFilename)
+			if proposals is None:
+				return
+			self.proposals[imageFilename] = proposals
+		if self.onReady is not None:
+			self.onReady(imageFilename)
+
+
+	#(classIds, scores, normalized), or None if the model hasn't gotten to this image yet
+	def get(self, imageFilename):
+		with self.lock:
+			return self.proposals.get(imageFilename)
+
+
+	def shutdown(self):
+		self.executor.shutdown(wait=False, cancel_futures=True)
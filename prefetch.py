@@ -0,0 +1,123 @@
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+log = logging.getLogger(__name__)
+
+
+#Decodes the images around the one currently being labeled in background threads so pressing 's' (or 'p') just swaps in a surface that is already sitting in memory.
+#Cache entries are whatever loadFunction(imageFilename) returns:  (imageWidth, imageHeight, boxes, imagePyramid) - see loadDataset() in pygamelabeler.py.
+#The cache is an LRU that is limited by the number of bytes the decoded images take up, not by the number of images (a 4K frame is ~33MB decoded, a 640x480 one ~1MB).
+#Note:  the surfaces are never convert()ed in the worker threads - that touches the display, which has to stay on the main thread.
+class ImagePrefetcher:
+	def __init__(self, filenamesList, loadFunction, ahead=4, behind=2, budgetBytes=512 * 1024 * 1024, workers=2):
+		self.filenamesList = filenamesList
+		self.loadFunction = loadFunction
+		self.ahead = ahead		#how many of the upcoming images to keep decoded
+		self.behind = behind	#how many of the previous images to keep decoded (for the 'p' key)
+		self.budgetBytes = budgetBytes
+		self.cache = OrderedDict()	#imageFilename -> entry, the least recently used entry is first
+		self.cacheBytes = 0
+		self.entrySizes = {}	#imageFilename -> the bytes counted in cacheBytes for it, so evicting takes off exactly what was added
+		self.pending = {}	#imageFilename -> Future for the decodes that are in flight
+		self.lock = threading.Lock()
+		self.executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="prefetch")
+		self.hits = 0
+		self.misses = 0
+
+
+	#Returns the entry for filenamesList[offset], decoding it right here only if no worker has gotten to it yet, then queues up the neighbours.
+	def get(self, offset):
+		imageFilename = self.filenamesList[offset]
+		future = None
+		with self.lock:
+			entry = self.cache.get(imageFilename)
+			if entry is not None:
+				self.cache.move_to_end(imageFilename)
+				self.hits += 1
+			else:
+				future = self.pending.get(imageFilename)
+				self.misses += 1
+
+		if entry is None and future is not None:
+			#A worker is already decoding it - wait for that rather than decoding the same file twice
+			entry = future.result()
+		if entry is None:
+			entry = self.loadFunction(imageFilename)
+			self.store(imageFilename, entry)
+
+		self.schedule(offset)
+		return entry
+
+
+	#Queue background decodes for the next self.ahead images (nearest first, that's the one you're most likely to need) and then the previous self.behind images.
+	def schedule(self, offset):
+		offsets = [offset + i for i in range(1, self.ahead + 1)] + [offset - i for i in range(1, self.behind + 1)]
+		for prefetchOffset in offsets:
+			if prefetchOffset < 0 or prefetchOffset >= len(self.filenamesList):
+				continue
+			imageFilename = self.filenamesList[prefetchOffset]
+			with self.lock:
+				if imageFilename in self.cache or imageFilename in self.pending:
+					continue
+				try:
+					self.pending[imageFilename] = self.executor.submit(self.backgroundLoad, imageFilename)
+				except RuntimeError:
+					return	#the executor has been shut down, we're exiting
+
+
+	def backgroundLoad(self, imageFilename):
+		entry = None
+		try:
+			entry = self.loadFunction(imageFilename)
+			self.store(imageFilename, entry)
+		except Exception as e:
+			#get() will just decode it again on the main thread (and then show the real error if there is one)
+			log.warning("Background decode failed for " + str(imageFilename) + ": " + str(e))
+		finally:
+			with self.lock:
+				self.pending.pop(imageFilename, None)
+		return entry
+
+
+	#The size is counted when the entry goes in, and again for every pyramid level built later (grew()) - those are built by the main thread
+	#as you zoom out, after the entry was stored.
+	def store(self, imageFilename, entry):
+		with self.lock:
+			if imageFilename in self.cache:
+				self.removeEntry(imageFilename)
+			self.cache[imageFilename] = entry
+			entrySize = entry[3].trackSize(lambda byteCount: self.grew(imageFilename, entry, byteCount))
+			self.entrySizes[imageFilename] = entrySize
+			self.cacheBytes += entrySize
+			self.evict()
+
+
+	#Called by the ImagePyramid (outside its lock) after it built more levels
+	def grew(self, imageFilename, entry, byteCount):
+		with self.lock:
+			if self.cache.get(imageFilename) is not entry:
+				return	#evicted or replaced since, it's not counted any more
+			self.entrySizes[imageFilename] += byteCount
+			self.cacheBytes += byteCount
+			self.evict()
+
+
+	#Only call with self.lock held
+	def removeEntry(self, imageFilename):
+		entry = self.cache.pop(imageFilename)
+		entry[3].trackSize(None)
+		self.cacheBytes -= self.entrySizes.pop(imageFilename)
+
+
+	#Evict least recently used first, but always keep the most recently used entry even if it's bigger than the whole budget.  Only call with self.lock held.
+	def evict(self):
+		while self.cacheBytes > self.budgetBytes and len(self.cache) > 1:
+			self.removeEntry(next(iter(self.cache)))
+
+
+	def shutdown(self):
+		self.executor.shutdown(wait=False, cancel_futures=True)
+
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+import numpy as np  #comes with opencv-python
+
+
+#--profile:  how long each stage of the labeler takes, measured where it happens (the draw loop, the prefetch threads, the annotation writer thread).
+#Every stage keeps its last windowSize durations, so the p50 / p95 / p99 shown on the overlay and in the summary are for what you've been doing
+#lately, not averaged over the whole session.  With --profile-trace every measurement is also kept as an event for chrome://tracing / Perfetto
+#(one row per thread, so you can see a decode in a prefetch thread overlapping the frame it was needed for).
+#
+#With profiling off, stage() hands back the same do-nothing context manager every time, so the instrumented code costs one method call per stage.
+
+
+class NullStage:
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, excType, excValue, traceback):
+		return False
+
+
+nullStage = NullStage()
+
+
+class Stage:
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+
+	def __exit__(self, excType, excValue, traceback):
+		self.profiler.record(self.name, self.start, time.perf_counter())
+		return False
+
+
+class Profiler:
+	def __init__(self, enabled=False, windowSize=1000, keepTrace=False, maxTraceEvents=500000):
+		self.enabled = enabled
+		self.windowSize = windowSize
+		self.keepTrace = keepTrace
+		self.durations = {}		#stage name -> deque of the last windowSize durations (seconds)
+		self.totals = {}		#stage name -> (count, total seconds) over the whole session
+		self.traceEvents = deque(maxlen=maxTraceEvents)	#(name, start, end, thread id) - the oldest are dropped past maxTraceEvents
+		self.threadNames = {}
+		self.startTime = time.perf_counter()
+		self.lock = threading.Lock()	#the prefetch and writer threads record too
+
+
+	def stage(self, name):
+		if not self.enabled:
+			return nullStage
+		return Stage(self, name)
+
+
+	#loadFunction etc. with its calls timed as stage name
+	def wrap(self, name, function):
+		if not self.enabled:
+			return function
+		def timedFunction(*args, **kwargs):
+			with self.stage(name):
+				return function(*args, **kwargs)
+		return timedFunction
+
+
+	def record(self, name, start, end):
+		thread = threading.current_thread()
+		with self.lock:
+			durations = self.durations.get(name)
+			if durations is None:
+				durations = self.durations[name] = deque(maxlen=self.windowSize)
+				self.totals[name] = (0, 0.0)
+			durations.append(end - start)
+			count, total = self.totals[name]
+			self.totals[name] = (count + 1, total + end - start)
+			if self.keepTrace:
+				self.traceEvents.append((name, start, end, thread.ident))
+				self.threadNames[thread.ident] = thread.name
+
+
+	#{stage name: (p50, p95, p99) in milliseconds} over the rolling window
+	def getPercentiles(self):
+		with self.lock:
+			windows = {name: np.array(durations) for name, durations in self.durations.items() if len(durations) > 0}
+		return {name: tuple((np.percentile(window, [50, 95, 99]) * 1000).tolist()) for name, window in windows.items()}
+
+
+	#A few lines for the on-screen overlay
+	def getOverlayLines(self):
+		return ["%-12s %6.1f %6.1f %6.1f" % ((name,) + percentiles) for name, percentiles in sorted(self.getPercentiles().items())]
+
+
+	def printSummary(self):
+		percentiles = self.getPercentiles()
+		print("Profile (milliseconds, p50 / p95 / p99 over the last " + str(self.windowSize) + " of each):")
+		print("\t%-16s %8s %8s %8s %8s %10s" % ("stage", "p50", "p95", "p99", "count", "total s"))
+		for name in sorted(percentiles):
+			count, total = self.totals[name]
+			print("\t%-16s %8.2f %8.2f %8.2f %8d %10.2f" % ((name,) + percentiles[name] + (count, total)))
+
+
+	#Chrome trace event format ("X" = complete events with a start + duration, in microseconds)
+	def writeChromeTrace(self, traceFilename):
+		with self.lock:
+			events = list(self.traceEvents)
+			threadNames = dict(self.threadNames)
+		pid = os.getpid()
+		traceEvents = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": threadId, "args": {"name": threadName}} for threadId, threadName in threadNames.items()]
+		traceEvents.extend({"name": name, "ph": "X", "pid": pid, "tid": threadId, "ts": round((start - self.startTime) * 1e6, 1), "dur": round((end - start) * 1e6, 1)}
+			for name, start, end, threadId in events)
+		with open(traceFilename, "w") as traceFile:
+			json.dump({"traceEvents": traceEvents, "displayTimeUnit": "ms"}, traceFile)
+		print("Wrote " + str(len(events)) + " trace events to " + str(traceFilename) + " (open it in chrome://tracing or ui.perfetto.dev)")
@@ -0,0 +1,139 @@
+import threading
+from collections import OrderedDict
+import numpy as np  #comes with opencv-python
+import cv2  #pip install opencv-python
+import pygame
+
+
+#Frames split out of continuous footage barely change from one to the next, so the boxes on the frame you just finished are a good start for the
+#next one - they've usually only drifted a few pixels.  With --propagate, when 's' takes you to an image that has no annotation file yet, the boxes
+#from the image you just left are tracked onto it and put there as ordinary boxes (fix or delete the ones that are off with 'd' like any other box).
+#
+#Tracking is sparse Lucas-Kanade optical flow on a small grid of points inside each box (all the boxes' points in one call), checked forwards and then
+#backwards - a point only counts if tracking it back lands where it started.  A box moves by the median of its good points.  Boxes without enough
+#good points (too small / no texture / blurred) fall back to template matching in a window around where the box was.
+#The grayscale image pyramids LK works on (cv2.pyrDown levels - OpenCV's python bindings can't hand a prebuilt pyramid to calcOpticalFlowPyrLK, so trackPoints()
+#walks the levels itself, coarse to fine) are built in the prefetcher threads as the images load and kept for the last few images, so by the time
+#you press 's' both frames' pyramids are usually already there and tracking takes a few milliseconds.
+
+
+#Grayscale numpy image of a pygame surface
+def getGrayImage(imageCleanSurface):
+	pixels = pygame.surfarray.array3d(imageCleanSurface)	#(width, height, 3) RGB
+	return cv2.cvtColor(np.ascontiguousarray(pixels.transpose(1, 0, 2)), cv2.COLOR_RGB2GRAY)
+
+
+class BoxPropagator:
+	def __init__(self, maxImages=8, winSize=21, maxLevel=3, gridSize=3, searchMargin=32, minMatchScore=0.5):
+		self.maxImages = maxImages
+		self.winSize = (winSize, winSize)
+		self.maxLevel = maxLevel
+		self.gridSize = gridSize	#gridSize x gridSize points tracked per box
+		self.searchMargin = searchMargin	#pixels around a box the template matching fallback looks in
+		self.minMatchScore = minMatchScore
+		self.pyramids = OrderedDict()	#imageFilename -> [full size gray image, 1/2 size, 1/4 size ...], least recently used first
+		self.lock = threading.Lock()
+
+
+	#Builds and keeps the pyramid for an image - called from the prefetcher threads so it's ready before it's needed
+	def prepare(self, imageFilename, imageCleanSurface):
+		with self.lock:
+			if imageFilename in self.pyramids:
+				return self.pyramids[imageFilename]
+		pyramid = [getGrayImage(imageCleanSurface)]
+		while len(pyramid) <= self.maxLevel and min(pyramid[-1].shape) >= 2 * self.winSize[0]:
+			pyramid.append(cv2.pyrDown(pyramid[-1]))
+		with self.lock:
+			self.pyramids[imageFilename] = pyramid
+			self.pyramids.move_to_end(imageFilename)
+			while len(self.pyramids) > self.maxImages:
+				self.pyramids.popitem(last=False)
+			return self.pyramids[imageFilename]
+
+
+	#The points tracked for each box:  a grid over the middle of the box (staying off the edges, which are usually background)
+	def getBoxPoints(self, pixels):
+		steps = (np.arange(self.gridSize) + 0.5) / self.gridSize * 0.6 + 0.2	#20% to 80% across the box
+		boxWidths = pixels[:, 2] - pixels[:, 0]
+		boxHeights = pixels[:, 3] - pixels[:, 1]
+		pointsX = pixels[:, 0, None, None] + boxWidths[:, None, None] * steps[None, None, :]
+		pointsY = pixels[:, 1, None, None] + boxHeights[:, None, None] * steps[None, :, None]
+		pointsX, pointsY = np.broadcast_arrays(pointsX, pointsY)
+		return np.stack((pointsX, pointsY), axis=-1).reshape(-1, 1, 2).astype(np.float32)
+
+
+	#Pyramidal LK over the cached levels:  track at the smallest level first, then each bigger level starts from where the one before ended up (doubled).
+	def trackPoints(self, fromPyramid, toPyramid, points, criteria):
+		levelCount = min(len(fromPyramid), len(toPyramid))
+		trackedPoints = None
+		for level in reversed(range(levelCount)):
+			levelPoints = points / (2 ** level)
+			if trackedPoints is None:
+				guesses = levelPoints.copy()
+			else:
+				guesses = trackedPoints * 2
+			trackedPoints, status, error = cv2.calcOpticalFlowPyrLK(fromPyramid[level], toPyramid[level], levelPoints, guesses,
+				winSize=self.winSize, maxLevel=0, criteria=criteria, flags=cv2.OPTFLOW_USE_INITIAL_FLOW)
+		return trackedPoints, status
+
+
+	#Looks for the box's contents in a window around where it was - for boxes optical flow couldn't follow.  Returns the shift or None.
+	def matchTemplate(self, previousGray, nextGray, box):
+		imageHeight, imageWidth = previousGray.shape
+		centerX, centerY = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+		halfWidth = max(4, (box[2] - box[0]) / 2)	#tiny boxes get a bit of surroundings so there's something to match
+		halfHeight = max(4, (box[3] - box[1]) / 2)
+		templateX1, templateY1 = int(max(0, centerX - halfWidth)), int(max(0, centerY - halfHeight))
+		templateX2, templateY2 = int(min(imageWidth, centerX + halfWidth)), int(min(imageHeight, centerY + halfHeight))
+		searchX1, searchY1 = max(0, templateX1 - self.searchMargin), max(0, templateY1 - self.searchMargin)
+		searchX2, searchY2 = min(imageWidth, templateX2 + self.searchMargin), min(imageHeight, templateY2 + self.searchMargin)
+		if templateX2 - templateX1 < 2 or templateY2 - templateY1 < 2:
+			return None
+		template = previousGray[templateY1:templateY2, templateX1:templateX2]
+		searchArea = nextGray[searchY1:searchY2, searchX1:searchX2]
+		scores = cv2.matchTemplate(searchArea, template, cv2.TM_CCOEFF_NORMED)
+		minScore, maxScore, minLocation, maxLocation = cv2.minMaxLoc(scores)
+		if maxScore < self.minMatchScore:
+			return None
+		return searchX1 + maxLocation[0] - templateX1, searchY1 + maxLocation[1] - templateY1
+
+
+	#boxes are (classId, x1, y1, x2, y2) on previousFilename's image.  Returns (the boxes moved onto nextFilename's image, how many were lost).
+	def propagate(self, previousFilename, previousSurface, nextFilename, nextSurface, boxes):
+		if len(boxes) == 0 or previousSurface.get_size() != nextSurface.get_size():
+			return [], len(boxes)
+		previousPyramid = self.prepare(previousFilename, previousSurface)
+		nextPyramid = self.prepare(nextFilename, nextSurface)
+		imageHeight, imageWidth = previousPyramid[0].shape
+		classIds = [box[0] for box in boxes]
+		pixels = np.array([box[1:5] for box in boxes], dtype=np.float32)
+
+		points = self.getBoxPoints(pixels)
+		criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+		nextPoints, status = self.trackPoints(previousPyramid, nextPyramid, points, criteria)
+		backPoints, backStatus = self.trackPoints(nextPyramid, previousPyramid, nextPoints, criteria)
+		forwardBackwardError = np.linalg.norm((backPoints - points).reshape(-1, 2), axis=1)
+		good = (status.reshape(-1) == 1) & (backStatus.reshape(-1) == 1) & (forwardBackwardError < 1.0)
+		pointsPerBox = self.gridSize * self.gridSize
+		good = good.reshape(-1, pointsPerBox)
+		shifts = (nextPoints - points).reshape(-1, pointsPerBox, 2)
+
+		propagated = []
+		lost = 0
+		for row, classId in enumerate(classIds):
+			shift = None
+			if good[row].sum() * 2 >= pointsPerBox:	#at least half the points agree
+				shift = np.median(shifts[row][good[row]], axis=0)
+			else:
+				shift = self.matchTemplate(previousPyramid[0], nextPyramid[0], pixels[row])
+			if shift is None:
+				lost += 1
+				continue
+			boxX1, boxY1, boxX2, boxY2 = (pixels[row] + np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)).tolist()
+			boxX1, boxX2 = max(0.0, boxX1), min(float(imageWidth), boxX2)
+			boxY1, boxY2 = max(0.0, boxY1), min(float(imageHeight), boxY2)
+			if boxX2 - boxX1 < 1 or boxY2 - boxY1 < 1:
+				lost += 1	#moved off the image
+				continue
+			propagated.append((classId, boxX1, boxY1, boxX2, boxY2))
+		return propagated, lost
@@ -1,31 +1,47 @@
 import sys
 import os
-from os import walk #more simply get all filenames in a directory
 import argparse
-import pathlib
 from pathlib import Path
-from PIL import Image   #pip install pillow
 import pygame   #pip install pygame
-from pygame.locals import *  #this is for drawing the box lines over the image (when you click for the corners + following the mouse cursor between clicks)
-from copy import copy
+import threading  #the dataset index is refreshed in the background while you label
+import time  #for the cpu usage report at the end of a session
 import math  #for finding the distance between two points when testing distance from cursor to boxes you might want to delete
+import logging  #the chatty per box / per event messages are debug level, so they're off unless you ask for them (--log-level debug)
 from operator import itemgetter  #for sorting a list, lets you do sorts of lists of list by multiple indexes
+from prefetch import ImagePrefetcher  #decodes the next / previous images in background threads
+from datasetfiles import iterInputFilenames, StreamingFilenameList, getLabels, getAnnotationFileName  #finding the images / labels / annotation files on disk
+from datasetindex import DatasetIndex  #remembers which images are labeled already, so you can start where you left off
+from boxarray import readAnnotationFile  #parses a whole annotation file into numpy columns at once
+from annotationstore import AnnotationStore  #keeps the boxes in memory and writes the annotation files in the background
+from renderer import LayeredRenderer  #background / box overlay / rubber band layers, so the loop doesn't copy the whole image every frame
+from viewport import ImagePyramid, getWindowSize  #zoom / pan for images bigger than the screen
+from videosource import VideoFrameSource, getFrameFilename, getFrameNumber, exportLabeledFrames  #labeling straight from a video file
+from splitvid import getFrameNumbers  #same frame picking options as splitvid.py
+from preannotate import ProposalEngine, DetectorOptions, getUnlabeledProposals  #suggested boxes from a detector model
+from boxarray import normalizedToPixels  #the detector's proposals come back normalized, the window needs them in pixels
+from propagate import BoxPropagator  #moves the boxes from the image you just saved onto the next frame
+from dedupe import iterUniqueFilenames  #leaves out near duplicate frames
+from profiler import Profiler  #--profile:  per stage timings
+from workqueue import LeaseManager, ClaimedFilenameList  #--team:  several labelers on one directory
+from thumbnailcache import ThumbnailCache, getPersonalStoreDirectory  #'g':  thumbnails for the grid overview
+from gridview import GridView
+
+
+log = logging.getLogger("pygamelabeler")
 
 
 #TODO:  'L', relabeled box to your currently set label.
 #TODO:  B could turn all box drawing off temporarily, then press it again to turn them back on.
-#TODO:  'C' could color all the boxes of your currently selected label to blue, leaving the rest red.  If you changed your selected label, the boxes with that label would turn blue
-#and the previously blue boxes would turn back to red.  This way, you could easily see all the boxes with the current label easily and you could step through the labels to see which ones were present
-#in an image visually.
 #TODO:  'H' display help using fonts.
 #TODO:  'A' adds the box when mouse is offscreen, have it remember where the mouse went offscreen and keep the box against the edge.
-#TODO:  'P' Go to previous image (I might reorient all these keys to be positioned better with respect to each other / make sense in context more than just standing for first letter of the function).
+#TODO:  I might reorient all these keys to be positioned better with respect to each other / make sense in context more than just standing for first letter of the function.
 #Right now I'm sometimes pressing 'S' instead of what I was wanting 'D'.  Those functions might need to be further apart.
 
 #Idea:  I could make this intermittently copy already annotated image files and their annotations to a separate directory to be automatically
 #processed - to train a YOLO model, then have that model also running here (and updated as it finishes training), putting boxes of a blue color around things it thinks it recognizes
 #then you could position the mouse cursor over those and press a key to have that marked as well.
 #This would be a sort of progressive training - would help annotators to see progress and see how the model was learning in real time.
+#	--> the "model running here, blue boxes, press a key to accept" part is in preannotate.py (--detector model.onnx, then 'a').
 
 #Idea2:  It would be nice to have a key you could press that would throw keybind help up on the screen using pygame fonts.
 #Then you could press escape to exit that help and go back to doing annotations.
@@ -37,9 +53,11 @@ from operator import itemgetter  #for sorting a list, lets you do sorts of lists
 #3.  Load first image and enter loop:
 #	0.  'q' to exit program, saving any boxes first for image.
 #	    's' to save boxes for image and go to next image.
+#	    'p' to go back to the previous image.
 #	   scroll the mouse wheel to change the class labels you will apply to any label boxes.
 #	a.  Wait for mouse button up (left click to mark top-left box corner, left click again to mark bottom-right box corner)
 #		i.  'd' to erase nearest box (box with closest top-left corner by x, then y...or it cancels the last box corner
+#		    'x' while dragging out a box erases all the boxes inside it.
 #		ii.  When a top-left box corner has been drawn, continue drawing box to the mouse cursor, red in color.
 #		iii.  Once bottom-right box corner has been placed with second left mouse click, box lines turn blue and are set.
 #		iv.  Top-left and bottom-right points are kept in variables (topLeftX, topLefty, bottomRightX, bottomRightY.
@@ -60,22 +78,146 @@ def printHelp():
 	print("Once in the program: ")
 	print("\t 'q' exits the program.")
 	print("\t 's' saves the annotation boxes and goes to the next input image.")
+	print("\t 'p' goes back to the previous image.")
 	print("\t You should have a labels.txt file in your input images folder with object class names in it.")
 	print("\t Scroll the mouse wheel to change between labels.")
 	print("\t Whatever the current label is, starting at the first one by default, that will be the label on any created boxes.")
 	print("\t Left click marks upper left corner of a box and then lower right corner...right click removes one of these marks.")
 	print("\t 'd' removes the nearest box to the mouse cursor, as defined by nearest top left corner to mouse x then mouse y.")
+	print("\t   (the box 'd' would remove is highlighted in yellow while the mouse is over it)")
+	print("\t 'x' after left clicking one corner removes every box completely inside the box you're dragging out.")
+	print("\t Every class has its own color and the boxes have their label on them.  'c' shows only the current label's boxes in color (the rest dimmed)")
+	print("\t   - scroll through the labels to see which ones are in the image.  'c' again goes back to all of them.  --no-label-text leaves the labels off.")
+	print("\t 'g' shows all the images as a grid of thumbnails, each with the number of boxes it has (no number = not labeled yet).  Click one to label it,")
+	print("\t   the mouse wheel / Page Up / Page Down / Home / End scroll, 'g' or Escape goes back.  The thumbnails are made in the background and kept in")
+	print("\t   .pygamelabeler-thumbnails.* in the input directory, so they're only made once (--thumbnail-size WxH, default 160x90).  With --team they're")
+	print("\t   kept in ~/.cache/pygamelabeler instead, off the shared drive.")
+	print("\t Ctrl + mouse wheel zooms in / out around the mouse cursor, hold the middle mouse button and drag to move around, 'f' fits the whole image in the window again.")
 	print("\t Once 's' is pressed, a file is written out with the box annotations in txt format as expected by YOLO for training.")
 	print("\t This file will have the same name as the image you're currently on, just .txt format extension.  Therefore, even if")
 	print("\t you have gone through hundreds of images and then press q, you will not lose previously saved image annotations.")
-
-
-def getInputDirectory():
-	inputDirectory = None
+	print("\n")
+	print("Prefetching:  the next few images (and the last few) are decoded in background threads so 's' and 'p' don't wait on the disk.")
+	print("\t --prefetch-ahead N    number of upcoming images to keep decoded (default 4)")
+	print("\t --prefetch-behind N   number of previous images to keep decoded (default 2)")
+	print("\t --cache-mb N          memory budget for decoded images in megabytes (default 512)")
+	print("\t --prefetch-workers N  number of background decode threads (default 2)")
+	print("\n")
+	print("Big images:  images bigger than the screen are shown zoomed out to fit (boxes are still saved in full resolution pixels).")
+	print("\t --window-size WxH     largest window to open (default: a bit smaller than the screen)")
+	print("\t --zoom-step N         how much one Ctrl + mouse wheel click zooms (default 1.25)")
+	print("\t The zoom is kept when the next image is the same size, so you can stay zoomed in on the same part of a video.")
+	print("\n")
+	print("Video:  give -i a video file to label its frames without splitting them out with splitvid.py first.")
+	print("\t The frames are decoded as you go, the annotation files are named frameN.txt (N = frame number) and when you quit only the labeled")
+	print("\t frames are written out as images (frameN.jpg), so the directory ends up the same as splitvid.py + labeling would have left it.")
+	print("\t --start / --stop / --start-time / --stop-time / --stride / --every-seconds pick the frames, same as splitvid.py")
+	print("\t -o DIR                where labels.txt, the annotation files and the exported frames are (default: the video's directory)")
+	print("\t --export-format jpg   jpg / png / webp, --export-quality N, --export-workers N, --no-export to skip the export")
+	print("\n")
+	print("Suggested boxes:  --detector model.onnx runs a YOLO model (exported to ONNX, same class order as labels.txt) in background processes on the")
+	print("\t images as they're loaded and draws what it finds in blue.  It never holds up the window - the blue boxes show up when the model is done.")
+	print("\t 'a' with the mouse inside a blue box turns it into a real box, Shift + 'a' accepts all of them.")
+	print("\t The suggestions are cached in .pygamelabeler-proposals in the input directory (by image contents + model), so they're only worked out once.")
+	print("\t --detector-workers N, --detector-input-size N, --detector-format yolov8|yolov5, --proposal-threshold N, --nms-threshold N")
+	print("\t --detector some.module:SomeClass uses your own detector class instead (see the top of preannotate.py for what it needs).")
+	print("\n")
+	print("Propagating boxes:  --propagate tracks the boxes from the image you just saved onto the next one when 's' takes you to an image with no")
+	print("\t annotation file yet, for frames split out of the same video.  They're ordinary boxes - delete the ones that are off with 'd'.")
+	print("\t --propagate-margin N  pixels around a box to look for it when optical flow can't follow it (default 32)")
+	print("\t --propagate-min-score N  how alike (0 to 1) the box has to look on the next image to be kept in that case (default 0.5)")
+	print("\n")
+	print("Profiling:  --profile times each stage (event handling, drawing, flip, image loads, annotation writes) and prints p50 / p95 / p99 when you quit.")
+	print("\t --profile-overlay     also shows them in the top left corner of the window")
+	print("\t --profile-trace FILE  also writes every timing as a chrome://tracing / Perfetto trace")
+	print("\t --log-level debug     prints what's going on with every box / click (default: info)")
+	print("\t --log-level warning   only the problems (a failed write or decode, a lost lease ...), from the background threads too")
+	print("\n")
+	print("CPU usage:  while no box is being dragged out, the program sleeps until you do something.")
+	print("\t --fps N               redraw rate cap while dragging out a box (default 60)")
+	print("\t --idle-mode poll      redraw continuously instead of waiting for input (the old behavior, burns a whole core)")
+	print("\t The wall clock / cpu time used is printed when the session ends.")
+	print("\n")
+	print("Saving:  boxes are kept in memory and the annotation files are written in the background (always to a temp file first, then renamed into place).")
+	print("\t --flush-delay N       seconds to wait after a change before writing (default 1).  's', 'p' and 'q' write right away.")
+	print("\t Pressing 's' on an image with no boxes writes an empty annotation file, which marks it as done (and tells YOLO there's nothing in it).")
+	print("\n")
+	print("Resuming:  a small index file (.pygamelabeler-index.sqlite) in the input directory keeps track of which images are labeled.")
+	print("\t --start-at-unlabeled  start at the first image without an annotation file")
+	print("\t --filter labeled      only show images with boxes (also: empty = annotation file without boxes, unlabeled = no annotation file)")
+	print("\t --no-index            don't use the index file")
+	print("\n")
+	print("Finding images:  the input directory is listed in the background, so the first image shows up right away even with hundreds of thousands of files.")
+	print("\t --recursive           also look in subdirectories (annotation files go next to their images)")
+	print("\t --order natural       frame9 before frame10 (default).  'name' is plain string order, 'none' is whatever order the file system gives (fastest).")
+	print("\t Image extensions are matched ignoring case (.JPG works too).  --filter and --start-at-unlabeled wait for the listing to finish.")
+	print("\n")
+	print("Labeling as a team:  run with --team on every computer pointed at the same (network) directory.  Each labeler claims a batch of images nobody")
+	print("\t has labeled or claimed yet (lease files in .pygamelabeler-leases), and claims more as it gets near the end of them - nobody labels the same image twice.")
+	print("\t --claim-batch N       images claimed at a time (default 16)")
+	print("\t --lease-minutes N     if a labeler crashes, its images go back to everyone after this long (default 10).  Quitting gives them back right away.")
+	print("\t When only other labelers' images are left, 's' says so instead of exiting - press it again later for the ones they give back or that run out.")
+	print("\t If someone else changes an annotation file you have open anyway, your boxes go to frameN.txt.conflict-... next to it instead of overwriting theirs.")
+	print("\t --team doesn't use the index file (several computers writing one SQLite file over NFS can corrupt it).")
+	print("\t --hide-duplicates N   skip images that look the same as one before them (perceptual hashes within N bits of 64, 4 is a good start).")
+	print("\t                       The hashes are kept in .pygamelabeler-hashes.sqlite, so only new images are hashed next time.")
+
+
+#argv is for benchmark.py, which runs the labeler with its own options (None = the command line)
+def getArguments(argv=None):
 	parser = argparse.ArgumentParser()
-	parser.add_argument('-i', '--input', default=os.getcwd())
+	parser.add_argument('-i', '--input', default=os.getcwd(), help='Directory of images, or a video file to label frames from directly')
 	parser.add_argument('-d', '--docs', help='-d docs   Prints full help')
-	args = parser.parse_args()
+	parser.add_argument('--prefetch-ahead', type=int, default=4, help='Number of upcoming images to decode in the background')
+	parser.add_argument('--prefetch-behind', type=int, default=2, help='Number of previous images to keep decoded')
+	parser.add_argument('--cache-mb', type=int, default=512, help='Memory budget in megabytes for decoded images')
+	parser.add_argument('--prefetch-workers', type=int, default=2, help='Number of background decode threads')
+	parser.add_argument('--fps', type=int, default=60, help='Redraw rate cap while a box is being dragged out')
+	parser.add_argument('--flush-delay', type=float, default=1.0, help='Seconds to wait after a box change before writing the annotation file in the background')
+	parser.add_argument('--start-at-unlabeled', action='store_true', help='Start at the first image that has no annotation file yet')
+	parser.add_argument('--filter', choices=['all', 'labeled', 'empty', 'unlabeled'], default='all', help='Only show images with boxes (labeled), with an empty annotation file (empty) or without an annotation file (unlabeled)')
+	parser.add_argument('--no-index', action='store_true', help="Don't keep the dataset index file in the input directory")
+	parser.add_argument('--recursive', action='store_true', help='Also look for images in the subdirectories of the input directory')
+	parser.add_argument('--order', choices=['natural', 'name', 'none'], default='natural', help='natural: frame9 before frame10.  name: plain string order.  none: file system order (fastest)')
+	parser.add_argument('--team', action='store_true', help='Several labelers on the same (network) directory:  each one claims its own batches of unlabeled images')
+	parser.add_argument('--claim-batch', type=int, default=16, help='--team:  images claimed at a time')
+	parser.add_argument('--lease-minutes', type=float, default=10, help="--team:  minutes after which a crashed labeler's images can be claimed by someone else")
+	parser.add_argument('--hide-duplicates', type=int, default=None, help="Don't show images whose perceptual hash is within this many bits (of 64) of an earlier image's")
+	parser.add_argument('--window-size', default=None, help='Largest window to open, as WIDTHxHEIGHT (default: a bit smaller than the screen).  Bigger images are shown zoomed out to fit')
+	parser.add_argument('--thumbnail-size', default='160x90', help="Size of the thumbnails in the grid overview ('g'), as WIDTHxHEIGHT")
+	parser.add_argument('--no-label-text', action='store_true', help="Don't draw the label names on the boxes (they're still colored by class)")
+	parser.add_argument('--zoom-step', type=float, default=1.25, help='How much one Ctrl + mouse wheel click zooms in or out')
+	parser.add_argument('-o', '--output', default=None, help='Video input only:  directory for labels.txt, the annotation files and the exported frames (default: the directory the video is in)')
+	parser.add_argument('--start', type=int, default=None, help='Video input only:  first frame number to label')
+	parser.add_argument('--stop', type=int, default=None, help='Video input only:  last frame number to label')
+	parser.add_argument('--start-time', default=None, help='Video input only:  start time in seconds or H:M:S (instead of --start)')
+	parser.add_argument('--stop-time', default=None, help='Video input only:  stop time in seconds or H:M:S (instead of --stop)')
+	parser.add_argument('--stride', type=int, default=None, help='Video input only:  label every Nth frame (default: one frame per minute of video, like splitvid.py)')
+	parser.add_argument('--every-seconds', type=float, default=None, help='Video input only:  label one frame every N seconds of video (instead of --stride)')
+	parser.add_argument('--video-cache-mb', type=int, default=256, help='Video input only:  memory budget for decoded frames read on the way to another frame')
+	parser.add_argument('--export-format', choices=['jpg', 'png', 'webp'], default='jpg', help='Video input only:  image format the labeled frames are exported in')
+	parser.add_argument('--export-quality', type=int, default=95, help='Video input only:  JPEG / WebP quality of the exported frames')
+	parser.add_argument('--export-workers', type=int, default=os.cpu_count() or 1, help='Video input only:  processes used to export the labeled frames')
+	parser.add_argument('--no-export', action='store_true', help="Video input only:  don't export the labeled frames as images when you quit")
+	parser.add_argument('--detector', default=None, help='Show suggested boxes from a model:  a YOLO .onnx file, or module:Class for your own detector (see preannotate.py)')
+	parser.add_argument('--detector-workers', type=int, default=1, help='Number of background processes running the detector')
+	parser.add_argument('--detector-input-size', type=int, default=640, help='Input size the model was exported with')
+	parser.add_argument('--detector-format', choices=['yolov8', 'yolov5'], default='yolov8', help='Layout of the model output')
+	parser.add_argument('--proposal-threshold', type=float, default=0.25, help='Minimum score for a suggested box to be shown')
+	parser.add_argument('--nms-threshold', type=float, default=0.45, help='Overlap above which the weaker of two suggested boxes of the same class is dropped')
+	parser.add_argument('--propagate', action='store_true', help="Put the boxes from the image you just saved onto the next image (tracked to where they moved) when it has no annotation file yet")
+	parser.add_argument('--propagate-margin', type=int, default=32, help='Pixels around a box to search for it when optical flow loses it')
+	parser.add_argument('--propagate-min-score', type=float, default=0.5, help='Minimum template match score (0 to 1) for a box optical flow lost to be kept')
+	parser.add_argument('--profile', action='store_true', help='Time each stage of the labeler and print p50 / p95 / p99 when you quit')
+	parser.add_argument('--profile-overlay', action='store_true', help='Show the --profile timings on the window (turns on --profile)')
+	parser.add_argument('--profile-trace', default=None, help='Write every --profile timing to this file as a Chrome trace (turns on --profile)')
+	parser.add_argument('--log-level', choices=['debug', 'info', 'warning'], default='info', help='debug prints details about every box / click, warning only the problems')
+	parser.add_argument('--idle-mode', choices=['wait', 'poll'], default='wait', help='wait: sleep until there is input when no box is being dragged.  poll: redraw continuously')
+	return parser.parse_args(argv)
+
+
+def getInputDirectory(args):
+	inputDirectory = None
 
 	if args.docs:
 		printHelp()
@@ -102,258 +244,15 @@ def getInputDirectory():
 	return inputDirectory
 
 
-def getInputFilenames(mypath):
-	f = []
-	files = []
-	image_extensions = [".jpg", ".jpeg", ".bmp" , ".png"]  # I'm just detecting jpeg, bitmap, and png
-	# I would use imghdr, but I saw a big discussion about the python maintainers deprecating it
-
-	#https://stackoverflow.com/questions/3207219/how-do-i-list-all-files-of-a-directory
-	for (dirpath, dirnames, filenames) in walk(mypath):
-		f.extend(filenames)
-		break
-
-	#https://stackoverflow.com/questions/541390/extracting-extension-from-filename-in-python/
-	for filename in f:
-		name, extension = os.path.splitext(filename)
-		if extension in image_extensions:
-			files.append(filename)
-
-	return files
-	
-
-#You are expected to put your labels in a file named "labels.txt" in the input directory.  See the example labels.txt given for format.
-def getLabels(inputDirectory, labelFileName):
-	labels = None
-	with open(os.path.join(inputDirectory, labelFileName)) as f:
-		labels = f.read().splitlines()
-	return labels
-			
-
-#The annotation file for a given image will have the same filename, except the prefix will be .txt  (so there will be a separate annotation file for each image that holds all the label box details)
-def getAnnotationFileName(inputDirectory, imageFilename):
-	inputDirectory = Path(inputDirectory)
-	filename, extension = os.path.splitext(imageFilename)  #get the image extension off the image file name
-	
-	annotationFilename = filename + ".txt" #the image annotation file has the same first part of the name but the extension is ".txt" instead of the image extension.
-
-	annotationFileFullpath = inputDirectory / annotationFilename
-	
-	return annotationFileFullpath
-
-
-#Just give me values I can work with on screen:
-def getBoxValuesFromStrings(box, imageWidth, imageHeight, labels):
-	#print(box)
-	labelIndexStr, normalizedBoxCentroidXStr, normalizedBoxCentroidYStr, normalizedBoxWidthStr, normalizedBoxHeightStr = box.split(' ')
-	label = labels[int(labelIndexStr)]
-	normalizedBoxCentroidX = float(normalizedBoxCentroidXStr)
-	normalizedBoxCentroidY = float(normalizedBoxCentroidYStr)
-	normalizedBoxWidth = float(normalizedBoxWidthStr)
-	normalizedBoxHeight = float(normalizedBoxHeightStr)
-	
-	box = [label, normalizedBoxCentroidX, normalizedBoxCentroidY, normalizedBoxWidth, normalizedBoxHeight]
-
-	return box
-
-
-def getImageBoxCoordinateFromNormalizedValues(box, imageWidth, imageHeight, labels):
-	#print("entering getImageBoxCoordinateFromNormalizedValues()")
-	box = getBoxValuesFromStrings(box, imageWidth, imageHeight, labels)
-	
-	label = box[0]
-	
-	normalizedBoxCenterX = float(box[1])
-	normalizedBoxCenterY = float(box[2])
-	normalizedBoxWidth = float(box[3])
-	normalizedBoxHeight = float(box[4])
-	
-	#I think that it's possible for me to end up in a kind of bug loop where I reduce precision yet I still get different results when recalculating this (different for a string comparison)
-	#Therefore, I'm going to have to do a almost equal comparison by value when trying to find matches in the file for potential box removal later.
-	#The comparison will have to take into account precision and be almost equal by some percentage of total precision...
-	boxCenterX = normalizedBoxCenterX * imageWidth
-	boxCenterY = normalizedBoxCenterY * imageHeight
-	boxWidth = normalizedBoxWidth * imageWidth
-	boxHeight = normalizedBoxHeight * imageHeight
-	
-	boxX1 = boxCenterX - (boxWidth / 2)
-	boxY1 = boxCenterY - (boxHeight / 2)
-	boxX2 = boxCenterX + (boxWidth / 2)  
-	boxY2 = boxCenterY + (boxHeight / 2)
-	
-	boxDataForDrawing = [label, boxX1, boxY1, boxX2, boxY2]
-	
-	return boxDataForDrawing
-
-
-#The next two functions I'll only use for convenience in removeBox().
-#Once I have the box I want to remove, I'll get all the raw boxes, convert that single box to normalized / raw, get it's line
-#then loop through and match the line I want gone.  Then I'll take that out of the list and send the list to the setRawBoxesToAnnotationFile().
-def getRawBoxesFromAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight):
-	annotationFileFullpath = getAnnotationFileName(inputDirectory, imageFilename)
-	rawBoxes = []
-	try:
-		with open(annotationFileFullpath, "r") as annotationFile:
-			for line in annotationFile:
-				rawBoxes.append(line.rstrip())
-				
-	except OSError as e:
-		print("Annotation file does not exist yet.  Normally it'll be created while you left-click adding label boxes." + str(annotationFileFullpath))
-	
-	return rawBoxes
-
-
-#See calculateNormalizedBoxNumbers for exact formatting instructions / how to calculate them.
-def getBoxesFromAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight, labels):
-	annotationFileFullpath = getAnnotationFileName(inputDirectory, imageFilename)
-	
-	rawBoxes = []
-	boxes = []
-	rawBoxes = getRawBoxesFromAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight)
-	for box in rawBoxes:
-		boxForDrawing = getImageBoxCoordinateFromNormalizedValues(box, imageWidth, imageHeight, labels)
-		boxes.append(boxForDrawing)
-	
-	return boxes
-
-
-#This converts from a box in list format to a string so it can be written to an image annotation file.
-def getBoxWriteLine(box):
-	return str(box[0]) + " " + str(box[1]) + " " + str(box[2]) + " " + str(box[3]) + " " + str(box[4]) + "\n"
-	
-	
-def setRawBoxesToAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight, boxLines):
-	#print("in setRawBoxesToAnnotationFile()")
-	print("In setRawBoxesToAnnotationFile - new boxes:")
-	for line in boxLines:
-		print(line.rstrip())
-	annotationFileFullpath = getAnnotationFileName(inputDirectory, imageFilename)
-	
-	with open(annotationFileFullpath, "w") as annotationFile:
-		for line in boxLines:
-			annotationFile.write(line)
-
-
-#In the annotation files, all the boxes (one per line) are stored in normalized format in a space delimited string (with a line break '\n' at the end).
-#In order to display the boxes over the image, I need their X1, Y1, X2, and Y2 values in image coords.
-#I also need the values as separate elements in a list in order to be easily referenced.
-def calculateNormalizedBoxNumbers(label, boxX1, boxY1, boxX2, boxY2, imageWidth, imageHeight, labels):
-
-	labelIndex = labels.index(label)
-
-	boxWidth = boxX2 - boxX1
-	boxHeight = boxY2 - boxY1
-	boxCenterX = boxX1 + (boxWidth / 2)
-	boxCenterY = boxY1 + (boxHeight / 2)
-	
-	#Box coordinates must be normalized by the dimensions of the image (i.e. have values between 0 and 1)
-	normalizedBoxCenterX = boxCenterX / imageWidth
-	normalizedBoxCenterY = boxCenterY / imageHeight
-	normalizedBoxWidth = boxWidth / imageWidth	#My laptop screen is much wider than it is tall, must be why the precision can get so high here when uncontrolled...I'm going to limit it
-	normalizedBoxHeight = boxHeight / imageHeight
-	#https://blog.paperspace.com/train-yolov5-custom-data/
-	#All of these values must be normalized, which we just calculated above
-	#One row per box (labels an object in an image)
-	#Class labels come from labels.txt and are zero indexed -> so if you had labels:  dog  cat, dog's labelIndex would be 0, cat's label index would be 1.
-	#Each row's format is: labelIndex normalizedBoxCenterX normalizedBoxCenterY normalizedBoxWidth normalizedBoxHeight
-	
-	box = [labelIndex, normalizedBoxCenterX, normalizedBoxCenterY, normalizedBoxWidth, normalizedBoxHeight]
-	
-	return box
-	
-
-#I'll run this when saving the annotation file or when deleting a box.  When just adding a single box, I'll run addAnnotationFileBox() which opens the file in append mode.
-def setAnnotationFileBoxes(inputDirectory, imageFilename, imageWidth, imageHeight, boxes, labels):
-	annotationFileFullpath = getAnnotationFileName(inputDirectory, imageFilename)
-	with open(annotationFileFullpath, "w") as annotationFile:
-		for box in boxes:
-			box = calculateNormalizedBoxNumbers(box[0], box[1], box[2], box[3], box[4], imageWidth, imageHeight, labels)
-			line = getBoxWriteLine(box)
-			annotationFile.write(line)
-
-
-#TODO:  There's a "bug" where this function is getting / storing float values with higher precision than I'm getting later
-#when retrieving the boxes from file.  This results in the removeBox function chain not properly matching the floats with each other when they should be exactly equal...
-def addAnnotationFileBox(inputDirectory, imageFilename, imageWidth, imageHeight, box, labels):
-	annotationFileFullpath = getAnnotationFileName(inputDirectory, imageFilename)
-	box = calculateNormalizedBoxNumbers(box[0], box[1], box[2], box[3], box[4], imageWidth, imageHeight, labels)
-	line = getBoxWriteLine(box)
-	with open(annotationFileFullpath, "a") as annotationFile:
-		annotationFile.write(line)
-
-
-#Introduced fix for the precision not matching between storing and retrieving the normalized values (where retrieving is defined by changing normalized values back to screen coords):
-#See https://note.nkmk.me/en/python-math-isclose/  notes on rel-tol
-#print(math.isclose(1, 1.001, rel_tol=0.01))
-def removeBoxFromFile(inputDirectory, imageFilename, imageWidth, imageHeight, box, labels):
-	#Convert the box to normalized data
-	#Get the annotation file, copy all the data, iterate through all the lines, remove the line that matches the normalized box data line and exit
-	#print("in removeBoxFromFile")
-	normalizedBox = calculateNormalizedBoxNumbers(box[0], box[1], box[2], box[3], box[4], imageWidth, imageHeight, labels)
-	rawBox = getBoxWriteLine(normalizedBox)
-	rawBoxes = getRawBoxesFromAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight)
-	
-	boxLines = []
-	print("Scanning file:  box to match for deletion:")
-	print(rawBox + "\n")
-	
-	for boxLine in rawBoxes:
-		normalizedBoxFromFile = boxLine.split(' ')
-		
-		#Step through the two boxes comparing the rows:
-		if normalizedBoxFromFile[0] != str(normalizedBox[0]):
-			print("Not matched - label is different: " + boxLine)
-			boxLines.append(boxLine + "\n")
-			continue #Labels don't match, skip the rest of the comparisons for this box in the file
-		if not math.isclose(float(normalizedBoxFromFile[1]), float(normalizedBox[1]), rel_tol=0.00001):
-			print("Not matched - centroidX is different: " + boxLine)
-			boxLines.append(boxLine + "\n")
-			continue
-		if not math.isclose(float(normalizedBoxFromFile[2]), float(normalizedBox[2]), rel_tol=0.00001):
-			print("Not matched - centroidY is different: " + boxLine)
-			boxLines.append(boxLine + "\n")
-			continue
-		if not math.isclose(float(normalizedBoxFromFile[3]), float(normalizedBox[3]), rel_tol=0.00001):
-			print("Not matched - normalizedWidth is different: " + boxLine)
-			boxLines.append(boxLine + "\n")
-			continue
-		if not math.isclose(float(normalizedBoxFromFile[4]), float(normalizedBox[4]), rel_tol=0.00001):
-			print("Not matched - normalizedHeight is different: " + boxLine)
-			boxLines.append(boxLine + "\n")
-			continue
-			
-		print("Matched: " + boxLine + "\n")
-	
-	setRawBoxesToAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight, boxLines)
-	
-	return
-
-
-def removeBoxFromBoxesList(box, boxes):
-	#print("in removeBox, we have " + str(len(boxes)) + " boxes in the memory list")
-	boxesToRemove = []
-	for tempBox in boxes:
-		#sets are kind of neat
-		if len(box) == len(set(box).intersection(tempBox)):
-			boxesToRemove.append(tempBox)
-	
-	for tempBox in boxesToRemove:
-		boxes.remove(tempBox)
-		#Woood...woood...a good woody word...gooone....gooone...goooone.  Gone.
-	
-	#print("leaving removeBox, we have " + str(len(boxes)) + " boxes in the memory list")
-	return boxes
-
-
 def isItFlatRectangle(x1, y1, x2, y2):
 	if y2 - y1 == 0 or x2 - x1 == 0:
 		#print("y2 - y1: " + str(y2) + " - " + str(y1) + " = " + str(y2 - y1))
 		#print("x2 - x1: " + str(x2) + " - " + str(x1) + " = " + str(x2 - x1))
 		#Absolutely NO flat rectangles - no point!  There needs to be pixels in them thar hills for YOLO to do anything with them.
-		print("failed the flat rectangle test!")
+		log.debug("failed the flat rectangle test!")
 		return True
 	elif y2 - y1 == 0 and x2 - x1 == 0:
-		print("failed the flat rectangle test!")
+		log.debug("failed the flat rectangle test!")
 		return True
 		#For those of you who love to clickity click without moving the mouse, winter's coming, lol (yes I know I don't need this one, but it's funny)
 	else:
@@ -385,39 +284,58 @@ def isPointInsideBox(x1, y1, boxX1, boxY1, boxX2, boxY2):
 	return True
 
 
-def removeBox(x1, y1, inputDirectory,imageFilename, imageWidth, imageHeight, boxes, labels):
+#Sorted matches for the boxes x1, y1 is inside of:  [distance to top left corner, distance to bottom right corner, boxId], closest first.
+#The first one is the box 'd' deletes and the one that gets highlighted under the mouse.
+#The store's spatial index hands back only the boxes x1, y1 is actually inside of, so this never looks at the rest of the boxes on the image.
+def getBoxMatches(x1, y1, imageFilename, boxes, store):
 	#Find the boxes where boxX1 <= x1 and boxX2 >= x1 and boxY1 <= y1 and boxY2 >= y1
 	#If there are multiple boxes (you can be inside multiple boxes), find the box where the boxX1 & boxY1 are the closest to x1, y1.
-	#	Remove that box.  If there are multiple equidistant box upper left corners, then test for the closest lower right corner and remove that one...
+	#	If there are multiple equidistant box upper left corners, then test for the closest lower right corner...
 	boxMatches = []
-	for box in boxes:
-		if isPointInsideBox(x1, y1, box[1], box[2], box[3], box[4]):
-			#print("for (X,Y):(" + str(x1) + "," + str(y1) + "), found box match (X1, Y1, X2, Y2): (" + str(box[1]) +", " + str(box[2]) + ", " + str(box[3]) + ", " + str(box[4]) + ")")
-			distanceToTopLeftCorner = calculateDistanceBetweenPoints(x1, y1, box[1], box[2])
-			distanceToBottomRightCorner = calculateDistanceBetweenPoints(x1, y1, box[3], box[4])
-			boxMatch = [distanceToTopLeftCorner, distanceToBottomRightCorner, box]
-			boxMatches.append(boxMatch)
+	for boxId in store.getBoxIdsAt(imageFilename, x1, y1):
+		box = boxes[boxId]
+		#print("for (X,Y):(" + str(x1) + "," + str(y1) + "), found box match (X1, Y1, X2, Y2): (" + str(box[1]) +", " + str(box[2]) + ", " + str(box[3]) + ", " + str(box[4]) + ")")
+		distanceToTopLeftCorner = calculateDistanceBetweenPoints(x1, y1, box[1], box[2])
+		distanceToBottomRightCorner = calculateDistanceBetweenPoints(x1, y1, box[3], box[4])
+		boxMatch = [distanceToTopLeftCorner, distanceToBottomRightCorner, boxId]
+		boxMatches.append(boxMatch)
+
+	#https://docs.python.org/3/howto/sorting.html --> operator, itemgetter -> allows for sorting by multiple elements... itemgetter
+	return sorted(boxMatches, key=itemgetter(0, 1)) #by default they will be ascending, starting with the lowest values...itemgetter(0) for instance references to boxMatches[0]
+
+
+#The box 'd' would delete if you pressed it with the mouse at x1, y1 (or None)
+def getHoveredBox(x1, y1, imageFilename, boxes, store):
+	boxMatches = getBoxMatches(x1, y1, imageFilename, boxes, store)
+	if len(boxMatches) == 0:
+		return None
+	return boxes[boxMatches[0][2]]
+
+
+#boxes is the BoxArray (boxId -> box) from the AnnotationStore.  The box(es) are removed through the store, which takes care of the annotation file
+#(no more re-reading and fuzzy matching the file to find the line to take out).
+def removeBox(x1, y1, imageFilename, boxes, store):
+	boxMatches = getBoxMatches(x1, y1, imageFilename, boxes, store)
 	
-	print("Attempting to find boxes for removal:  There are " + str(len(boxMatches)) + " boxMatches!")
+	log.debug("Attempting to find boxes for removal:  There are " + str(len(boxMatches)) + " boxMatches!")
 	
 	if len(boxMatches) == 0:
-		print("No box found to delete - press 'd' with the mouse cursor inside a box to delete it")
+		log.info("No box found to delete - press 'd' with the mouse cursor inside a box to delete it")
 		return boxes
 	
 	elif len(boxMatches) == 1:
-		print("Sending this box for deletion (screen coords): " + boxMatches[0][2][0] + ", " + str(boxMatches[0][2][1]) + ", " + str(boxMatches[0][2][2]) + ", " + str(boxMatches[0][2][3]) + ", " + str(boxMatches[0][2][4]))
-		removeBoxFromFile(inputDirectory, imageFilename, imageWidth, imageHeight, boxMatches[0][2], labels)
+		box = boxes[boxMatches[0][2]]
+		log.debug("Deleting this box (class, image coords): " + str(box[0]) + ", " + str(box[1]) + ", " + str(box[2]) + ", " + str(box[3]) + ", " + str(box[4]))
+		store.removeBox(imageFilename, boxMatches[0][2])
 	
 	elif len(boxMatches) > 1:
 		#If there are somehow (!!) multiple boxes with the lowest values a matching distance, proceed to test distance between each boxX1, boxY1 and x1, y1
 		#If there are twins where those distances match and are the lowest values, they are duplicate boxes and are going bye bye
-		#https://docs.python.org/3/howto/sorting.html --> operator, itemgetter -> allows for sorting by multiple elements... itemgetter
-		matches = sorted(boxMatches, key=itemgetter(0, 1)) #by default they will be ascending, starting with the lowest values...itemgetter(0) for instance references to boxMatches[0]
-		print("Sorted matches: mouse distance to topleft, mouse distance to bottomright, label, boxX1, boxY1, boxX2, boxY2") 
-		#print("A match has " + str(len(matches[0])) + " elements")
+		matches = boxMatches
+		log.debug("Sorted matches: class, boxX1, boxY1, boxX2, boxY2")
 		for match in matches:
-			print("Matched XY (" + str(x1) + ", " + str(y1) + "): " + str(match[2][0]) + ", " + str(match[2][1]) + ", " + str(match[2][2]) + ", " + str(match[2][3]) + ", " + str(match[2][4]))
-		#print(matches)
+			box = boxes[match[2]]
+			log.debug("Matched XY (" + str(x1) + ", " + str(y1) + "): " + str(box[0]) + ", " + str(box[1]) + ", " + str(box[2]) + ", " + str(box[3]) + ", " + str(box[4]))
 		
 		#I'm going to be lazy here - you can delete up to two at once:
 		firstMatchDistanceTopLeft = matches[0][0]
@@ -426,15 +344,82 @@ def removeBox(x1, y1, inputDirectory,imageFilename, imageWidth, imageHeight, box
 		secondMatchDistanceBottomRight = matches[1][1]
 		if firstMatchDistanceTopLeft == secondMatchDistanceTopLeft and firstMatchDistanceBottomRight == secondMatchDistanceBottomRight:
 			#Sink both their battleships!  Walk the plank!
-			print("implement this never to be seen edge case")
-			removeBoxFromFile(inputDirectory, imageFilename, imageWidth, imageHeight, matches[1][2], labels)
+			store.removeBox(imageFilename, matches[1][2])
 
-		removeBoxFromFile(inputDirectory, imageFilename, imageWidth, imageHeight, matches[0][2], labels)
+		store.removeBox(imageFilename, matches[0][2])
 		
-	#Now to update the boxes list in memory so the deleted boxes don't keep getting displayed
-	boxes = getBoxesFromAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight, labels)
+	#The store removed them from the boxes dict in memory, so the deleted boxes don't keep getting displayed
+	return boxes
+
+
+#Deletes every box that is completely inside the region (the rubber band box when 'x' is pressed).
+def removeBoxesInside(regionX1, regionY1, regionX2, regionY2, imageFilename, boxes, store):
+	boxIds = store.getBoxIdsInside(imageFilename, regionX1, regionY1, regionX2, regionY2)
+	for boxId in boxIds:
+		store.removeBox(imageFilename, boxId)
+	log.info("Deleted " + str(len(boxIds)) + " boxes inside (" + str(regionX1) + ", " + str(regionY1) + ", " + str(regionX2) + ", " + str(regionY2) + ")")
 	return boxes
 
+
+#The detector's proposals for the image as (classId, x1, y1, x2, y2) image coords, minus the ones that are already a box and any with a class number not in labels.txt
+def getProposalBoxes(proposals, imageWidth, imageHeight, boxes, labelCount):
+	classIds, scores, normalized = proposals
+	pixels = normalizedToPixels(normalized, imageWidth, imageHeight)
+	boxClassIds, boxPixels = boxes.copyColumns()
+	keep = getUnlabeledProposals(classIds, pixels, boxClassIds, boxPixels) & (classIds >= 0) & (classIds < labelCount)
+	return [(classId, proposalX1, proposalY1, proposalX2, proposalY2) for classId, (proposalX1, proposalY1, proposalX2, proposalY2) in zip(classIds[keep].tolist(), pixels[keep].tolist())]
+
+
+#The proposal x1, y1 is inside of with the closest top left corner (same as which box 'd' picks), or None
+def getProposalAt(x1, y1, proposals):
+	matches = [(calculateDistanceBetweenPoints(x1, y1, proposal[1], proposal[2]), proposal) for proposal in proposals if isPointInsideBox(x1, y1, proposal[1], proposal[2], proposal[3], proposal[4])]
+	if len(matches) == 0:
+		return None
+	return min(matches, key=itemgetter(0))[1]
+
+
+#Runs in the prefetcher threads:  loads the image like always, then hands it to the detector so its proposals are (usually) ready by the time you get there
+def loadAndRequestProposals(loadFunction, proposalEngine, inputDirectory, imageFilename, frameSource):
+	entry = loadFunction(imageFilename)
+	if frameSource is not None:
+		proposalEngine.request(imageFilename, frame=frameSource.getFrame(getFrameNumber(imageFilename)))
+	else:
+		proposalEngine.request(imageFilename, imageFullpath=os.path.join(inputDirectory, imageFilename))
+	return entry
+
+
+#Runs in the prefetcher threads:  loads the image like always, then makes its grayscale pyramid for the box propagation so 's' doesn't wait on it
+def loadAndPrepareTracking(loadFunction, propagator, imageFilename):
+	entry = loadFunction(imageFilename)
+	propagator.prepare(imageFilename, entry[3].getLevel(0))
+	return entry
+
+
+#Puts the boxes from the image you just left onto the new one, moved to where the tracking says they went
+def propagateBoxes(propagator, previousFilename, previousPyramid, previousBoxes, imageFilename, imagePyramid, store):
+	startTime = time.perf_counter()
+	propagated, lost = propagator.propagate(previousFilename, previousPyramid.getLevel(0), imageFilename, imagePyramid.getLevel(0), previousBoxes)
+	for box in propagated:
+		store.addBox(imageFilename, box)	#also puts it in boxes
+	log.info("Propagated " + str(len(propagated)) + " boxes from " + str(previousFilename) + " (" + str(lost) + " lost) in " + str(int((time.perf_counter() - startTime) * 1000)) + "ms")
+
+
+#Called from the thumbnail builder thread after each batch of tiles - wakes the draw loop up (it sleeps in pygame.event.wait()) so the grid view redraws them
+def postThumbnailsReady(eventType, filenames, boxCounts):
+	try:
+		pygame.event.post(pygame.event.Event(eventType, filenames=filenames, boxCounts=boxCounts))
+	except pygame.error:
+		pass	#the window is already closed
+
+
+#Called from a detector pool thread - wakes the draw loop up (it sleeps in pygame.event.wait()) so the proposals get drawn
+def postProposalsReady(eventType, imageFilename):
+	try:
+		pygame.event.post(pygame.event.Event(eventType, imageFilename=imageFilename))
+	except pygame.error:
+		pass	#the window is already closed
+
+
 #Make sure that the values never get messed up by making negative rectangle widths and heights
 def adjustXYvalues(boxX1, boxY1, boxX2, boxY2):
 	#   IV    I			Cartesian Coordinate system
@@ -473,81 +458,94 @@ def adjustXYvalues(boxX1, boxY1, boxX2, boxY2):
 	return boxX1, boxY1, boxX2, boxY2
 
 
-#Convenience method for drawing rectangles on a pygame surface.
-#This doesn't need to return the surface in order for the surface to retain the changes
-def drawRectangle(surface, lineColorToDraw, lineDrawWidth, boxX1, boxY1, boxX2, boxY2, label, myfont):
-	#pygame.draw.rect(surface or array, rgb color in format (r, g, b), (x1, y1, rectangle width, rectangle height))
-	rectangleWidth = boxX2 - boxX1
-	rectangleHeight = boxY2 - boxY1
-			
-	#print("Drawing rectangle:  (x1, y1, width, height): (" + str(boxX1) + ", " + str(boxY1) + ", " + str(rectangleWidth) + ", " + str(rectangleHeight) + ")")
-	if rectangleWidth > 0 and rectangleHeight > 0:
-		pygame.draw.rect(surface, lineColorToDraw, (boxX1, boxY1, rectangleWidth, rectangleHeight), lineDrawWidth)
-	#if rectangleWidth <= 0:
-		#print("rectangleWidth <= 0")
-	#if rectangleHeight <= 0:
-		#print("rectangleHeight <= 0")
-	
-	#TODO blit the label - do the above with lines, make the top line have enough space in between in the middle for the fonted label
-	
-	
-#https://stackoverflow.com/questions/6444548/how-do-i-get-the-picture-size-with-pil
-#Could also do these with cv2:  https://python-code.dev/articles/110664770  #images would be numpy arrays in this case, could be important for optimizing (if needed later)
-#(note:  the drawLoop already seems to run pretty dang fast and this isn't a super heavy app, optimization may not be at all required)
-def getImage(inputDirectory, imageFilename):
-	image = Image.open(os.path.join(inputDirectory, imageFilename))
-	imageWidth, imageHeight = image.size
-	return image, imageWidth, imageHeight
-
-
-#To get the original image on surface:
-#scratchSurface = refreshSurface(imageCleanSurface)
-#To get the surface with already drawn boxes still on it - in order to draw a dynamic box every loop without always drawing all the boxes:
-#scratchSurface2 = refreshSurface(scratchSurface)
-def getSurfaceFromSurface(surfaceToRefreshFrom):
-	#data = pygame.image.tostring(imageCleanSurface, 'RGBA')
-	copyImage = pygame.image.tostring(surfaceToRefreshFrom, 'RGBA')
-	surfaceSize = surfaceToRefreshFrom.get_size()
-	
-	return pygame.image.fromstring(copyImage, surfaceSize, 'RGBA', False)	#returns a scratchSurface
+#Everything needed to show an image - this is what the prefetcher runs in its background threads, so no display calls in here.
+#The image is decoded exactly once (by pygame) and the size comes off the decoded surface.
+#The boxes are (classIds, normalized) numpy columns straight from the annotation file, the AnnotationStore turns them into image coords.
+#The smaller copies of the image needed to show it zoomed out to fit the window are made here too, so that's off the main thread as well.
+def loadDataset(inputDirectory, imageFilename, maxWindowSize):
+	imageCleanSurface = pygame.image.load(os.path.join(inputDirectory, imageFilename))
+	return getDatasetEntry(inputDirectory, imageFilename, imageCleanSurface, maxWindowSize)
 
 
-#TODO:  Work all potential bugs out with this
-def redrawAllBoxesOnScratchSurface(scratchSurface, boxes, boxColor, rectangleLineWidth, myfont):
-	if len(boxes) > 0:
-		for box in boxes:
-			drawRectangle(scratchSurface, boxColor, rectangleLineWidth, box[1], box[2], box[3], box[4], box[0], myfont)
-	
-	return scratchSurface
-	
+#Same as loadDataset(), but the image is a frame decoded from the video (imageFilename is the frameN.jpg name it will be exported as)
+def loadVideoFrame(frameSource, inputDirectory, imageFilename, maxWindowSize):
+	frame = frameSource.getFrame(getFrameNumber(imageFilename))
+	imageCleanSurface = pygame.image.frombuffer(frame.tobytes(), (frame.shape[1], frame.shape[0]), "BGR")  #OpenCV frames are BGR
+	return getDatasetEntry(inputDirectory, imageFilename, imageCleanSurface, maxWindowSize)
+
+
+def getDatasetEntry(inputDirectory, imageFilename, imageCleanSurface, maxWindowSize):
+	imageWidth, imageHeight = imageCleanSurface.get_size()
+	imagePyramid = ImagePyramid(imageCleanSurface)
+	windowWidth, windowHeight = getWindowSize(imageWidth, imageHeight, maxWindowSize)
+	imagePyramid.getLevel(imagePyramid.getLevelNumberForZoom(min(windowWidth / imageWidth, windowHeight / imageHeight)))
+	annotationFileFullpath = getAnnotationFileName(inputDirectory, imageFilename)
+	def onBadLine(lineNumber, problem):
+		log.warning(str(annotationFileFullpath) + " line " + str(lineNumber) + ":  " + problem + " - left out, changing this image's boxes writes the file without it")
+	boxes = readAnnotationFile(annotationFileFullpath, onBadLine) #just in case there are already annotations for this image...
+	return imageWidth, imageHeight, boxes, imagePyramid
+
+
+def getThumbnailSize(args):
+	try:
+		tileWidth, tileHeight = args.thumbnail_size.lower().split("x")
+		return max(8, int(tileWidth)), max(8, int(tileHeight))
+	except ValueError:
+		exit("--thumbnail-size should look like 160x90, got: " + str(args.thumbnail_size))
+
+
+#--window-size, or the screen size minus some room for the title bar / task bar
+def getMaxWindowSize(args):
+	if args.window_size is not None:
+		try:
+			windowWidth, windowHeight = args.window_size.lower().split("x")
+			return max(1, int(windowWidth)), max(1, int(windowHeight))
+		except ValueError:
+			exit("--window-size should look like 1920x1080, got: " + str(args.window_size))
+	desktopWidth, desktopHeight = pygame.display.get_desktop_sizes()[0]
+	return max(320, desktopWidth - 40), max(240, desktopHeight - 120)
 
-def prepNextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex):
+
+def prepNextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex, prefetcher, renderer, store, maxWindowSize):
 	boxes = []
-	image, imageWidth, imageHeight = None, None, None
+	imageWidth, imageHeight = None, None
 	
-	if len(filenamesList) > filenamesListOffset:
+	if filenamesList.waitFor(filenamesListOffset):	#the background discovery may not have got this far yet
 		imageFilename = filenamesList[filenamesListOffset]
-		image, imageWidth, imageHeight = getImage(inputDirectory, imageFilename)
+		#Usually already decoded in the background by the time you get here
+		imageWidth, imageHeight, (classIds, normalized), imagePyramid = prefetcher.get(filenamesListOffset)
+		#If you've been on this image before, the store already has its boxes (maybe with changes not written out yet) and those are used instead
+		boxes = store.open(imageFilename, getAnnotationFileName(inputDirectory, imageFilename), imageWidth, imageHeight, classIds, normalized)
 	else:
 		print("You've finished annotating all your available images, exiting.")
+		prefetcher.shutdown()
+		store.close()
 		exit()
-		
-	boxes = getBoxesFromAnnotationFile(inputDirectory, imageFilename, imageWidth, imageHeight, labels) #just in case there are already annotations for this image...
-	imageCleanSurface = pygame.image.load(imageFilename)
-	scratchSurface = getSurfaceFromSurface(imageCleanSurface)
 	
-	window = pygame.display.set_mode((imageWidth, imageHeight))
-	window.fill((0, 0, 0))
+	#Only touch the display mode when the window size actually changes - set_mode() recreates the window, and frames split from the same video are all the same size.
+	#Images bigger than maxWindowSize get a smaller window and are shown zoomed out (see viewport.py), the boxes stay in full resolution image pixels.
+	windowWidth, windowHeight = getWindowSize(imageWidth, imageHeight, maxWindowSize)
+	window = pygame.display.get_surface()
+	if window is None or window.get_size() != (windowWidth, windowHeight):
+		window = pygame.display.set_mode((windowWidth, windowHeight))
+		window.fill((0, 0, 0))
+		#Just being paranoid here about possible pygame window sizing issues (this used to be checked every frame, once per new window size is plenty)
+		size = pygame.display.Info() #x, y, width, height
+		if size.current_w != windowWidth or size.current_h != windowHeight:
+			print("Strange - the size from pygame.display.Info() is not the same as the window size!! - debugging needed.")
+	renderer.setImage(window, imagePyramid, boxes)
 	
 	label = labels[labelIndex]
 	pygame.display.set_caption('Pygame labeler. Current label: ' + label + ", image: " + imageFilename)
 	
-	return imageFilename, image, imageWidth, imageHeight, boxes, imageCleanSurface, scratchSurface, window, None, None, None, None
+	return imageFilename, imageWidth, imageHeight, boxes, imagePyramid, window, None, None, None, None
 
 
 #TODO:  Make this method much smaller later, once it's working, refactor out the draw stuff again
 #TODO:  MAJOR code cleanup here
-def drawLoop(filenamesList, inputDirectory, labels):
+#frameSource is a VideoFrameSource when labeling straight from a video (filenamesList is then the frameN.jpg names of the frames to label)
+#leaseManager is the --team LeaseManager (filenamesList is then a ClaimedFilenameList)
+def drawLoop(filenamesList, inputDirectory, labels, args, filenamesListOffset=0, datasetIndex=None, frameSource=None, leaseManager=None):
 	pygame.init()
 	
 	red = (255, 0, 0)
@@ -555,40 +553,100 @@ def drawLoop(filenamesList, inputDirectory, labels):
 	myfont = pygame.font.SysFont("monospace", 10)
 	
 	running = True
-	filenamesListOffset = 0
 	labelIndex = 0
 	label = labels[labelIndex]
 	counter = 0
-	showCount = False
-	
-	imageFilename, image, imageWidth, imageHeight, boxes, imageCleanSurface, scratchSurface, window, boxX1, boxY1, boxX2, boxY2 = prepNextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex)
-	scratchSurface = redrawAllBoxesOnScratchSurface(scratchSurface, boxes, red, rectangleLineWidth, myfont)
-
-	while running and image is not None:
-		if showCount:		#an indicator for how fast the drawLoop while is running
-			print("Frame: " + str(counter))
-			counter += 1
-		#Just being paranoid here about possible pygame window repositions by the user
-		size = pygame.display.Info() #x, y, width, height
-		displayWidth = size.current_w
-		displayHeight = size.current_h
-		if displayWidth != imageWidth:
-			print("Strange - size[2] from pygame.display.Info() is not the same as the image.size[2] (imageWidth) gotten from getImage()!! - debugging needed.")
-		if displayHeight != imageHeight:
-			print("Strange - size[3] from pygame.display.Info() is not the same as the image.size[3] (imageHeight) gotten from getImage()!! - debugging needed.")
-
-		for event in pygame.event.get():
+	panFrom = None	#screen position the middle mouse button drag was last at, while the image is being dragged around
+
+	profiler = Profiler(args.profile or args.profile_overlay or args.profile_trace is not None, keepTrace=args.profile_trace is not None)
+	overlayUpdated = 0	#when the --profile-overlay text was last redone
+
+	maxWindowSize = getMaxWindowSize(args)
+	loadFunction = lambda imageFilename: loadDataset(inputDirectory, imageFilename, maxWindowSize)
+	if frameSource is not None:
+		loadFunction = lambda imageFilename: loadVideoFrame(frameSource, inputDirectory, imageFilename, maxWindowSize)
+	loadFunction = profiler.wrap("imageLoad", loadFunction)	#in the prefetch threads, or on this one for a cache miss
+	nextDataset = profiler.wrap("nextImage", prepNextDataset)	#what 's' / 'p' cost on this thread, waiting on a load included
+	proposalEngine = None
+	proposalsReadyEvent = pygame.event.custom_type()
+	thumbnailsReadyEvent = pygame.event.custom_type()
+	thumbnailCache = None	#made the first time 'g' is pressed
+	gridView = None		#the grid overview, while it's up
+	shownProposalsFor = None	#the image whose proposals are on screen
+	if args.detector is not None:
+		if not os.path.isfile(args.detector) and ":" not in args.detector:
+			exit("--detector should be a model file or module:Class, got: " + str(args.detector))
+		detectorOptions = DetectorOptions(args.detector_input_size, args.proposal_threshold, args.nms_threshold, args.detector_format)
+		proposalEngine = ProposalEngine(args.detector, os.path.join(inputDirectory, ".pygamelabeler-proposals"), detectorOptions, args.detector_workers,
+			lambda readyFilename: postProposalsReady(proposalsReadyEvent, readyFilename))
+		loadImage = loadFunction
+		loadFunction = lambda imageFilename: loadAndRequestProposals(loadImage, proposalEngine, inputDirectory, imageFilename, frameSource)
+	propagator = None
+	if args.propagate:
+		propagator = BoxPropagator(maxImages=args.prefetch_ahead + args.prefetch_behind + 2, searchMargin=args.propagate_margin, minMatchScore=args.propagate_min_score)
+		loadUntracked = loadFunction
+		loadFunction = lambda imageFilename: loadAndPrepareTracking(loadUntracked, propagator, imageFilename)
+	prefetcher = ImagePrefetcher(filenamesList, loadFunction, args.prefetch_ahead, args.prefetch_behind, args.cache_mb * 1024 * 1024, args.prefetch_workers)
+	renderer = LayeredRenderer(red, rectangleLineWidth, myfont, profiler=profiler, labels=labels, showLabelText=not args.no_label_text)
+	onWrite = None
+	if datasetIndex is not None:
+		onWrite = datasetIndex.updateAnnotation
+	if leaseManager is not None:
+		onWrite = lambda imageFilename, annotationFileFullpath, boxCount: leaseManager.annotationWritten(imageFilename)	#gives the lease back if you've moved on
+	store = AnnotationStore(args.flush_delay, onWrite, profiler, detectConflicts=leaseManager is not None)
+	
+	imageFilename, imageWidth, imageHeight, boxes, imagePyramid, window, boxX1, boxY1, boxX2, boxY2 = nextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex, prefetcher, renderer, store, maxWindowSize)
+	leasedImageFilename = imageFilename	#--team:  the image whose lease is held for the window
+
+	clock = pygame.time.Clock()
+	sessionWallStart = time.perf_counter()
+	sessionCpuStart = time.process_time()
+
+	while running:
+		counter += 1
+
+		#Nothing on screen changes unless you do something, except for the rubber band box following the mouse.
+		#So unless a box is being dragged out, sleep in pygame.event.wait() until there's input (0% cpu while you're looking at an image),
+		#and while one is being dragged out, don't redraw faster than args.fps.
+		dragging = boxX1 is not None and boxX2 == None
+		if dragging or args.idle_mode == 'poll':
+			clock.tick(args.fps if dragging else 0)
+			events = pygame.event.get()
+		else:
+			events = [pygame.event.wait()] + pygame.event.get()
+			clock.tick()	#keeps the clock from counting the time spent waiting as one long frame once dragging starts
+		frameStart = time.perf_counter()	#--profile:  everything from here to the end of render() is this frame's work (the waiting above isn't)
+
+		for event in events:
 		
 			if event.type == pygame.QUIT:
 				running = False
 
+			#The grid overview gets all the input while it's up
+			if gridView is not None:
+				if event.type == thumbnailsReadyEvent:
+					gridView.tilesReady(event.filenames, event.boxCounts)
+				openPosition = gridView.handleEvent(event)
+				if openPosition is not None or gridView.wantsClose:
+					gridView = None
+					if openPosition is not None and openPosition != filenamesListOffset:
+						store.requestFlush(imageFilename)
+						filenamesListOffset = openPosition
+						imageFilename, imageWidth, imageHeight, boxes, imagePyramid, window, boxX1, boxY1, boxX2, boxY2 = nextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex, prefetcher, renderer, store, maxWindowSize)
+						shownProposalsFor = None	#setImage() cleared the proposals, show the new image's once they're ready
+					else:
+						renderer.setBoxes(boxes)	#the whole window gets drawn again
+						pygame.display.set_caption('Pygame labeler. Current label: ' + label + ", image: " + imageFilename)
+				continue
+
 			#https://stackoverflow.com/questions/10990137/pygame-mouse-clicking-detection
 			if event.type == pygame.MOUSEBUTTONDOWN and pygame.mouse.get_focused():
 				#print("received mouse click")
 			
 				if event.button == 1:  # left click
 				
-					pos = pygame.mouse.get_pos()
+					pos = event.pos  #where the click happened - pygame.mouse.get_pos() is where the mouse is now, which can be further along if several events came in at once
+					pos = renderer.viewport.screenToImage(pos[0], pos[1])  #boxes are in full resolution image pixels, whatever the zoom
 						
 					if boxX1 is not None and boxX2 == None:
 						#This will add a box to the screen, to the boxes list, and to the annotation file
@@ -606,11 +664,10 @@ def drawLoop(filenamesList, inputDirectory, labels):
 							rectWidth = boxX2 - boxX1
 							rectHeight = boxY2 - boxY1
 
-							boxList = [label, boxX1, boxY1, boxX2, boxY2]  #Now it's a list of lists, so more debugging down the method chain will be required
-							addAnnotationFileBox(inputDirectory, imageFilename, imageWidth, imageHeight, boxList, labels)
-							boxes.append(boxList)
-							#because we're adding a box, I don't need to refresh scratch surface...only need to do that before drawing if we're removing a box
-							drawRectangle(scratchSurface, red, rectangleLineWidth, boxX1, boxY1, boxX2, boxY2, label, myfont)
+							box = (labelIndex, boxX1, boxY1, boxX2, boxY2)  #the class is stored by its index in labels.txt
+							store.addBox(imageFilename, box)	#also puts it in boxes, the annotation file gets written in the background
+							#because we're adding a box, I don't need to rebuild the box overlay...only need to do that if we're removing a box
+							renderer.addBox(box)
 						
 							boxX1, boxY1, boxX2, boxY2 = None, None, None, None    #Clear out the tracking values for the next rectangle
 							
@@ -623,81 +680,333 @@ def drawLoop(filenamesList, inputDirectory, labels):
 
 				#if event.button == 2:  # middle-click    #TODO:  Add this later and test/debug
 				#	removeNearestBox()  #Actually, I'm having second thoughts - this is too close an action to the scroll wheel to change labels
+				if event.button == 2:  # middle-click --> hold it down and drag to move around a zoomed in image
+					panFrom = event.pos
 
 				if event.button == 3:  # right-click --> clear the set box positions
 					boxX1, boxY1, boxX2, boxY2 = None, None, None, None
 
-				if event.button == 4:  # scroll-up
+				zooming = event.button in (4, 5) and pygame.key.get_mods() & pygame.KMOD_CTRL
+				if zooming:  # Ctrl + scroll --> zoom in (up) or out (down) around the mouse cursor
+					zoomFactor = args.zoom_step
+					if event.button == 5:
+						zoomFactor = 1 / args.zoom_step
+					if renderer.viewport.zoomAt(event.pos[0], event.pos[1], zoomFactor):
+						renderer.viewChanged()
+
+				if event.button == 4 and not zooming:  # scroll-up
 					#Change label previous (if not already #1)
 					if labelIndex != 0:    #You can't go back from 0.  If you see -1 in the annotation file for the class, then there's a bug.
 						labelIndex -= 1
 						label = labels[labelIndex]
 						pygame.display.set_caption('Pygame labeler. Current label: ' + label + ", image: " + imageFilename)
-						print("Changed label to " + label + ", label index: " + str(labelIndex))
+						log.info("Changed label to " + label + ", label index: " + str(labelIndex))
+						renderer.setCurrentClass(labelIndex)
 					else:
-						print("You can't go back in labels any more, you are at the first one.")
+						log.info("You can't go back in labels any more, you are at the first one.")
 
-				if event.button == 5:  # scroll-down
+				if event.button == 5 and not zooming:  # scroll-down
 					#Change label next (if not at end)
 					if len(labels) > labelIndex + 1:
 						labelIndex += 1
 						label = labels[labelIndex]
 						pygame.display.set_caption('Pygame labeler. Current label: ' + label + ", image: " + imageFilename)
-						print("Changed label to " + label + ", label index: " + str(labelIndex))
+						log.info("Changed label to " + label + ", label index: " + str(labelIndex))
+						renderer.setCurrentClass(labelIndex)
 					else:
-						print("You cannot go forward through labels any more, you are at the last one.")
+						log.info("You cannot go forward through labels any more, you are at the last one.")
+
+			if event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+				panFrom = None
+
+			if event.type == proposalsReadyEvent and event.imageFilename == imageFilename:
+				shownProposalsFor = None	#draw them below
+
+			if event.type == pygame.MOUSEMOTION and panFrom is not None:
+				if renderer.viewport.pan(event.pos[0] - panFrom[0], event.pos[1] - panFrom[1]):
+					renderer.viewChanged()
+				panFrom = event.pos
 
 			#handle keyboard button presses:
 			if event.type == pygame.KEYDOWN:
 				if event.key == pygame.K_q:
 					print("Goodbye!")
-					exit("q key pressed, quitting.")
+					running = False
 					
 				if event.key == pygame.K_s:
-					filenamesListOffset += 1
-					imageFilename, image, imageWidth, imageHeight, boxes, imageCleanSurface, scratchSurface, window, boxX1, boxY1, boxX2, boxY2 = prepNextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex)
-					scratchSurface = redrawAllBoxesOnScratchSurface(scratchSurface, boxes, red, rectangleLineWidth, myfont)
+					store.markVisited(imageFilename)
+					store.requestFlush(imageFilename)
+					if filenamesList.waitFor(filenamesListOffset + 1):
+						filenamesListOffset += 1
+						previousFilename, previousPyramid, previousBoxes = imageFilename, imagePyramid, list(boxes)
+						imageFilename, imageWidth, imageHeight, boxes, imagePyramid, window, boxX1, boxY1, boxX2, boxY2 = nextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex, prefetcher, renderer, store, maxWindowSize)
+						shownProposalsFor = None	#setImage() cleared the proposals, show the new image's once they're ready
+						#Only onto images nobody has labeled yet - an empty annotation file means "nothing in this one" and is left alone
+						if propagator is not None and len(previousBoxes) > 0 and len(boxes) == 0 and not os.path.exists(getAnnotationFileName(inputDirectory, imageFilename)):
+							propagateBoxes(propagator, previousFilename, previousPyramid, previousBoxes, imageFilename, imagePyramid, store)
+							renderer.setBoxes(boxes)
+					elif leaseManager is not None and not filenamesList.complete:
+						print("Nothing to claim right now, other labelers have the rest of the images (" + str(filenamesList.othersLeased) + ").  Press 's' again in a bit "
+							+ "for the ones they give back or whose leases run out, or 'q' to quit.")
+					else:
+						print("You've finished annotating all your available images, exiting.")
+						running = False
+
+				if event.key == pygame.K_p:
+					if filenamesListOffset > 0:
+						store.requestFlush(imageFilename)
+						filenamesListOffset -= 1
+						imageFilename, imageWidth, imageHeight, boxes, imagePyramid, window, boxX1, boxY1, boxX2, boxY2 = nextDataset(filenamesList, inputDirectory, filenamesListOffset, labels, labelIndex, prefetcher, renderer, store, maxWindowSize)
+						shownProposalsFor = None	#setImage() cleared the proposals, show the new image's once they're ready
+					else:
+						print("You're already on the first image.")
 					
+				if event.key == pygame.K_a:
+					#Accept the proposal (blue box) under the mouse, or all of them with shift
+					pos = renderer.viewport.screenToImage(*pygame.mouse.get_pos())
+					accepted = [getProposalAt(pos[0], pos[1], renderer.proposals)]
+					if event.mod & pygame.KMOD_SHIFT:
+						accepted = list(renderer.proposals)
+					accepted = [proposal for proposal in accepted if proposal is not None]
+					for box in accepted:
+						store.addBox(imageFilename, box)
+					if len(accepted) > 0:
+						renderer.setProposals([proposal for proposal in renderer.proposals if proposal not in accepted])	#redraws the overlay with the new boxes too
+					elif proposalEngine is not None:
+						print("Put the mouse inside a blue box to accept it ('a'), or press Shift + 'a' to accept all of them.")
+
+				if event.key == pygame.K_c:
+					#Only the current label's boxes in color, or back to all of them
+					if renderer.toggleClassHighlight():
+						log.info("Showing only the " + label + " boxes in color (scroll to change the label, 'c' again for all of them)")
+					else:
+						log.info("Showing all the boxes in color")
+
+				if event.key == pygame.K_g:
+					if frameSource is not None:
+						print("The grid overview only works on a directory of images, not a video.")
+					else:
+						if thumbnailCache is None:
+							tileWidth, tileHeight = getThumbnailSize(args)
+							storeDirectory = getPersonalStoreDirectory(inputDirectory) if leaseManager is not None else None	#--team:  not on the shared drive
+							thumbnailCache = ThumbnailCache(inputDirectory, tileWidth, tileHeight, onReady=lambda filenames, boxCounts: postThumbnailsReady(thumbnailsReadyEvent, filenames, boxCounts),
+								storeDirectory=storeDirectory, countBoxes=True)
+							thumbnailCache.buildAll(filenamesList)	#the rest of them in the background after the ones on screen
+						store.flush()
+						thumbnailCache.setBoxCounts(store.getWrittenBoxCounts())	#the images you've labeled since the cache counted them
+						boxX1, boxY1, boxX2, boxY2 = None, None, None, None
+						gridView = GridView(window, filenamesList, thumbnailCache, filenamesListOffset, myfont)
+						pygame.display.set_caption("Overview:  click an image to label it, 'g' to go back")
+
+				if event.key == pygame.K_f:
+					#Back to the whole image in the window
+					renderer.viewport.fitToWindow()
+					renderer.viewChanged()
+
 				if event.key == pygame.K_d:
-					pos = pygame.mouse.get_pos()
+					pos = renderer.viewport.screenToImage(*pygame.mouse.get_pos())
 					#Now we're going headhunting for a box to eliminate
-					boxes = removeBox(pos[0], pos[1], inputDirectory, imageFilename, imageWidth, imageHeight, boxes, labels)
-					#Clear out scratchSurface first to make sure the deleted box goes away, then redraw all boxes on it
-					scratchSurface = getSurfaceFromSurface(imageCleanSurface)
-					scratchSurface = redrawAllBoxesOnScratchSurface(scratchSurface, boxes, red, rectangleLineWidth, myfont)
+					boxes = removeBox(pos[0], pos[1], imageFilename, boxes, store)
+					#Rebuild the box overlay from the clean image to make sure the deleted box goes away
+					renderer.setBoxes(boxes)
 
+				if event.key == pygame.K_x:
+					#Delete everything inside the box you're dragging out instead of adding it
+					if boxX1 is not None and boxX2 == None:
+						pos = renderer.viewport.screenToImage(*pygame.mouse.get_pos())
+						regionX1, regionY1, regionX2, regionY2 = adjustXYvalues(boxX1, boxY1, pos[0], pos[1])
+						boxes = removeBoxesInside(regionX1, regionY1, regionX2, regionY2, imageFilename, boxes, store)
+						renderer.setBoxes(boxes)
+						boxX1, boxY1, boxX2, boxY2 = None, None, None, None
+					else:
+						print("Left click one corner first, then press 'x' with the mouse at the other corner to delete all the boxes inside.")
+
+
+		if profiler.enabled:
+			profiler.record("events", frameStart, time.perf_counter())
 
-		#Redraws the dynamic box onto scratchSurface2 every time through the loop, refreshing it from scratch surface each time first.
-		#This way only one box has to be drawn in the loop with the most refreshes, and scratch surface is only redrawn with all boxes when a box is added or removed.
-		#In this way, the annotator will be fast no matter how many boxes someone draws, only slowing down AFTER the second click is recorded to add a box, or AFTER d is pressed,
-		#meaning that it won't slow down in the main draw loop so much that mouse positions aren't correctly recorded correctly.
-		scratchSurface2 = getSurfaceFromSurface(scratchSurface)
+		#--team:  the lease on the image you just left goes back once its annotation file is written, not while you're still on it
+		if leaseManager is not None and imageFilename != leasedImageFilename:
+			leaseManager.releaseWhenWritten(leasedImageFilename, not store.isDirty(leasedImageFilename) and os.path.exists(getAnnotationFileName(inputDirectory, leasedImageFilename)))
+			leaseManager.cancelRelease(imageFilename)
+			leasedImageFilename = imageFilename
+
+		if gridView is not None:
+			gridView.render()
+			if profiler.enabled:
+				profiler.record("frame", frameStart, time.perf_counter())
+			continue
+
+		#Only the dynamic box (rubber band) is drawn every time through the loop, straight onto the window - the boxes overlay is only rebuilt when a box is removed.
+		#In this way, the annotator will be fast no matter how many boxes someone draws or how big the image is, and only the pixels the rubber band
+		#covered / covers now get sent to the screen, meaning that it won't slow down in the main draw loop so much that mouse positions aren't recorded correctly.
 		
 		#Draw the dynamic box lines (to show the user where a box will be placed once they left-click once and before they left-click again to place it.
 		if boxX1 is not None and boxY1 is not None and boxX2 == None and boxY2 == None:			
-			pos = pygame.mouse.get_pos()
+			pos = renderer.viewport.screenToImage(*pygame.mouse.get_pos())
 			tempX1 = boxX1
 			tempY1 = boxY1
 			mouseX = pos[0]
 			mouseY = pos[1]
 			tempX1, tempY1, mouseX, mouseY = adjustXYvalues(tempX1, tempY1, mouseX, mouseY)
-			drawRectangle(scratchSurface2, red, rectangleLineWidth, tempX1, tempY1, mouseX, mouseY, label, myfont)
+			renderer.setRubberBand(labelIndex, tempX1, tempY1, mouseX, mouseY)
+			renderer.setHighlight(None)
+		else:
+			renderer.clearRubberBand()
+			#Highlight the box 'd' would delete
+			pos = renderer.viewport.screenToImage(*pygame.mouse.get_pos())
+			renderer.setHighlight(getHoveredBox(pos[0], pos[1], imageFilename, boxes, store))
+
+		#The detector's proposals, once they're ready for the image you're on
+		if proposalEngine is not None and shownProposalsFor != imageFilename:
+			proposals = proposalEngine.get(imageFilename)
+			if proposals is not None:
+				renderer.setProposals(getProposalBoxes(proposals, imageWidth, imageHeight, boxes, len(labels)))
+				shownProposalsFor = imageFilename
+
+		if args.profile_overlay and time.perf_counter() - overlayUpdated > 0.5:
+			renderer.setStatusLines(["%-12s %6s %6s %6s" % ("ms", "p50", "p95", "p99")] + profiler.getOverlayLines())
+			overlayUpdated = time.perf_counter()
+		renderer.render()
+		if profiler.enabled:
+			profiler.record("frame", frameStart, time.perf_counter())
+
+	prefetcher.shutdown()
+	if proposalEngine is not None:
+		proposalEngine.shutdown()
+	if thumbnailCache is not None:
+		thumbnailCache.close()
+	store.close()	#writes out anything the background writer hasn't gotten to yet
+	if datasetIndex is not None:
+		datasetIndex.close()
+	pygame.quit()
+	printSessionStats(time.perf_counter() - sessionWallStart, time.process_time() - sessionCpuStart, counter)
+	if profiler.enabled:
+		profiler.printSummary()
+	if args.profile_trace is not None:
+		profiler.writeChromeTrace(args.profile_trace)
 
-		window.blit(scratchSurface2, (0, 0))  #Only need one of these (though I'm not sure, may need separate ones for the font operations)
-		pygame.display.flip()
 
-	pygame.quit()
+#cpu time includes the background decode threads, so it's the whole cost of the labeling session, not just the draw loop.
+def printSessionStats(wallSeconds, cpuSeconds, framesDrawn):
+	cpuPercent = 0
+	if wallSeconds > 0:
+		cpuPercent = 100 * cpuSeconds / wallSeconds
+	print("Session:  " + str(round(wallSeconds, 1)) + "s wall clock, " + str(round(cpuSeconds, 1)) + "s cpu (" + str(round(cpuPercent, 1)) + "% of one core), " + str(framesDrawn) + " loop iterations.")
 	
 
-def main():
-	inputDirectory = Path(getInputDirectory())
+def refreshDatasetIndex(datasetIndex, filenamesList):
+	updated = datasetIndex.refresh(filenamesList.waitUntilComplete())
+	if updated is None:
+		return	#the labeler was closed before the listing finished
+	total, labeled, withBoxes = datasetIndex.getCounts()
+	print("Dataset index: " + str(total) + " images, " + str(labeled) + " labeled (" + str(withBoxes) + " with boxes), " + str(updated) + " re-read since last time.")
+
+
+#Labels frames straight out of a video file:  nothing is written but the annotation files while you label, then the frames you labeled
+#are exported as images (frameN.jpg next to frameN.txt, same as splitvid.py names them) in one go when you quit.
+def labelVideo(args):
+	try:
+		frameSource = VideoFrameSource(args.input, args.video_cache_mb * 1024 * 1024)
+	except OSError as e:
+		exit(str(e))
+	if frameSource.framesPerSecond <= 0:
+		exit("Could not get the frame rate of " + str(args.input))
+	frameNumbers = getFrameNumbers(args, frameSource.framesPerSecond, frameSource.frameCount)
+	frameSource.setWantedFrames(frameNumbers)
+	print("Video: " + str(args.input) + ", " + str(frameSource.frameCount) + " frames at " + str(round(frameSource.framesPerSecond, 2)) + " fps, labeling " + str(len(frameNumbers)) + " of them.")
+
+	outputDirectory = Path(args.output or os.path.dirname(os.path.abspath(args.input)))
+	os.makedirs(outputDirectory, exist_ok=True)
+	print("Annotation files go in: " + str(outputDirectory))
+	labels = getLabels(outputDirectory, "labels.txt")
+
+	filenamesList = StreamingFilenameList([getFrameFilename(frameNumber, args.export_format) for frameNumber in frameNumbers])
+	filenamesListOffset = 0
+	if args.start_at_unlabeled:
+		filenamesListOffset = next((position for position, filename in enumerate(filenamesList) if not os.path.exists(getAnnotationFileName(outputDirectory, filename))), None)
+		if filenamesListOffset is None:
+			print("Every frame already has an annotation file, starting at the first one.")
+			filenamesListOffset = 0
+
+	if filenamesList.waitFor(0):
+		drawLoop(filenamesList, outputDirectory, labels, args, filenamesListOffset, None, frameSource)
+	else:
+		print("Sorry, no frames in that range of the video.")
+	frameSource.release()
 
-	filenamesList = getInputFilenames(inputDirectory)
+	if not args.no_export:
+		exportLabeledFrames(args.input, frameNumbers, outputDirectory, args.export_format, args.export_quality, args.export_workers)
+
+
+#--team:  only the images this labeler has claimed (see workqueue.py), more are claimed as you go
+def labelAsTeam(args, inputDirectory, filenamesList, labels):
+	leaseManager = LeaseManager(inputDirectory, args.lease_minutes * 60)
+	isDone = lambda imageFilename: os.path.exists(getAnnotationFileName(inputDirectory, imageFilename))
+	claimedList = ClaimedFilenameList(leaseManager, filenamesList, isDone, max(1, args.claim_batch), args.prefetch_ahead + 2, min(60, args.lease_minutes * 20))
+	try:
+		if claimedList.waitFor(0):
+			drawLoop(claimedList, inputDirectory, labels, args, 0, None, None, leaseManager)
+		else:
+			print("Nothing left to label:  every image has an annotation file or another labeler is on it (their images come back if they quit, "
+				+ "or --lease-minutes after they crash - try again then).")
+	finally:
+		claimedList.close()
+		leaseManager.close()	#gives back the images you didn't get to
+
+
+def main():
+	args = getArguments()
+	logging.basicConfig(format="%(message)s", level=getattr(logging, args.log_level.upper()))
+	if not args.docs and os.path.isfile(args.input):
+		if args.filter != 'all':
+			exit("--filter only works on a directory of images, not a video.")
+		if args.team:
+			exit("--team only works on a directory of images, not a video.")
+		labelVideo(args)
+		return
+
+	inputDirectory = Path(getInputDirectory(args))
+
+	#Starts listing the directory in a background thread, the first image can be shown as soon as it's found
+	filenames = iterInputFilenames(inputDirectory, args.recursive, args.order)
+	if args.hide_duplicates is not None:
+		filenames = iterUniqueFilenames(inputDirectory, filenames, args.hide_duplicates)	#hashed in the same background thread, a batch at a time
+	filenamesList = StreamingFilenameList(filenames)
 
 	labels = getLabels(inputDirectory, "labels.txt")
 
-	if len(filenamesList) > 0:
-		drawLoop(filenamesList, inputDirectory, labels)
+	if args.team:
+		if args.filter != 'all' or args.start_at_unlabeled:
+			exit("--team only hands out unlabeled images already, leave out --filter / --start-at-unlabeled.")
+		labelAsTeam(args, inputDirectory, filenamesList, labels)
+		return
+
+	filenamesListOffset = 0
+	datasetIndex = None
+	if not args.no_index:
+		datasetIndex = DatasetIndex(inputDirectory)
+		if args.filter == 'all' and not args.start_at_unlabeled:
+			#Nothing needs the index before the first image is up, so bring it up to date in the background once the listing is done
+			threading.Thread(target=refreshDatasetIndex, args=(datasetIndex, filenamesList), name="index-refresh", daemon=True).start()
+		else:
+			refreshDatasetIndex(datasetIndex, filenamesList)
+		if args.filter != 'all':
+			filenamesList = StreamingFilenameList(datasetIndex.getFilenames(args.filter))
+		if args.start_at_unlabeled:
+			if args.filter == 'all':
+				filenamesListOffset = datasetIndex.getFirstUnlabeledPosition()
+			else:
+				unlabeledFilenames = set(datasetIndex.getFilenames('unlabeled'))
+				filenamesListOffset = next((position for position, filename in enumerate(filenamesList) if filename in unlabeledFilenames), None)
+			if filenamesListOffset is None:
+				print("Every image already has an annotation file, starting at the first one.")
+				filenamesListOffset = 0
+	elif args.filter != 'all' or args.start_at_unlabeled:
+		exit("--filter and --start-at-unlabeled need the dataset index (don't use --no-index).")
+
+	if filenamesList.waitFor(0):
+		drawLoop(filenamesList, inputDirectory, labels, args, filenamesListOffset, datasetIndex)
 
 	else:
 		print("Sorry, the input directory is empty of recognized image files.")
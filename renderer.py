@@ -0,0 +1,324 @@
+import pygame
+from viewport import Viewport
+from profiler import Profiler
+
+
+#Convenience method for drawing rectangles on a pygame surface.
+#This doesn't need to return the surface in order for the surface to retain the changes
+def drawRectangle(surface, lineColorToDraw, lineDrawWidth, boxX1, boxY1, boxX2, boxY2, label, myfont):
+	#pygame.draw.rect(surface or array, rgb color in format (r, g, b), (x1, y1, rectangle width, rectangle height))
+	rectangleWidth = boxX2 - boxX1
+	rectangleHeight = boxY2 - boxY1
+
+	#print("Drawing rectangle:  (x1, y1, width, height): (" + str(boxX1) + ", " + str(boxY1) + ", " + str(rectangleWidth) + ", " + str(rectangleHeight) + ")")
+	if rectangleWidth > 0 and rectangleHeight > 0:
+		pygame.draw.rect(surface, lineColorToDraw, (boxX1, boxY1, rectangleWidth, rectangleHeight), lineDrawWidth)
+	#if rectangleWidth <= 0:
+		#print("rectangleWidth <= 0")
+	#if rectangleHeight <= 0:
+		#print("rectangleHeight <= 0")
+	#The label text goes on as a tag from the LabelAtlas (see LayeredRenderer.setBoxes()), label / myfont aren't used here any more
+
+
+#A different color for each class, the same every time:  hues a golden ratio turn apart don't land near each other for a long while,
+#and class 0 starts at the red every box used to be.
+def getClassColors(classCount, saturation=85, value=100):
+	colors = []
+	for classId in range(classCount):
+		color = pygame.Color(0, 0, 0)
+		color.hsva = ((classId * 137.508) % 360, saturation, value, 100)
+		colors.append((color.r, color.g, color.b))
+	return colors
+
+
+#Black text on light tags, white on dark ones
+def getTextColor(backgroundColor):
+	red, green, blue = backgroundColor[:3]
+	if 0.299 * red + 0.587 * green + 0.114 * blue > 150:
+		return (0, 0, 0)
+	return (255, 255, 255)
+
+
+#Every label's name tag (the text on a filled rectangle in the class color) rendered once, all stacked into one surface.  Drawing a box's tag is
+#then a blit of its rect out of the atlas - font.render() is slow, and an overlay rebuild with 2,000 boxes would otherwise call it 2,000 times.
+#Class ids that aren't in labels.txt get a tag with the number, rendered the first time one shows up.
+class LabelAtlas:
+	def __init__(self, labels, myfont, colors, unknownColor=(128, 128, 128)):
+		self.myfont = myfont
+		self.colors = colors
+		self.unknownColor = unknownColor
+		tags = [self.renderTag(str(label), colors[classId]) for classId, label in enumerate(labels)]
+		self.atlas = pygame.Surface((max([tag.get_width() for tag in tags] + [1]), max(1, sum(tag.get_height() for tag in tags))))
+		self.rects = []
+		y = 0
+		for tag in tags:
+			self.rects.append(self.atlas.blit(tag, (0, y)))
+			y += tag.get_height()
+		if pygame.display.get_surface() is not None:
+			self.atlas = self.atlas.convert()	#same pixel format as the window, so the blits are plain copies
+		self.unknownTags = {}	#classId -> its own surface
+
+
+	def renderTag(self, text, color):
+		textSurface = self.myfont.render(text, True, getTextColor(color))
+		tag = pygame.Surface((textSurface.get_width() + 4, textSurface.get_height()))
+		tag.fill(color)
+		tag.blit(textSurface, (2, 0))
+		return tag
+
+
+	def getColor(self, classId):
+		if 0 <= classId < len(self.colors):
+			return self.colors[classId]
+		return self.unknownColor
+
+
+	#(surface, area of it) to blit for classId's tag
+	def getTag(self, classId):
+		if 0 <= classId < len(self.rects):
+			return self.atlas, self.rects[classId]
+		tag = self.unknownTags.get(classId)
+		if tag is None:
+			tag = self.unknownTags[classId] = self.renderTag(str(classId), self.unknownColor)
+		return tag, tag.get_rect()
+
+
+#The four thin rectangles that a box outline covers on screen.  These are the only pixels that change when the rubber band box moves,
+#so for a big box this is a lot less than its whole area.
+def getOutlineRects(boxX1, boxY1, boxX2, boxY2, lineDrawWidth):
+	rectangleWidth = boxX2 - boxX1
+	rectangleHeight = boxY2 - boxY1
+	if rectangleWidth <= 0 or rectangleHeight <= 0:
+		return []
+	return [pygame.Rect(boxX1, boxY1, rectangleWidth, lineDrawWidth),
+		pygame.Rect(boxX1, boxY2 - lineDrawWidth, rectangleWidth, lineDrawWidth),
+		pygame.Rect(boxX1, boxY1, lineDrawWidth, rectangleHeight),
+		pygame.Rect(boxX2 - lineDrawWidth, boxY1, lineDrawWidth, rectangleHeight)]
+
+
+#Draws the labeling window in three layers so the whole image never has to be copied while you're just moving the mouse:
+#	1.  background - the part of the image that's on screen, scaled through the viewport (see viewport.py) and converted once to the display's
+#	    pixel format so blits from it are fast.  Only rebuilt when you zoom or pan.
+#	2.  overlay - a copy of the background with all the saved boxes (and the detector's proposals, in blue) drawn on it.  Only rebuilt when a box is removed or the view changes (adding a box just draws it on top).
+#	3.  outlines - the box that follows the mouse between the first and second click (the rubber band) and the highlight on the box under the mouse.
+#	    They're drawn straight onto the window, and when they change only their old outlines are patched back from the overlay and only
+#	    the old + new outlines are sent to pygame.display.update(rects).
+#Boxes come in as full resolution image coords, they're only mapped to the screen here.
+#The --profile-overlay text goes on top of everything, straight onto the window like the outlines.
+#
+#Each class has its own color (the boxes, their name tags and the rubber band), from labels.txt order.  With the class highlight on ('C'),
+#only the current class's boxes are drawn in color with their tags and the rest are dimmed, to see at a glance which of that class are in the image.
+class LayeredRenderer:
+	def __init__(self, boxColor, rectangleLineWidth, myfont, highlightColor=(255, 255, 0), highlightLineWidth=2, proposalColor=(0, 0, 255), profiler=None,
+			labels=None, showLabelText=True, dimColor=(90, 90, 90)):
+		self.boxColor = boxColor	#for class ids that aren't in labels.txt
+		self.labels = labels or []
+		self.classColors = getClassColors(len(self.labels))
+		self.showLabelText = showLabelText
+		self.dimColor = dimColor
+		self.labelAtlas = None	#made when there's a window, so it can be converted to its pixel format
+		self.classHighlight = False
+		self.currentClass = 0
+		self.proposalColor = proposalColor
+		self.rectangleLineWidth = rectangleLineWidth
+		self.myfont = myfont
+		self.highlightColor = highlightColor
+		self.highlightLineWidth = highlightLineWidth
+		self.window = None
+		self.imagePyramid = None
+		self.viewport = None
+		self.boxes = []
+		self.proposals = []		#(classId, x1, y1, x2, y2) suggested by the detector (see preannotate.py)
+		self.background = None
+		self.overlay = None
+		self.outlines = []		#(color, lineWidth, classId, x1, y1, x2, y2) in screen coords for each outline currently on the window
+		self.rubberBand = None	#what the rubber band should look like on the next render() (image coords)
+		self.highlight = None	#and the highlighted box
+		self.needsFullRedraw = True
+		self.profiler = profiler or Profiler()
+		self.status = None		#the overlay text rendered to a surface, and where it was last drawn
+		self.statusRect = None
+		self.statusChanged = False
+
+
+	#Keeps the zoom / pan when the next image is the same size (frames from the same video), so you can stay zoomed in on the same part of the sky.
+	def setImage(self, window, imagePyramid, boxes):
+		self.window = window
+		if self.labelAtlas is None:
+			self.labelAtlas = LabelAtlas(self.labels, self.myfont, self.classColors, self.boxColor)
+		self.imagePyramid = imagePyramid
+		imageWidth, imageHeight = imagePyramid.getSize()
+		windowWidth, windowHeight = window.get_size()
+		viewport = self.viewport
+		if viewport is None or (viewport.imageWidth, viewport.imageHeight, viewport.windowWidth, viewport.windowHeight) != (imageWidth, imageHeight, windowWidth, windowHeight):
+			self.viewport = Viewport(imageWidth, imageHeight, windowWidth, windowHeight)
+		self.outlines = []
+		self.rubberBand = None
+		self.highlight = None
+		self.boxes = boxes
+		self.proposals = []
+		self.viewChanged()
+
+
+	#Call after changing the viewport (zoom / pan)
+	def viewChanged(self):
+		with self.profiler.stage("view"):
+			self.background = self.imagePyramid.renderView(self.viewport).convert()
+		self.setBoxes(self.boxes)
+
+
+	def setBoxes(self, boxes):
+		with self.profiler.stage("boxRedraw"):
+			self.boxes = boxes
+			self.overlay = self.background.copy()
+			imageX1, imageY1, imageX2, imageY2 = self.viewport.getVisibleImageRect()
+			tagBlits = []	#all the name tags go on in one blits() call at the end, on top of the outlines
+			for isProposal, boxesToDraw in ((True, self.proposals), (False, boxes)):
+				for box in boxesToDraw:
+					if box[3] >= imageX1 and box[1] <= imageX2 and box[4] >= imageY1 and box[2] <= imageY2:	#skip the ones that are off screen
+						self.drawBox(self.overlay, box, isProposal, tagBlits)
+			self.overlay.blits(tagBlits, doreturn=False)
+		self.needsFullRedraw = True
+
+
+	def setProposals(self, proposals):
+		self.proposals = proposals
+		self.setBoxes(self.boxes)
+
+
+	def addBox(self, box):
+		tagBlits = []
+		self.drawBox(self.overlay, box, False, tagBlits)
+		self.overlay.blits(tagBlits, doreturn=False)
+		self.needsFullRedraw = True
+
+
+	#(color, line width, draw the name tag?) for a box of classId.  Proposals are always the proposal color, tagged with the class they'd get.
+	def getBoxStyle(self, classId, isProposal):
+		highlighted = self.classHighlight and classId == self.currentClass
+		if self.classHighlight and not highlighted:
+			return self.dimColor, self.rectangleLineWidth, False
+		lineWidth = self.rectangleLineWidth + (1 if highlighted else 0)
+		if isProposal:
+			return self.proposalColor, lineWidth, self.showLabelText
+		return self.labelAtlas.getColor(classId), lineWidth, self.showLabelText
+
+
+	#Draws the outline, and adds the blit for its name tag (just above the top left corner, or just inside if that's off the top) to tagBlits
+	def drawBox(self, surface, box, isProposal, tagBlits):
+		classId = int(box[0])
+		color, lineWidth, drawTag = self.getBoxStyle(classId, isProposal)
+		screenX1, screenY1, screenX2, screenY2 = self.getScreenRect(box[1], box[2], box[3], box[4])
+		drawRectangle(surface, color, lineWidth, screenX1, screenY1, screenX2, screenY2, box[0], self.myfont)
+		if drawTag:
+			tagSurface, tagArea = self.labelAtlas.getTag(classId)
+			tagY = screenY1 - tagArea.height
+			if tagY < 0:
+				tagY = screenY1
+			tagBlits.append((tagSurface, (screenX1, tagY), tagArea))
+
+
+	#The label you'd draw a box with now (for the rubber band color and the 'C' highlight)
+	def setCurrentClass(self, classId):
+		changed = self.classHighlight and classId != self.currentClass
+		self.currentClass = classId
+		if changed:
+			self.setBoxes(self.boxes)
+
+
+	#'C':  returns whether it's on now
+	def toggleClassHighlight(self):
+		self.classHighlight = not self.classHighlight
+		self.setBoxes(self.boxes)
+		return self.classHighlight
+
+
+	def getScreenRect(self, boxX1, boxY1, boxX2, boxY2):
+		screenX1, screenY1 = self.viewport.imageToScreen(boxX1, boxY1)
+		screenX2, screenY2 = self.viewport.imageToScreen(boxX2, boxY2)
+		return screenX1, screenY1, screenX2, screenY2
+
+
+	def setRubberBand(self, label, boxX1, boxY1, boxX2, boxY2):
+		self.rubberBand = (self.labelAtlas.getColor(label), self.rectangleLineWidth, label, boxX1, boxY1, boxX2, boxY2)
+
+
+	def clearRubberBand(self):
+		self.rubberBand = None
+
+
+	#box is (classId, boxX1, boxY1, boxX2, boxY2), or None to take the highlight off
+	def setHighlight(self, box):
+		if box is None:
+			self.highlight = None
+		else:
+			self.highlight = (self.highlightColor, self.highlightLineWidth, box[0], box[1], box[2], box[3], box[4])
+
+
+	#Lines of text to show in the top left corner (None for nothing)
+	def setStatusLines(self, lines):
+		status = None
+		if lines:
+			lineSurfaces = [self.myfont.render(line, True, (255, 255, 255)) for line in lines]
+			status = pygame.Surface((max(lineSurface.get_width() for lineSurface in lineSurfaces) + 8, sum(lineSurface.get_height() for lineSurface in lineSurfaces) + 8))
+			status.fill((0, 0, 0))
+			y = 4
+			for lineSurface in lineSurfaces:
+				status.blit(lineSurface, (4, y))
+				y += lineSurface.get_height()
+		self.status = status
+		self.statusChanged = True
+
+
+	#Returns the rects it changed on the window
+	def drawStatus(self):
+		dirtyRects = []
+		if self.statusRect is not None:
+			self.window.blit(self.overlay, self.statusRect, self.statusRect)
+			dirtyRects.append(self.statusRect)
+			self.statusRect = None
+		if self.status is not None:
+			self.statusRect = self.window.blit(self.status, (4, 4))
+			dirtyRects.append(self.statusRect)
+		self.statusChanged = False
+		return dirtyRects
+
+
+	def render(self):
+		newOutlines = []
+		for outline in (self.highlight, self.rubberBand):
+			if outline is not None:
+				color, lineWidth, label, boxX1, boxY1, boxX2, boxY2 = outline
+				newOutlines.append((color, lineWidth, label) + self.getScreenRect(boxX1, boxY1, boxX2, boxY2))
+
+		if self.needsFullRedraw:
+			with self.profiler.stage("blit"):
+				self.window.blit(self.overlay, (0, 0))
+				for color, lineWidth, label, boxX1, boxY1, boxX2, boxY2 in newOutlines:
+					drawRectangle(self.window, color, lineWidth, boxX1, boxY1, boxX2, boxY2, label, self.myfont)
+				self.statusRect = None	#the overlay blit already covered it up
+				self.drawStatus()
+			with self.profiler.stage("flip"):
+				pygame.display.flip()
+			self.outlines = newOutlines
+			self.needsFullRedraw = False
+			return
+
+		if newOutlines == self.outlines and not self.statusChanged:
+			return	#nothing moved, nothing to send to the screen
+
+		with self.profiler.stage("blit"):
+			dirtyRects = []
+			for color, lineWidth, label, boxX1, boxY1, boxX2, boxY2 in self.outlines:
+				for rect in getOutlineRects(boxX1, boxY1, boxX2, boxY2, lineWidth):
+					self.window.blit(self.overlay, rect, rect)	#patch the old outline back with whatever is under it
+					dirtyRects.append(rect)
+			for color, lineWidth, label, boxX1, boxY1, boxX2, boxY2 in newOutlines:
+				drawRectangle(self.window, color, lineWidth, boxX1, boxY1, boxX2, boxY2, label, self.myfont)
+				dirtyRects.extend(getOutlineRects(boxX1, boxY1, boxX2, boxY2, lineWidth))
+			if self.status is not None or self.statusRect is not None:
+				dirtyRects.extend(self.drawStatus())	#patching the outlines may have rubbed some of it out, and it stays on top of them anyway
+
+		with self.profiler.stage("flip"):
+			pygame.display.update(dirtyRects)
+		self.outlines = newOutlines
@@ -0,0 +1,78 @@
+#Uniform grid over the boxes of one image, so "which boxes are under the mouse" only looks at the handful of boxes in the mouse's cell
+#instead of every box on the image (the flock-of-birds frames have thousands).
+#Each box is put in every cell it overlaps.  Boxes that would cover more than maxCellsPerBox cells (a box around most of the image) go in a
+#separate list that is always checked - there's only ever a few of those, and it keeps one huge box from filling up thousands of cells.
+class GridIndex:
+	def __init__(self, cellSize=64, maxCellsPerBox=256):
+		self.cellSize = cellSize
+		self.maxCellsPerBox = maxCellsPerBox
+		self.cells = {}		#(cellX, cellY) -> set of boxIds
+		self.rects = {}		#boxId -> (boxX1, boxY1, boxX2, boxY2)
+		self.largeBoxIds = set()
+
+
+	def getCellRange(self, boxX1, boxY1, boxX2, boxY2):
+		return int(boxX1 // self.cellSize), int(boxY1 // self.cellSize), int(boxX2 // self.cellSize), int(boxY2 // self.cellSize)
+
+
+	def insert(self, boxId, boxX1, boxY1, boxX2, boxY2):
+		self.rects[boxId] = (boxX1, boxY1, boxX2, boxY2)
+		cellX1, cellY1, cellX2, cellY2 = self.getCellRange(boxX1, boxY1, boxX2, boxY2)
+		if (cellX2 - cellX1 + 1) * (cellY2 - cellY1 + 1) > self.maxCellsPerBox:
+			self.largeBoxIds.add(boxId)
+			return
+		for cellX in range(cellX1, cellX2 + 1):
+			for cellY in range(cellY1, cellY2 + 1):
+				self.cells.setdefault((cellX, cellY), set()).add(boxId)
+
+
+	def remove(self, boxId):
+		rect = self.rects.pop(boxId, None)
+		if rect is None:
+			return
+		if boxId in self.largeBoxIds:
+			self.largeBoxIds.discard(boxId)
+			return
+		cellX1, cellY1, cellX2, cellY2 = self.getCellRange(*rect)
+		for cellX in range(cellX1, cellX2 + 1):
+			for cellY in range(cellY1, cellY2 + 1):
+				cell = self.cells.get((cellX, cellY))
+				if cell is not None:
+					cell.discard(boxId)
+					if len(cell) == 0:
+						del self.cells[(cellX, cellY)]
+
+
+	#Boxes with x, y inside or on their edge (same test as isPointInsideBox() in pygamelabeler.py)
+	def queryPoint(self, x, y):
+		cellX = int(x // self.cellSize)
+		cellY = int(y // self.cellSize)
+		candidates = self.cells.get((cellX, cellY), set()) | self.largeBoxIds
+		boxIds = []
+		for boxId in candidates:
+			boxX1, boxY1, boxX2, boxY2 = self.rects[boxId]
+			if boxX1 <= x <= boxX2 and boxY1 <= y <= boxY2:
+				boxIds.append(boxId)
+		return boxIds
+
+
+	#Boxes that overlap the region, or only the ones completely inside it if contained is True
+	def queryRect(self, regionX1, regionY1, regionX2, regionY2, contained=False):
+		candidates = set(self.largeBoxIds)
+		cellX1, cellY1, cellX2, cellY2 = self.getCellRange(regionX1, regionY1, regionX2, regionY2)
+		if (cellX2 - cellX1 + 1) * (cellY2 - cellY1 + 1) > len(self.cells):
+			candidates = set(self.rects)	#the region covers more cells than there are non-empty ones, just check every box
+		else:
+			for cellX in range(cellX1, cellX2 + 1):
+				for cellY in range(cellY1, cellY2 + 1):
+					candidates.update(self.cells.get((cellX, cellY), ()))
+
+		boxIds = []
+		for boxId in candidates:
+			boxX1, boxY1, boxX2, boxY2 = self.rects[boxId]
+			if contained:
+				if boxX1 >= regionX1 and boxY1 >= regionY1 and boxX2 <= regionX2 and boxY2 <= regionY2:
+					boxIds.append(boxId)
+			elif boxX1 <= regionX2 and boxX2 >= regionX1 and boxY1 <= regionY2 and boxY2 >= regionY1:
+				boxIds.append(boxId)
+		return boxIds
@@ -1,23 +1,237 @@
 #https://stackoverflow.com/questions/33311153/python-extracting-and-saving-video-frames
 #Works for me :)  --> I modified starting at the code given in the above link.
+#
+#The first version of this read() every single frame from 0 to stop just to count up to the ones it wanted (decoding 360,000 frames to keep ~30).
+#Now it works out which frame numbers it wants up front, then jumps straight to them:
+#	- short gaps (<= --grab-threshold frames) are skipped with grab(), which demuxes / decodes but skips the color conversion + copy that retrieve() does.
+#	- longer gaps seek with CAP_PROP_POS_FRAMES (the decoder starts again from the nearest keyframe instead of going through everything in between).
+#The wanted frames are split into contiguous segments and each segment is handled by its own process with its own VideoCapture.
+#Inside each process, extraction is a pipeline:  the decoder puts frames on a bounded queue and a pool of writer threads encodes them (cv2.imencode releases the GIL)
+#and writes them out, so the decoder never sits waiting on the disk.  If the writers fall behind, the queue fills up and the decoder waits instead of eating all the memory.
+#
+#Examples:
+#	python splitvid.py -i skywatching.mp4 --start 360000 --stop 361806                 (one frame per minute, the old default)
+#	python splitvid.py -i skywatching.mp4 --start-time 3:20:00 --stop-time 3:30:00 --every-seconds 5
+#	python splitvid.py -i skywatching.mp4 --stride 30 -o frames/
+#	python splitvid.py -i skywatching.mp4 --stride 30 --format webp --quality 60 -o review/     (small files for a quick look through)
+#	python splitvid.py -i skywatching.mp4 --every-seconds 2 --dedupe 4                 (don't write frames that look the same as one already written)
+import os
+import argparse
+import time
+import math
+import threading
+import queue
+from concurrent.futures import ProcessPoolExecutor
 import cv2  #pip install opencv-python
-vidcap = cv2.VideoCapture('skywatching.mp4')
-success,image = vidcap.read()
-framesPerSecond = vidcap.get(cv2.CAP_PROP_FPS)
-print("FPS: " + str(framesPerSecond))  #Only works for videos, won't work for webcams or other live cameras - for that use python's time class and count frames you get in a second.
-count = 0
-secondsInMinute = 60
-skipBetweenFrames = framesPerSecond * secondsInMinute  #with the modulo operation below, this will have it only retrieve one frame per minute
-skipFromStart = 360000
-stop = 361806
-totalFramesRead = 0
-while success and count <= stop:
-	if count > skipFromStart and (count == 0 or count % skipBetweenFrames == 0):   #the 'or' is necessary to prevent count % modNum from happening when count is 0 -> divide by zero error
-		vidcap.set(cv2.CAP_PROP_POS_FRAMES, count-1)
-		cv2.imwrite("frame%d.jpg" % count, image)     # save frame as JPEG file
-		success,image = vidcap.read()
-		print('Read a new frame: ' + str(success))
-		if success:
-			totalFramesRead += 1
-	count += 1
-print("Read " + str(totalFramesRead) + " frames")
+from dedupe import DuplicateGrouper, getFrameHash  #near duplicate frames
+
+
+def getArguments():
+	parser = argparse.ArgumentParser(description='Extract frames from a video into sequentially numbered image files (frameN.jpg, N being the frame number in the video).')
+	parser.add_argument('-i', '--input', default='skywatching.mp4', help='Video file to extract frames from')
+	parser.add_argument('-o', '--output', default=os.getcwd(), help='Directory to write the frames to (default: current directory)')
+	parser.add_argument('--start', type=int, default=None, help='First frame number to extract')
+	parser.add_argument('--stop', type=int, default=None, help='Last frame number to extract (inclusive, default: end of the video)')
+	parser.add_argument('--start-time', default=None, help='Start time in seconds or H:M:S (instead of --start)')
+	parser.add_argument('--stop-time', default=None, help='Stop time in seconds or H:M:S (instead of --stop)')
+	parser.add_argument('--stride', type=int, default=None, help='Extract every Nth frame (default: one frame per minute of video)')
+	parser.add_argument('--every-seconds', type=float, default=None, help='Extract one frame every N seconds of video (instead of --stride)')
+	parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of processes, each with its own VideoCapture')
+	parser.add_argument('--grab-threshold', type=int, default=100, help='Gaps of up to this many frames are skipped with grab() instead of seeking')
+	parser.add_argument('--writers', type=int, default=4, help='Number of encoder / writer threads per process')
+	parser.add_argument('--queue-size', type=int, default=16, help='Number of decoded frames that can wait for a writer (per process)')
+	parser.add_argument('--format', choices=['jpg', 'png', 'webp'], default='jpg', help='Output image format')
+	parser.add_argument('--quality', type=int, default=95, help='JPEG / WebP quality, 1-100 (lower is smaller and faster to write)')
+	parser.add_argument('--png-compression', type=int, default=3, help='PNG compression level, 0-9 (higher is smaller but slower)')
+	parser.add_argument('--dedupe', type=int, default=None, help="Don't write frames whose perceptual hash is within this many bits (of 64) of a frame already written in the same segment - 4 is a good start")
+	return parser.parse_args()
+
+
+#cv2.imencode() parameters for the chosen format
+def getEncodeParams(imageFormat, quality, pngCompression):
+	if imageFormat == 'jpg':
+		return [cv2.IMWRITE_JPEG_QUALITY, quality]
+	if imageFormat == 'webp':
+		return [cv2.IMWRITE_WEBP_QUALITY, quality]
+	return [cv2.IMWRITE_PNG_COMPRESSION, pngCompression]
+
+
+#"90", "1:30" and "0:01:30" are all 90 seconds
+def parseTime(timeString):
+	seconds = 0.0
+	for part in timeString.split(':'):
+		seconds = seconds * 60 + float(part)
+	return seconds
+
+
+#Works out the exact frame numbers to extract from the arguments and the video's fps / frame count.
+def getFrameNumbers(args, framesPerSecond, frameCount):
+	start = 0
+	stop = frameCount - 1
+	if args.start_time is not None:
+		start = int(round(parseTime(args.start_time) * framesPerSecond))
+	if args.start is not None:
+		start = args.start
+	if args.stop_time is not None:
+		stop = int(round(parseTime(args.stop_time) * framesPerSecond))
+	if args.stop is not None:
+		stop = args.stop
+	if frameCount > 0:
+		stop = min(stop, frameCount - 1)	#frame counts are estimates for some containers, the segments stop early on a failed read anyway
+
+	secondsInMinute = 60
+	stride = int(round(framesPerSecond * secondsInMinute))  #only retrieve one frame per minute by default
+	if args.every_seconds is not None:
+		stride = int(round(args.every_seconds * framesPerSecond))
+	if args.stride is not None:
+		stride = args.stride
+	stride = max(1, stride)
+
+	return list(range(max(0, start), stop + 1, stride))
+
+
+#Contiguous runs of the wanted frames - one per task, so each process only ever moves forward through its part of the video.
+#A few more segments than workers keeps all the processes busy if some segments decode slower than others.
+def getSegments(frameNumbers, workers):
+	if len(frameNumbers) == 0:
+		return []
+	segmentCount = min(len(frameNumbers), max(1, workers) * 2)
+	segmentLength = math.ceil(len(frameNumbers) / segmentCount)
+	return [frameNumbers[i:i + segmentLength] for i in range(0, len(frameNumbers), segmentLength)]
+
+
+#Moves vidcap to frameNumber (position is the frame the next read() would return) and reads it.
+def readFrame(vidcap, position, frameNumber, grabThreshold):
+	gap = frameNumber - position
+	if gap < 0 or gap > grabThreshold:
+		vidcap.set(cv2.CAP_PROP_POS_FRAMES, frameNumber)
+	else:
+		for i in range(gap):
+			if not vidcap.grab():
+				return False, None
+	return vidcap.read()
+
+
+#Time spent in each stage of the pipeline, added up over all the segments in main().
+def getEmptyStats():
+	return {"frames": 0, "decodedFrames": 0, "bytes": 0, "decodeSeconds": 0.0, "queueFullSeconds": 0.0, "encodeSeconds": 0.0, "writeSeconds": 0.0, "writeErrors": 0, "duplicates": 0}
+
+
+#Writer thread:  takes decoded frames off the queue until it gets None, encodes them and writes them out.
+def writeFrames(frameQueue, outputDirectory, imageFormat, encodeParams, stats, statsLock):
+	frames, byteCount, encodeSeconds, writeSeconds, writeErrors = 0, 0, 0.0, 0.0, 0
+	while True:
+		item = frameQueue.get()
+		if item is None:
+			break
+		frameNumber, image = item
+		encodeStart = time.perf_counter()
+		success, encoded = cv2.imencode("." + imageFormat, image, encodeParams)
+		writeStart = time.perf_counter()
+		encodeSeconds += writeStart - encodeStart
+		try:
+			if not success:
+				raise OSError("could not encode frame " + str(frameNumber))
+			with open(os.path.join(outputDirectory, "frame%d.%s" % (frameNumber, imageFormat)), "wb") as imageFile:
+				imageFile.write(encoded)
+			frames += 1
+			byteCount += len(encoded)
+		except OSError as e:
+			print("Failed to write frame " + str(frameNumber) + ": " + str(e))
+			writeErrors += 1
+		writeSeconds += time.perf_counter() - writeStart
+
+	with statsLock:
+		stats["frames"] += frames
+		stats["bytes"] += byteCount
+		stats["encodeSeconds"] += encodeSeconds
+		stats["writeSeconds"] += writeSeconds
+		stats["writeErrors"] += writeErrors
+
+
+#Runs in a worker process.  This thread decodes, the writer threads encode + write.
+#With dedupeThreshold, frames that hash close to one this segment already wrote are dropped before they're encoded (see dedupe.py).  Each process
+#only sees its own segment, so the first frame of a segment can still repeat the end of the one before - datasettool.py dedupe catches those.
+def extractSegment(videoFilename, frameNumbers, outputDirectory, grabThreshold, writers, queueSize, imageFormat, encodeParams, dedupeThreshold=None):
+	stats = getEmptyStats()
+	statsLock = threading.Lock()
+	frameQueue = queue.Queue(maxsize=max(1, queueSize))
+	writerThreads = [threading.Thread(target=writeFrames, args=(frameQueue, outputDirectory, imageFormat, encodeParams, stats, statsLock)) for i in range(max(1, writers))]
+	for writerThread in writerThreads:
+		writerThread.start()
+
+	grouper = None
+	if dedupeThreshold is not None:
+		grouper = DuplicateGrouper(dedupeThreshold)
+	vidcap = cv2.VideoCapture(videoFilename)
+	position = 0
+	for frameNumber in frameNumbers:
+		decodeStart = time.perf_counter()
+		success, image = readFrame(vidcap, position, frameNumber, grabThreshold)
+		stats["decodeSeconds"] += time.perf_counter() - decodeStart
+		position = frameNumber + 1
+		if not success:
+			print("Could not read frame " + str(frameNumber) + ", stopping this segment.")
+			break
+		stats["decodedFrames"] += 1	#including the duplicates dropped below, their decode time is in decodeSeconds too
+		if grouper is not None and grouper.check(frameNumber, getFrameHash(image)) is not None:
+			stats["duplicates"] += 1
+			continue
+		queueStart = time.perf_counter()
+		frameQueue.put((frameNumber, image))	#blocks while the queue is full
+		stats["queueFullSeconds"] += time.perf_counter() - queueStart
+	vidcap.release()
+
+	for writerThread in writerThreads:
+		frameQueue.put(None)
+	for writerThread in writerThreads:
+		writerThread.join()
+	return stats
+
+
+#Per stage totals.  The seconds are summed over all processes / threads, so compare them to each other (which stage is the bottleneck), not to the wall clock.
+def printStats(stats, elapsed):
+	print("Wrote " + str(stats["frames"]) + " frames (" + str(round(stats["bytes"] / (1024 * 1024), 1)) + " MB) in " + str(round(elapsed, 2)) + " seconds")
+	for stageName, key, framesKey in [("decode", "decodeSeconds", "decodedFrames"), ("encode", "encodeSeconds", "frames"), ("write", "writeSeconds", "frames")]:
+		framesPerSecond = 0
+		if stats[key] > 0:
+			framesPerSecond = stats[framesKey] / stats[key]
+		print("\t" + stageName + ": " + str(round(stats[key], 2)) + "s total, " + str(round(framesPerSecond, 1)) + " frames/s per thread")
+	print("\tdecoder waiting on a full queue (writers are the bottleneck): " + str(round(stats["queueFullSeconds"], 2)) + "s")
+	if stats["duplicates"] > 0:
+		print("\t" + str(stats["duplicates"]) + " near duplicate frames skipped")
+	if stats["writeErrors"] > 0:
+		print("\t" + str(stats["writeErrors"]) + " frames failed to write!")
+
+
+def main():
+	args = getArguments()
+	if not os.path.isfile(args.input):
+		exit("Video file does not exist or path not recognized: " + str(args.input))
+	os.makedirs(args.output, exist_ok=True)
+
+	vidcap = cv2.VideoCapture(args.input)
+	framesPerSecond = vidcap.get(cv2.CAP_PROP_FPS)
+	frameCount = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
+	vidcap.release()
+	print("FPS: " + str(framesPerSecond) + ", frames: " + str(frameCount))  #Only works for videos, won't work for webcams or other live cameras - for that use python's time class and count frames you get in a second.
+	if framesPerSecond <= 0:
+		exit("Could not get the frame rate of " + str(args.input))
+
+	frameNumbers = getFrameNumbers(args, framesPerSecond, frameCount)
+	segments = getSegments(frameNumbers, args.workers)
+	print("Extracting " + str(len(frameNumbers)) + " frames in " + str(len(segments)) + " segments with " + str(args.workers) + " processes.")
+
+	encodeParams = getEncodeParams(args.format, args.quality, args.png_compression)
+	startTime = time.perf_counter()
+	stats = getEmptyStats()
+	with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+		futures = [executor.submit(extractSegment, args.input, segment, args.output, args.grab_threshold, args.writers, args.queue_size, args.format, encodeParams, args.dedupe) for segment in segments]
+		for future in futures:
+			for key, value in future.result().items():
+				stats[key] += value
+	printStats(stats, time.perf_counter() - startTime)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,133 @@
+import os
+import sys
+import threading
+import time
+import numpy as np
+import annotationstore
+from annotationstore import AnnotationStore
+from boxarray import readAnnotationFile
+
+
+def openImage(store, directory, imageFilename):
+	annotationFileFullpath = os.path.join(directory, os.path.splitext(imageFilename)[0] + ".txt")
+	store.open(imageFilename, annotationFileFullpath, 100, 100, np.zeros(0, dtype=np.int32), np.zeros((0, 4), dtype=np.float32))
+	return annotationFileFullpath
+
+
+def test_flushWritesDirtyAndVisited(tmp_path):
+	store = AnnotationStore(flushDelay=60)
+	boxesFullpath = openImage(store, tmp_path, "a.jpg")
+	emptyFullpath = openImage(store, tmp_path, "b.jpg")
+	store.addBox("a.jpg", (1, 10, 10, 50, 50))
+	store.markVisited("b.jpg")
+	store.flush()
+	classIds, normalized = readAnnotationFile(boxesFullpath)
+	assert classIds.tolist() == [1]
+	assert np.allclose(normalized, [[0.3, 0.3, 0.4, 0.4]])
+	assert open(emptyFullpath).read() == ""
+	assert not store.isDirty("a.jpg")
+	store.close()
+
+
+def test_writtenBoxCounts(tmp_path):
+	store = AnnotationStore(flushDelay=60)
+	openImage(store, tmp_path, "a.jpg")
+	openImage(store, tmp_path, "b.jpg")
+	openImage(store, tmp_path, "c.jpg")	#not visited, no file - not counted
+	store.addBox("a.jpg", (1, 10, 10, 50, 50))
+	store.addBox("a.jpg", (0, 20, 20, 60, 60))
+	store.markVisited("b.jpg")
+	store.flush()
+	assert store.getWrittenBoxCounts() == {"a.jpg": 2, "b.jpg": 0}
+	store.close()
+
+
+def test_visitedDoesNotOverwriteExistingFile(tmp_path):
+	store = AnnotationStore(flushDelay=60)
+	annotationFileFullpath = openImage(store, tmp_path, "a.jpg")
+	with open(annotationFileFullpath, "w") as annotationFile:
+		annotationFile.write("0 0.5 0.5 0.1 0.1\n")
+	store.markVisited("a.jpg")
+	store.close()
+	assert open(annotationFileFullpath).read() == "0 0.5 0.5 0.1 0.1\n"
+
+
+def test_closeWritesWhatTheWriterHasNotGottenTo(tmp_path):
+	store = AnnotationStore(flushDelay=60)
+	annotationFileFullpath = openImage(store, tmp_path, "a.jpg")
+	boxId = store.addBox("a.jpg", (0, 0, 0, 10, 10))
+	store.addBox("a.jpg", (0, 20, 20, 30, 30))
+	store.removeBox("a.jpg", boxId)
+	store.close()
+	assert readAnnotationFile(annotationFileFullpath)[0].tolist() == [0]
+	assert not store.writer.is_alive()
+
+
+#The window changing boxes on lots of images while the writer thread and flush() write them - nothing is lost and the writer stays up
+def test_concurrentChangesAndFlushes(tmp_path, monkeypatch):
+	threadErrors = []
+	monkeypatch.setattr(threading, "excepthook", lambda hookArgs: threadErrors.append(hookArgs.exc_value))
+	switchInterval = sys.getswitchinterval()
+	sys.setswitchinterval(1e-6)	#switch threads as often as possible, so the writer runs in the middle of the changes
+	try:
+		writes = []
+		store = AnnotationStore(flushDelay=0, onWrite=lambda imageFilename, annotationFileFullpath, boxCount: writes.append(imageFilename))
+		imageFilenames = ["frame" + str(i) + ".jpg" for i in range(200)]
+		for imageFilename in imageFilenames:
+			openImage(store, tmp_path, imageFilename)
+
+		def flushLoop(stop):
+			while not stop.is_set():
+				store.flush()
+		stop = threading.Event()
+		flusher = threading.Thread(target=flushLoop, args=(stop,))
+		flusher.start()
+		for round in range(10):
+			for imageFilename in imageFilenames:
+				store.addBox(imageFilename, (round % 3, 1, 1, 5, 5))
+				store.markVisited(imageFilename)
+		stop.set()
+		flusher.join()
+	finally:
+		sys.setswitchinterval(switchInterval)
+	assert threadErrors == []
+	assert store.writer.is_alive()
+	store.close()
+	for imageFilename in imageFilenames:
+		classIds, normalized = readAnnotationFile(os.path.join(tmp_path, os.path.splitext(imageFilename)[0] + ".txt"))
+		assert len(classIds) == 10
+	assert len(writes) > 0
+
+
+#flush() from the window while the writer thread is in the middle of a slow write:  the two never write at the same time
+def test_flushWaitsForTheWriterThread(tmp_path, monkeypatch):
+	active = []
+	overlaps = []
+	writeFileAtomically = annotationstore.writeFileAtomically
+	def slowWrite(fileFullpath, text):
+		active.append(fileFullpath)
+		if len(active) > 1:
+			overlaps.append(list(active))
+		time.sleep(0.05)
+		writeFileAtomically(fileFullpath, text)
+		active.remove(fileFullpath)
+	monkeypatch.setattr(annotationstore, "writeFileAtomically", slowWrite)
+	store = AnnotationStore(flushDelay=0)
+	for imageFilename in ["a.jpg", "b.jpg", "c.jpg"]:
+		openImage(store, tmp_path, imageFilename)
+		store.addBox(imageFilename, (0, 0, 0, 10, 10))
+	time.sleep(0.01)	#the writer thread has started on them
+	store.flush()
+	store.close()
+	assert overlaps == []
+
+
+def test_failedWriteIsRetried(tmp_path):
+	store = AnnotationStore(flushDelay=60)
+	annotationFileFullpath = openImage(store, os.path.join(tmp_path, "missing"), "a.jpg")
+	store.addBox("a.jpg", (0, 0, 0, 10, 10))
+	store.flush()
+	assert store.isDirty("a.jpg")
+	os.mkdir(os.path.join(tmp_path, "missing"))
+	store.close()
+	assert readAnnotationFile(annotationFileFullpath)[0].tolist() == [0]
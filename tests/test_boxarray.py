@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from boxarray import parseAnnotationText, parseAnnotationLines, formatAnnotationText, readAnnotationFile, BoxArray
+
+
+def test_parse():
+	classIds, normalized = parseAnnotationText("0 0.5 0.5 0.2 0.4\n\n3 0.1 0.2 0.3 0.4\n")
+	assert classIds.tolist() == [0, 3]
+	assert classIds.dtype == np.int32
+	assert np.allclose(normalized, [[0.5, 0.5, 0.2, 0.4], [0.1, 0.2, 0.3, 0.4]])
+
+
+def test_parseEmpty():
+	classIds, normalized = parseAnnotationText("")
+	assert classIds.shape == (0,)
+	assert normalized.shape == (0, 4)
+
+
+def test_formatRoundTrip():
+	classIds = np.array([1, 0], dtype=np.int32)
+	normalized = np.array([[0.5, 0.25, 0.1, 0.2], [0.75, 0.5, 0.3, 0.4]], dtype=np.float32)
+	parsedIds, parsedNormalized = parseAnnotationText(formatAnnotationText(classIds, normalized))
+	assert parsedIds.tolist() == [1, 0]
+	assert np.allclose(parsedNormalized, normalized)
+
+
+#class confidence x y w h, as some detectors write them:  30 values, which used to parse as 6 made up boxes
+def test_sixColumnLinesAreRejected():
+	text = "".join("0 0.9 0.5 0.5 0.1 0.1\n" for i in range(5))
+	with pytest.raises(ValueError, match="line 1: needs 5 values"):
+		parseAnnotationText(text)
+	classIds, normalized, badLines = parseAnnotationLines(text)
+	assert [lineNumber for lineNumber, problem in badLines] == [1, 2, 3, 4, 5]
+	assert len(classIds) == 0
+
+
+#4 + 6 values is 10, a multiple of 5
+def test_mixedFourAndSixColumnLinesAreRejected():
+	classIds, normalized, badLines = parseAnnotationLines("0 0.5 0.5 0.1\n1 0.9 0.5 0.5 0.1 0.1\n2 0.5 0.5 0.1 0.1\n")
+	assert [lineNumber for lineNumber, problem in badLines] == [1, 2]
+	assert classIds.tolist() == [2]
+
+
+def test_nonIntegerClassIsRejected():
+	with pytest.raises(ValueError, match="line 2: the class should be a whole number"):
+		parseAnnotationText("0 0.5 0.5 0.1 0.1\n1.5 0.5 0.5 0.1 0.1\n")
+	assert parseAnnotationText("2.0 0.5 0.5 0.1 0.1\n")[0].tolist() == [2]
+
+
+def test_notANumberIsRejected():
+	with pytest.raises(ValueError, match="line 1: not a number"):
+		parseAnnotationText("car 0.5 0.5 0.1 0.1\n")
+
+
+def test_missingFileIsNoBoxes(tmp_path):
+	classIds, normalized = readAnnotationFile(tmp_path / "missing.txt")
+	assert len(classIds) == 0 and normalized.shape == (0, 4)
+
+
+def test_boxArrayRemoveKeepsIds():
+	boxes = BoxArray(capacity=2)
+	for boxId in range(1, 6):
+		boxes.append(boxId, boxId % 2, boxId, boxId, boxId + 10, boxId + 10)
+	assert boxes.remove(2) == (0, 2, 2, 12, 12)
+	assert boxes.remove(2) is None
+	assert len(boxes) == 4
+	assert boxes[5] == (1, 5, 5, 15, 15)
+	assert sorted(boxId for boxId, box in boxes.items()) == [1, 3, 4, 5]
+
+
+def test_readAnnotationFileKeepsGoodLinesWithOnBadLine(tmp_path):
+	annotationFileFullpath = tmp_path / "frame0.txt"
+	annotationFileFullpath.write_text("0 0.5 0.5 0.1 0.1\n1 0.9 0.5 0.5 0.1 0.1\n")
+	with pytest.raises(ValueError, match="line 2"):
+		readAnnotationFile(annotationFileFullpath)
+	badLines = []
+	classIds, normalized = readAnnotationFile(annotationFileFullpath, lambda lineNumber, problem: badLines.append(lineNumber))
+	assert classIds.tolist() == [0]
+	assert badLines == [2]
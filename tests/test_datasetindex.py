@@ -0,0 +1,72 @@
+import os
+import numpy as np
+from PIL import Image
+from datasetindex import DatasetIndex
+
+
+def makeImages(directory, imageCount):
+	filenames = []
+	for i in range(imageCount):
+		filenames.append("frame" + str(i) + ".png")
+		Image.fromarray(np.zeros((12, 16, 3), dtype=np.uint8)).save(os.path.join(directory, filenames[-1]))
+	return filenames
+
+
+def writeAnnotation(directory, filename, lines):
+	annotationFileFullpath = os.path.join(directory, os.path.splitext(filename)[0] + ".txt")
+	with open(annotationFileFullpath, "w") as annotationFile:
+		annotationFile.write("".join(line + "\n" for line in lines))
+	return annotationFileFullpath
+
+
+def test_refreshAndCounts(tmp_path):
+	filenames = makeImages(tmp_path, 3)
+	writeAnnotation(tmp_path, filenames[0], ["0 0.5 0.5 0.1 0.1"])
+	writeAnnotation(tmp_path, filenames[1], [])
+	index = DatasetIndex(tmp_path)
+	assert index.refresh(filenames) == 3
+	assert index.getCounts() == (3, 2, 1)
+	assert index.getFilenames("unlabeled") == [filenames[2]]
+	assert index.refresh(filenames) == 0
+	index.close()
+
+
+def test_updateBeforeRefreshIsKept(tmp_path):
+	filenames = makeImages(tmp_path, 2)
+	index = DatasetIndex(tmp_path)
+	index.updateAnnotation(filenames[1], writeAnnotation(tmp_path, filenames[1], ["0 0.5 0.5 0.1 0.1", "1 0.2 0.2 0.1 0.1"]), 2)
+	index.refresh(filenames)
+	assert index.getFilenames("labeled") == [filenames[1]]
+	assert index.getFirstUnlabeledPosition() == 0
+	index.close()
+
+
+def test_updateDuringRefreshIsKept(tmp_path):
+	filenames = makeImages(tmp_path, 2)
+	index = DatasetIndex(tmp_path, workers=1)
+	readImage = index.readImage
+
+	#The labeler writes frame1's annotation file after refresh() looked (and found none) but before refresh() puts its rows in
+	def readImageThenWrite(changedImage):
+		row = readImage(changedImage)
+		if changedImage[1] == filenames[1]:
+			index.updateAnnotation(filenames[1], writeAnnotation(tmp_path, filenames[1], ["0 0.5 0.5 0.1 0.1"]), 1)
+		return row
+
+	index.readImage = readImageThenWrite
+	index.refresh(filenames)
+	assert index.getFilenames("labeled") == [filenames[1]]
+	index.readImage = readImage
+	assert index.refresh(filenames) == 0	#and the row has the file's real mtime, so it isn't read again
+	index.close()
+
+
+def test_deletedAnnotationFile(tmp_path):
+	filenames = makeImages(tmp_path, 1)
+	annotationFileFullpath = writeAnnotation(tmp_path, filenames[0], ["0 0.5 0.5 0.1 0.1"])
+	index = DatasetIndex(tmp_path)
+	index.refresh(filenames)
+	os.remove(annotationFileFullpath)
+	assert index.refresh(filenames) == 1
+	assert index.getFilenames("unlabeled") == filenames
+	index.close()
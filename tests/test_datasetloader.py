@@ -0,0 +1,88 @@
+import sys
+import subprocess
+import numpy as np
+from PIL import Image
+from datasetloader import YoloDataset
+
+
+def makeDataset(directory, imageCount=12, width=64, height=48):
+	for i in range(imageCount):
+		Image.fromarray(np.full((height, width, 3), i * 10, dtype=np.uint8)).save(directory / ("frame" + str(i) + ".png"))
+		if i != imageCount - 1:	#the last one isn't labeled
+			(directory / ("frame" + str(i) + ".txt")).write_text(str(i % 3) + " 0.5 0.5 0.5 0.25\n")
+	(directory / "labels.txt").write_text("car\nperson\nbike\n")
+
+
+def test_noPygame():
+	output = subprocess.run([sys.executable, "-c", "import sys, datasetloader; print('pygame' in sys.modules)"], capture_output=True, text=True, check=True)
+	assert output.stdout.strip() == "False"
+
+
+def test_samples(tmp_path):
+	makeDataset(tmp_path)
+	dataset = YoloDataset(tmp_path, workers=2, prefetch=3)
+	assert len(dataset) == 11
+	assert dataset.labels == ["car", "person", "bike"]
+	samples = list(dataset)
+	image, classIds, boxes = samples[1]
+	assert image.shape == (48, 64, 3) and image.dtype == np.uint8
+	assert (image == 10).all()
+	assert classIds.tolist() == [1]
+	assert np.allclose(boxes, [[16, 18, 48, 30]])
+
+
+def test_resizedAndNormalized(tmp_path):
+	makeDataset(tmp_path)
+	image, classIds, boxes = next(iter(YoloDataset(tmp_path, imageSize=(32, 16))))
+	assert image.shape == (16, 32, 3)
+	assert np.allclose(boxes, [[8, 6, 24, 10]])
+	image, classIds, normalized = next(iter(YoloDataset(tmp_path, boxFormat="normalized")))
+	assert np.allclose(normalized, [[0.5, 0.5, 0.5, 0.25]])
+
+
+#5 lines of class confidence x y w h used to come out as 6 made up boxes
+def test_malformedAnnotationFileIsSkipped(tmp_path, capsys, caplog):
+	makeDataset(tmp_path, imageCount=4)
+	(tmp_path / "frame1.txt").write_text("".join("0 0.9 0.5 0.5 0.1 0.1\n" for i in range(5)))
+	dataset = YoloDataset(tmp_path)
+	samples = list(dataset)
+	assert len(samples) == 2
+	assert [int(image[0, 0, 0]) for image, classIds, boxes in samples] == [0, 20]
+	assert list(dataset.skipped) == ["frame1.png"]
+	assert "line 1" in dataset.skipped["frame1.png"]
+	list(dataset)	#the second epoch doesn't say it again
+	assert capsys.readouterr().out == ""	#nothing in the training script's output
+	assert [record.levelname for record in caplog.records if record.name == "datasetloader"] == ["WARNING"]
+
+
+def test_shardsSplitEverythingOnce(tmp_path):
+	makeDataset(tmp_path, imageCount=23)
+	shards = [YoloDataset(tmp_path, shardIndex=i, shardCount=4).filenames for i in range(4)]
+	assert sorted(sum(shards, [])) == sorted(YoloDataset(tmp_path).filenames)
+	assert [len(YoloDataset(tmp_path, shardIndex=i, shardCount=4, evenShards=True)) for i in range(4)] == [5, 5, 5, 5]
+
+
+def test_shuffleIsDeterministicPerEpoch(tmp_path):
+	makeDataset(tmp_path)
+	dataset = YoloDataset(tmp_path, shuffle=True, seed=3)
+	firstEpoch = dataset.getOrder()
+	dataset.setEpoch(1)
+	secondEpoch = dataset.getOrder()
+	again = YoloDataset(tmp_path, shuffle=True, seed=3)
+	again.setEpoch(1)
+	assert firstEpoch != secondEpoch
+	assert again.getOrder() == secondEpoch
+	assert sorted(secondEpoch) == list(range(len(dataset)))
+
+
+def test_cacheServesTheSameImages(tmp_path):
+	(tmp_path / "images").mkdir()
+	makeDataset(tmp_path / "images")
+	cacheDirectory = tmp_path / "cache"
+	with YoloDataset(tmp_path / "images", imageSize=(32, 16), cacheDirectory=cacheDirectory) as dataset:
+		decoded = [image for image, classIds, boxes in dataset]
+	with YoloDataset(tmp_path / "images", imageSize=(32, 16), cacheDirectory=cacheDirectory) as dataset:
+		dataset.openCache()
+		assert all(dataset.store.hasTile(filename) for filename in dataset.filenames)
+		cached = [image for image, classIds, boxes in dataset]
+	assert all(np.array_equal(first, second) for first, second in zip(decoded, cached))
@@ -0,0 +1,45 @@
+from datasetvalidation import validateChunk
+
+
+def validate(directory, files, classCount=5):
+	for annotationFilename, text in files.items():
+		(directory / annotationFilename).write_text(text)
+	return validateChunk(str(directory), list(files), classCount, minSize=0.0, duplicateIou=0.9, tolerance=0.001)
+
+
+def getProblems(stats, problemType):
+	return [(problem["file"], problem["detail"]) for problem in stats["problems"] if problem["type"] == problemType]
+
+
+def test_validFile(tmp_path):
+	stats = validate(tmp_path, {"frame0.txt": "0 0.5 0.5 0.2 0.2\n1 0.2 0.2 0.1 0.1\n"})
+	assert stats["problems"] == []
+	assert stats["boxes"] == 2
+	assert stats["classCounts"].tolist() == [1, 1, 0, 0, 0]
+
+
+#class confidence x y w h - every line is reported, none of it is counted as boxes
+def test_sixColumnFile(tmp_path):
+	stats = validate(tmp_path, {"frame0.txt": "".join("0 0.9 0.5 0.5 0.1 0.1\n" for i in range(5))})
+	malformed = getProblems(stats, "malformed")
+	assert [detail.split(":")[0] for annotationFilename, detail in malformed] == ["line 1", "line 2", "line 3", "line 4", "line 5"]
+	assert all("needs 5 values" in detail for annotationFilename, detail in malformed)
+	assert stats["boxes"] == 0
+
+
+def test_mixedFourAndSixColumnFile(tmp_path):
+	stats = validate(tmp_path, {"frame0.txt": "0 0.5 0.5 0.1\n1 0.9 0.5 0.5 0.1 0.1\n", "frame1.txt": "0 0.5 0.5 0.2 0.2\n"})
+	assert getProblems(stats, "malformed") == [("frame0.txt", "line 1: needs 5 values (class centerX centerY width height), got 4"),
+		("frame0.txt", "line 2: needs 5 values (class centerX centerY width height), got 6")]
+	assert stats["files"] == 2
+	assert stats["boxes"] == 1
+
+
+def test_nonIntegerClass(tmp_path):
+	stats = validate(tmp_path, {"frame0.txt": "0 0.5 0.5 0.2 0.2\n\n1.5 0.5 0.5 0.2 0.2\n"})
+	assert getProblems(stats, "malformed") == [("frame0.txt", "line 3: the class should be a whole number, got 1.5")]
+
+
+def test_boxProblems(tmp_path):
+	stats = validate(tmp_path, {"frame0.txt": "7 0.5 0.5 0.2 0.2\n0 0.95 0.5 0.2 0.2\n0 0.5 0.5 0.0 0.2\n"})
+	assert {problem["type"]: problem["box"] for problem in stats["problems"]} == {"unknownClass": 1, "outOfRange": 2, "degenerate": 3}
@@ -0,0 +1,19 @@
+import pytest
+from preannotate import ProposalEngine
+
+
+def test_failedSubmitDoesNotBlockTheImage(tmp_path):
+	engine = ProposalEngine("unused.onnx", str(tmp_path), None)
+	def failingSubmit(*args):
+		raise ValueError("no")
+	engine.executor.submit = failingSubmit
+	with pytest.raises(ValueError):
+		engine.request("frame0.jpg", imageFullpath=str(tmp_path / "frame0.jpg"))
+	assert "frame0.jpg" not in engine.pending
+
+
+def test_requestAfterShutdown(tmp_path):
+	engine = ProposalEngine("unused.onnx", str(tmp_path), None)
+	engine.shutdown()
+	engine.request("frame0.jpg", imageFullpath=str(tmp_path / "frame0.jpg"))
+	assert "frame0.jpg" not in engine.pending
@@ -0,0 +1,70 @@
+import threading
+import pygame
+from viewport import ImagePyramid
+from prefetch import ImagePrefetcher
+
+
+def makeEntry(imageFilename):
+	surface = pygame.Surface((64, 64), 0, 32)
+	return (64, 64, [], ImagePyramid(surface))
+
+
+def makePrefetcher(filenames, budgetBytes=1024 * 1024):
+	return ImagePrefetcher(filenames, makeEntry, ahead=0, behind=0, budgetBytes=budgetBytes, workers=1)
+
+
+def getCountedBytes(prefetcher):
+	return sum(entry[3].getByteSize() for entry in prefetcher.cache.values())
+
+
+def test_levelsBuiltAfterStoreAreCounted():
+	prefetcher = makePrefetcher(["a.png", "b.png"])
+	entry = prefetcher.get(0)
+	entry[3].getLevel(3)
+	assert prefetcher.cacheBytes == getCountedBytes(prefetcher)
+	prefetcher.shutdown()
+
+
+def test_evictingTakesOffWhatWasAdded():
+	fullBytes = 64 * 64 * 4
+	prefetcher = makePrefetcher(["a.png", "b.png", "c.png"], budgetBytes=2 * fullBytes + fullBytes // 2)
+	first = prefetcher.get(0)
+	first[3].getLevel(2)	#grows a's size after it was stored
+	prefetcher.get(1)
+	prefetcher.get(2)	#evicts a, with its levels
+	assert "a.png" not in prefetcher.cache
+	assert prefetcher.cacheBytes == getCountedBytes(prefetcher)
+	first[3].getLevel(4)	#an evicted entry growing doesn't count any more
+	assert prefetcher.cacheBytes == getCountedBytes(prefetcher)
+	prefetcher.shutdown()
+
+
+def test_storingAgainReplacesTheCount():
+	prefetcher = makePrefetcher(["a.png"])
+	prefetcher.get(0)[3].getLevel(2)
+	prefetcher.store("a.png", makeEntry("a.png"))
+	assert prefetcher.cacheBytes == getCountedBytes(prefetcher) == 64 * 64 * 4
+	prefetcher.shutdown()
+
+
+def test_levelsBuiltFromSeveralThreads():
+	pyramid = ImagePyramid(pygame.Surface((256, 256), 0, 32))
+	grown = []
+	fullBytes = pyramid.trackSize(grown.append)
+	threads = [threading.Thread(target=pyramid.getLevel, args=(levelNumber,)) for levelNumber in range(1, 9) for i in range(4)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	assert [level.get_width() for level in pyramid.levels] == [256, 128, 64, 32, 16, 8, 4, 2, 1]
+	assert fullBytes + sum(grown) == pyramid.getByteSize()
+
+
+def test_backgroundFailureIsLogged(capsys, caplog):
+	def failingLoad(imageFilename):
+		raise OSError("truncated file")
+	prefetcher = ImagePrefetcher(["a.png"], failingLoad, workers=1)
+	assert prefetcher.backgroundLoad("a.png") is None
+	assert capsys.readouterr().out == ""
+	assert [(record.name, record.levelname) for record in caplog.records] == [("prefetch", "WARNING")]
+	prefetcher.shutdown()
@@ -0,0 +1,32 @@
+import os
+import numpy as np
+import cv2
+import pytest
+from splitvid import extractSegment, getEncodeParams
+
+
+#Ten frames:  five of one picture, then five of another
+def makeVideo(videoFullpath):
+	writer = cv2.VideoWriter(videoFullpath, cv2.VideoWriter_fourcc(*"mp4v"), 10, (64, 48))
+	if not writer.isOpened():
+		pytest.skip("OpenCV can't write a video here")
+	for frameNumber in range(10):
+		frame = np.zeros((48, 64, 3), dtype=np.uint8)
+		if frameNumber < 5:
+			frame[:, :32] = 255
+		else:
+			frame[:24] = 255
+		writer.write(frame)
+	writer.release()
+
+
+def test_duplicatesAreDecodedButNotWritten(tmp_path):
+	videoFullpath = os.path.join(tmp_path, "video.mp4")
+	makeVideo(videoFullpath)
+	outputDirectory = os.path.join(tmp_path, "frames")
+	os.makedirs(outputDirectory)
+	stats = extractSegment(videoFullpath, list(range(10)), outputDirectory, 4, 2, 4, "png", getEncodeParams("png", 95, 3), dedupeThreshold=4)
+	assert stats["decodedFrames"] == 10
+	assert stats["frames"] + stats["duplicates"] == 10
+	assert stats["duplicates"] > 0
+	assert len(os.listdir(outputDirectory)) == stats["frames"]
@@ -0,0 +1,71 @@
+import os
+import threading
+import numpy as np
+from PIL import Image
+from thumbnailcache import ThumbnailCache
+
+
+def makeImages(directory, imageCount):
+	filenames = []
+	for i in range(imageCount):
+		filenames.append("frame" + str(i) + ".png")
+		Image.fromarray(np.full((30, 40, 3), i * 20, dtype=np.uint8)).save(os.path.join(directory, filenames[-1]))
+	return filenames
+
+
+def writeAnnotation(directory, filename, lineCount):
+	with open(os.path.join(directory, os.path.splitext(filename)[0] + ".txt"), "w") as annotationFile:
+		annotationFile.write("0 0.5 0.5 0.1 0.1\n" * lineCount)
+
+
+#Waits for the cache to go through filenames, collecting what its onReady got
+def buildAndCollect(cache, filenames, ready, readyEvent):
+	cache.request(filenames)
+	while not cache.isIdle():
+		readyEvent.wait(0.05)
+	tiles, boxCounts = set(), {}
+	for readyFilenames, readyBoxCounts in ready:
+		tiles.update(readyFilenames)
+		boxCounts.update(readyBoxCounts)
+	return tiles, boxCounts
+
+
+def makeCache(directory, ready, readyEvent, countBoxes):
+	def onReady(filenames, boxCounts):
+		ready.append((filenames, boxCounts))
+		readyEvent.set()
+	return ThumbnailCache(directory, 16, 9, workers=2, onReady=onReady, batchSize=2, countBoxes=countBoxes)
+
+
+def test_boxCountsComeFromTheBuilder(tmp_path):
+	filenames = makeImages(tmp_path, 3)
+	writeAnnotation(tmp_path, filenames[0], 2)
+	writeAnnotation(tmp_path, filenames[1], 0)
+	ready, readyEvent = [], threading.Event()
+	cache = makeCache(tmp_path, ready, readyEvent, True)
+	tiles, boxCounts = buildAndCollect(cache, filenames, ready, readyEvent)
+	assert tiles == set(filenames)
+	assert boxCounts == {filenames[0]: 2, filenames[1]: 0, filenames[2]: None}
+	assert cache.getBoxCounts() == boxCounts
+	assert cache.getTile(filenames[1]).shape == (9, 16, 3)
+	cache.close()
+
+
+def test_setBoxCountsWinsOverTheBuilder(tmp_path):
+	filenames = makeImages(tmp_path, 2)
+	ready, readyEvent = [], threading.Event()
+	cache = makeCache(tmp_path, ready, readyEvent, True)
+	cache.setBoxCounts({filenames[0]: 5})	#written by the labeler before the builder got to it
+	tiles, boxCounts = buildAndCollect(cache, filenames, ready, readyEvent)
+	assert boxCounts == {filenames[0]: 5, filenames[1]: None}
+	cache.close()
+
+
+def test_noCountsWithoutCountBoxes(tmp_path):
+	filenames = makeImages(tmp_path, 2)
+	writeAnnotation(tmp_path, filenames[0], 1)
+	ready, readyEvent = [], threading.Event()
+	cache = makeCache(tmp_path, ready, readyEvent, False)
+	tiles, boxCounts = buildAndCollect(cache, filenames, ready, readyEvent)
+	assert tiles == set(filenames) and boxCounts == {}
+	cache.close()
@@ -0,0 +1,99 @@
+import os
+import numpy as np
+from tilestore import TileStore
+
+
+def makeImage(directory, filename, content):
+	imageFullpath = os.path.join(directory, filename)
+	with open(imageFullpath, "wb") as imageFile:
+		imageFile.write(content)
+	return os.stat(imageFullpath)
+
+
+def makeTile(value):
+	return np.full((4, 6, 3), value, dtype=np.uint8)
+
+
+def test_putGetAndReopen(tmp_path):
+	basePath = os.path.join(tmp_path, "store")
+	imageStat = makeImage(tmp_path, "a.jpg", b"a")
+	store = TileStore(basePath, 6, 4)
+	assert store.getTile("a.jpg") is None
+	store.putTile("a.jpg", imageStat, makeTile(7))
+	assert (store.getTile("a.jpg", imageStat) == 7).all()
+	store.close()
+
+	store = TileStore(basePath, 6, 4)
+	assert store.isUpToDate("a.jpg", imageStat)
+	assert (store.getTile("a.jpg") == 7).all()
+	store.close()
+
+
+def test_changedImageIsOutOfDate(tmp_path):
+	store = TileStore(os.path.join(tmp_path, "store"), 6, 4)
+	store.putTile("a.jpg", makeImage(tmp_path, "a.jpg", b"a"), makeTile(1))
+	changedStat = makeImage(tmp_path, "a.jpg", b"changed")
+	assert not store.isUpToDate("a.jpg", changedStat)
+	assert store.getTile("a.jpg", changedStat) is None
+	store.putTile("a.jpg", changedStat, makeTile(2))
+	assert (store.getTile("a.jpg", changedStat) == 2).all()
+	assert store.getSlotCount() == 1	#the same slot again
+	store.close()
+
+
+def test_differentTileSizeStartsOver(tmp_path):
+	basePath = os.path.join(tmp_path, "store")
+	store = TileStore(basePath, 6, 4)
+	store.putTile("a.jpg", makeImage(tmp_path, "a.jpg", b"a"), makeTile(1))
+	store.close()
+	store = TileStore(basePath, 8, 4)
+	assert not store.hasTile("a.jpg")
+	store.close()
+
+
+def test_growsPastInitialCapacity(tmp_path):
+	store = TileStore(os.path.join(tmp_path, "store"), 6, 4, initialCapacity=2)
+	imageStat = makeImage(tmp_path, "a.jpg", b"a")
+	store.putTiles([("image" + str(i), imageStat, makeTile(i)) for i in range(10)])
+	store.commit()
+	assert all((store.getTile("image" + str(i)) == i).all() for i in range(10))
+	store.close()
+
+
+#Two processes with the same store open (the labeler + datasettool.py thumbnails):  they never get the same slot
+def test_twoStoresOnOnePathDontShareSlots(tmp_path):
+	basePath = os.path.join(tmp_path, "store")
+	first = TileStore(basePath, 6, 4, initialCapacity=2)
+	second = TileStore(basePath, 6, 4, initialCapacity=2)
+	aStat = makeImage(tmp_path, "a.jpg", b"a")
+	bStat = makeImage(tmp_path, "b.jpg", b"b")
+	first.putTile("a.jpg", aStat, makeTile(10))
+	second.putTile("b.jpg", bStat, makeTile(20))
+	for i in range(5):
+		second.putTile("more" + str(i), bStat, makeTile(30 + i))	#grows the tiles file under the first store
+	first.commit()
+	second.commit()
+	assert (first.getTile("a.jpg", aStat) == 10).all()
+	assert (second.getTile("b.jpg", bStat) == 20).all()
+	assert (first.getTile("b.jpg", bStat) == 20).all()	#made by the other one
+	assert (first.getTile("more4", bStat) == 34).all()
+	first.close()
+	second.close()
+
+	store = TileStore(basePath, 6, 4)
+	assert (store.getTile("a.jpg", aStat) == 10).all()
+	assert (store.getTile("b.jpg", bStat) == 20).all()
+	store.close()
+
+
+def test_uncommittedTileIsNotValidForOthers(tmp_path):
+	basePath = os.path.join(tmp_path, "store")
+	first = TileStore(basePath, 6, 4)
+	second = TileStore(basePath, 6, 4)
+	imageStat = makeImage(tmp_path, "a.jpg", b"a")
+	first.putTile("a.jpg", imageStat, makeTile(5))
+	assert second.getTile("a.jpg") is None
+	first.commit()
+	assert (second.getTile("a.jpg", imageStat) == 5).all()
+	first.close()
+	second.close()
@@ -0,0 +1,113 @@
+import os
+import time
+import pytest
+from datasetfiles import StreamingFilenameList
+from workqueue import LeaseManager, ClaimedFilenameList, leaseDirectoryName, getLeaseFilename
+
+
+@pytest.fixture
+def teamDirectory(tmp_path):
+	for i in range(20):
+		(tmp_path / ("frame" + str(i) + ".jpg")).write_bytes(b"")
+	return tmp_path
+
+
+def getCandidates():
+	return StreamingFilenameList(["frame" + str(i) + ".jpg" for i in range(20)])
+
+
+def makeIsDone(directory):
+	return lambda imageFilename: os.path.exists(os.path.join(directory, os.path.splitext(imageFilename)[0] + ".txt"))
+
+
+def claimAll(claimedList):
+	position = 0
+	while claimedList.waitFor(position):
+		position += 1
+	return list(claimedList.filenames)
+
+
+def test_twoLabelersGetDifferentImages(teamDirectory):
+	first, second = LeaseManager(teamDirectory), LeaseManager(teamDirectory)
+	firstList = ClaimedFilenameList(first, getCandidates(), makeIsDone(teamDirectory), batchSize=3, refillMargin=0)
+	secondList = ClaimedFilenameList(second, getCandidates(), makeIsDone(teamDirectory), batchSize=3, refillMargin=0)
+	assert firstList.waitFor(0) and secondList.waitFor(0)
+	firstClaimed, secondClaimed = claimAll(firstList), claimAll(secondList)
+	assert set(firstClaimed).isdisjoint(secondClaimed)
+	assert sorted(firstClaimed + secondClaimed) == sorted(getCandidates().filenames)
+	firstList.close()
+	secondList.close()
+	first.close()
+	second.close()
+
+
+def test_labeledImagesAreNotClaimed(teamDirectory):
+	for i in range(18):
+		(teamDirectory / ("frame" + str(i) + ".txt")).write_text("")
+	manager = LeaseManager(teamDirectory)
+	claimedList = ClaimedFilenameList(manager, getCandidates(), makeIsDone(teamDirectory), batchSize=4)
+	assert claimAll(claimedList) == ["frame18.jpg", "frame19.jpg"]
+	assert claimedList.complete
+	claimedList.close()
+	manager.close()
+
+
+#Everything left is someone else's:  not complete, and their images are picked up once they give them back
+def test_rescanPicksUpReleasedLeases(teamDirectory):
+	first, second = LeaseManager(teamDirectory), LeaseManager(teamDirectory)
+	firstList = ClaimedFilenameList(first, getCandidates(), makeIsDone(teamDirectory), batchSize=20)
+	assert len(claimAll(firstList)) == 20
+	secondList = ClaimedFilenameList(second, getCandidates(), makeIsDone(teamDirectory), batchSize=20, rescanSeconds=0.05)
+	assert not secondList.waitFor(0)
+	assert not secondList.complete
+	assert secondList.othersLeased == 20
+	firstList.close()
+	first.close()	#quits, giving them all back
+	deadline = time.monotonic() + 5
+	while not secondList.waitFor(0) and time.monotonic() < deadline:
+		time.sleep(0.05)
+	assert len(claimAll(secondList)) == 20
+	secondList.close()
+	second.close()
+
+
+def test_rescanPicksUpExpiredLeases(teamDirectory):
+	crashed = LeaseManager(teamDirectory, leaseSeconds=600)
+	crashedList = ClaimedFilenameList(crashed, getCandidates(), makeIsDone(teamDirectory), batchSize=20)
+	claimAll(crashedList)
+	crashedList.close()
+	crashed.stopped.set()	#crashed:  no more heartbeats, nothing given back
+	crashed.heartbeat.join()
+	survivor = LeaseManager(teamDirectory, leaseSeconds=1)
+	survivorList = ClaimedFilenameList(survivor, getCandidates(), makeIsDone(teamDirectory), batchSize=20, rescanSeconds=0.2)
+	assert not survivorList.waitFor(0)
+	oldTime = time.time() - 10
+	for imageFilename in getCandidates().filenames:
+		os.utime(os.path.join(teamDirectory, leaseDirectoryName, getLeaseFilename(imageFilename)), (oldTime, oldTime))
+	deadline = time.monotonic() + 5
+	while not survivorList.waitFor(0) and time.monotonic() < deadline:
+		time.sleep(0.05)
+	assert len(claimAll(survivorList)) == 20
+	survivorList.close()
+	survivor.close()
+
+
+def test_leaseGoesBackOnceMovedOnAndWritten(teamDirectory):
+	manager = LeaseManager(teamDirectory)
+	claimedList = ClaimedFilenameList(manager, getCandidates(), makeIsDone(teamDirectory), batchSize=2)
+	claimedList.waitFor(1)
+	leaseFullpath = os.path.join(teamDirectory, leaseDirectoryName, getLeaseFilename("frame0.jpg"))
+
+	manager.annotationWritten("frame0.jpg")	#written while still on it
+	assert os.path.exists(leaseFullpath)
+	manager.releaseWhenWritten("frame0.jpg", False)	#moved on before the write
+	assert os.path.exists(leaseFullpath)
+	manager.annotationWritten("frame0.jpg")
+	assert not os.path.exists(leaseFullpath)
+
+	manager.releaseWhenWritten("frame1.jpg", False)
+	manager.cancelRelease("frame1.jpg")	#came back to it
+	manager.annotationWritten("frame1.jpg")
+	assert os.path.exists(os.path.join(teamDirectory, leaseDirectoryName, getLeaseFilename("frame1.jpg")))
+	claimedList.close()
+	manager.close()
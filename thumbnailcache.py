@@ -0,0 +1,203 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np  #comes with opencv-python
+from PIL import Image  #pip install pillow
+from tilestore import TileStore
+from datasetfiles import getAnnotationFileName
+from datasetindex import countBoxes
+
+
+log = logging.getLogger(__name__)
+
+
+#Thumbnails for the labeler's grid overview ('g'), kept in the input directory so they're only made once:  .pygamelabeler-thumbnails.tiles
+#(the thumbnails, memory mapped) and .pygamelabeler-thumbnails.sqlite (which tile is which image) - see tilestore.py.
+#Tiles are made in background threads a batch at a time, the ones on screen first (request()), then everything else in order (buildAll()),
+#and a changed image (different mtime / size) gets its tile made again.
+#With countBoxes the same threads count the boxes in each image's annotation file for the grid's badges, so the window never reads them itself.
+#storeDirectory puts the two files somewhere else:  --team keeps them in your home directory, the input directory is on a network drive there
+#and SQLite's locking isn't safe over NFS.
+#No pygame in here - datasettool.py thumbnails builds the cache ahead of time.
+
+
+thumbnailStoreName = ".pygamelabeler-thumbnails"
+
+
+#--team:  ~/.cache/pygamelabeler/thumbnails-<hash of the input directory>, a store of your own on your own disk
+def getPersonalStoreDirectory(inputDirectory):
+	directoryKey = hashlib.blake2b(os.path.abspath(inputDirectory).encode(), digest_size=8).hexdigest()
+	return os.path.join(os.path.expanduser("~"), ".cache", "pygamelabeler", "thumbnails-" + directoryKey)
+
+
+#The image shrunk to fit in the tile (aspect kept) and centered on black.  draft() has the jpeg decoder scale down while it decodes (it skips
+#most of the work for a 1/2, 1/4 or 1/8 size image), so this doesn't cost a full size decode.
+def makeThumbnail(imageFullpath, tileWidth, tileHeight):
+	with Image.open(imageFullpath) as image:
+		image.draft("RGB", (tileWidth, tileHeight))
+		image = image.convert("RGB")
+		image.thumbnail((tileWidth, tileHeight))
+		tile = Image.new("RGB", (tileWidth, tileHeight))
+		tile.paste(image, ((tileWidth - image.width) // 2, (tileHeight - image.height) // 2))
+	return np.asarray(tile)
+
+
+class ThumbnailCache:
+	#onReady(filenames, boxCounts) is called from the builder thread every time a batch is done:  the filenames with new tiles, and
+	#{filename: box count, None with no annotation file} for the ones counted (empty without countBoxes)
+	def __init__(self, inputDirectory, tileWidth=160, tileHeight=90, workers=4, onReady=None, batchSize=32, storeDirectory=None, countBoxes=False):
+		self.inputDirectory = inputDirectory
+		self.tileWidth = tileWidth
+		self.tileHeight = tileHeight
+		self.workers = workers
+		self.onReady = onReady
+		self.batchSize = batchSize
+		self.countBoxes = countBoxes
+		self.boxCounts = {}	#filename -> box count (None with no annotation file), for countBoxes
+		if storeDirectory is not None:
+			os.makedirs(storeDirectory, exist_ok=True)
+		self.store = TileStore(os.path.join(storeDirectory or inputDirectory, thumbnailStoreName), tileWidth, tileHeight)
+		self.lock = threading.Lock()
+		self.wakeUp = threading.Condition(self.lock)
+		self.wanted = deque()	#filenames to make tiles for, in order
+		self.wantedSet = set()
+		self.checked = set()	#filenames whose tile was compared against the image file this session
+		self.allFilenames = None	#buildAll():  the whole list, gone through after the requests
+		self.allPosition = 0
+		self.building = False	#a batch is being made right now
+		self.running = True
+		self.builder = threading.Thread(target=self.buildLoop, name="thumbnails", daemon=True)
+		self.builder.start()
+
+
+	#A copy of the tile for filename, or None if it hasn't been made yet (it may be out of date - the builder fixes that once it gets to it)
+	def getTile(self, filename):
+		return self.store.getTile(filename)
+
+
+	def hasTile(self, filename):
+		return self.store.hasTile(filename)
+
+
+	def getBoxCounts(self):
+		with self.lock:
+			return dict(self.boxCounts)
+
+
+	#Counts the labeler knows better than the files did when they were counted (it has written them since).  Kept over the builder's.
+	def setBoxCounts(self, boxCounts):
+		with self.lock:
+			self.boxCounts.update(boxCounts)
+
+
+	#Make these next (the ones on screen), ahead of everything else
+	def request(self, filenames):
+		with self.lock:
+			for filename in reversed(list(filenames)):
+				if filename not in self.checked and filename not in self.wantedSet:
+					self.wanted.appendleft(filename)
+					self.wantedSet.add(filename)
+			self.wakeUp.notify()
+
+
+	#Keep going through filenames (a list or a StreamingFilenameList) whenever there's nothing requested
+	def buildAll(self, filenames):
+		with self.lock:
+			self.allFilenames = filenames
+			self.wakeUp.notify()
+
+
+	#The next batch of filenames to check / make tiles for, or None when stopping
+	def getNextBatch(self):
+		with self.lock:
+			while True:
+				if not self.running:
+					return None
+				batch = []
+				while self.wanted and len(batch) < self.batchSize:
+					filename = self.wanted.popleft()
+					self.wantedSet.discard(filename)
+					if filename not in self.checked:
+						batch.append(filename)
+				while self.allFilenames is not None and len(batch) < self.batchSize and self.allPosition < len(self.allFilenames):
+					filename = self.allFilenames[self.allPosition]
+					self.allPosition += 1
+					if filename not in self.checked:
+						batch.append(filename)
+				if len(batch) > 0:
+					self.building = True
+					return batch
+				self.building = False
+				self.wakeUp.wait(1.0)	#a StreamingFilenameList may still be growing
+
+
+	def buildLoop(self):
+		with ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="thumbnail") as executor:
+			while True:
+				batch = self.getNextBatch()
+				if batch is None:
+					return
+				self.buildBatch(batch, executor)
+
+
+	#Makes the tiles that are missing or out of date, the decodes spread over the executor's threads
+	def buildBatch(self, filenames, executor):
+		changed = []	#(filename, stat)
+		for filename in filenames:
+			try:
+				imageStat = os.stat(os.path.join(self.inputDirectory, filename))
+			except OSError:
+				continue
+			if not self.store.isUpToDate(filename, imageStat):
+				changed.append((filename, imageStat))
+		with self.lock:
+			self.checked.update(filenames)
+
+		boxCounts = {}
+		if self.countBoxes:
+			counts = list(executor.map(self.countBoxesOrNone, filenames))
+			with self.lock:
+				for filename, boxCount in zip(filenames, counts):
+					boxCounts[filename] = self.boxCounts.setdefault(filename, boxCount)	#a setBoxCounts() since is newer
+
+		ready = []
+		if len(changed) > 0:
+			thumbnails = list(executor.map(lambda change: self.makeThumbnailOrNone(change[0]), changed))
+			items = [(filename, imageStat, thumbnail) for (filename, imageStat), thumbnail in zip(changed, thumbnails) if thumbnail is not None]
+			self.store.putTiles(items)
+			self.store.commit()
+			ready = [filename for filename, imageStat, thumbnail in items]
+		if self.onReady is not None and (len(ready) > 0 or len(boxCounts) > 0):
+			self.onReady(ready, boxCounts)
+
+
+	def countBoxesOrNone(self, filename):
+		annotationFileFullpath = getAnnotationFileName(self.inputDirectory, filename)
+		if not os.path.exists(annotationFileFullpath):
+			return None
+		return countBoxes(annotationFileFullpath)
+
+
+	def makeThumbnailOrNone(self, filename):
+		try:
+			return makeThumbnail(os.path.join(self.inputDirectory, filename), self.tileWidth, self.tileHeight)
+		except (OSError, ValueError, Image.DecompressionBombError) as e:
+			log.warning("Could not make a thumbnail of " + str(filename) + ": " + str(e))
+			return None
+
+
+	#Everything requested / handed to buildAll() has been checked (for datasettool.py thumbnails)
+	def isIdle(self):
+		with self.lock:
+			return not self.building and len(self.wanted) == 0 and (self.allFilenames is None or self.allPosition >= len(self.allFilenames))
+
+
+	def close(self):
+		with self.lock:
+			self.running = False
+			self.wakeUp.notify()
+		self.builder.join()
+		self.store.close()
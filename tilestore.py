@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import threading
+import numpy as np  #comes with opencv-python
+
+
+#Same size images kept on disk so they don't have to be decoded again - the labeler's thumbnails (thumbnailcache.py) and the training loader's
+#resized images (datasetloader.py).  Two files, basePath + ".tiles" and basePath + ".sqlite":
+#	.tiles   - every image is a fixed size tile (tileHeight x tileWidth RGB), one after another, memory mapped.
+#	           Getting one is a slice of the map - no decoding, no file per image.
+#	.sqlite  - filename -> which tile, plus the source image's mtime + size when the tile was made, so a changed image isn't served out of date.
+#A different tile size starts the store over.  A changed image gets its new tile in the same slot.
+#
+#Several processes can have the same store open (the labeler and "datasettool.py thumbnails", say):  a slot is handed out inside a
+#BEGIN IMMEDIATE transaction, which SQLite only lets one process at a time into, and the tiles file only grows inside one too.  The row goes in
+#without an mtime / size, so nobody takes the tile for valid until commit() fills them in after the tile is on disk.
+#That needs SQLite's file locking to work, so keep stores on a local disk - not on NFS (--team keeps the thumbnails in your home directory).
+class TileStore:
+	def __init__(self, basePath, tileWidth, tileHeight, initialCapacity=256):
+		self.tileWidth = tileWidth
+		self.tileHeight = tileHeight
+		self.tileBytes = tileWidth * tileHeight * 3
+		self.initialCapacity = initialCapacity
+		self.lock = threading.Lock()
+		self.connection = sqlite3.connect(basePath + ".sqlite", timeout=60, isolation_level=None, check_same_thread=False)	#transactions by hand
+		self.tilesFile = None
+		self.tileMap = None
+		with self.transaction():
+			self.connection.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value INTEGER)")
+			self.connection.execute("CREATE TABLE IF NOT EXISTS tiles (filename TEXT PRIMARY KEY, slot INTEGER, mtime REAL, size INTEGER)")
+			settings = dict(self.connection.execute("SELECT name, value FROM settings"))
+			if settings.get("tileWidth") != tileWidth or settings.get("tileHeight") != tileHeight:
+				self.connection.execute("DELETE FROM tiles")
+				self.connection.executemany("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", [("tileWidth", tileWidth), ("tileHeight", tileHeight)])
+				with open(basePath + ".tiles", "wb"):
+					pass	#truncated - the old tiles are the wrong size
+			self.tilesFile = open(basePath + ".tiles", "r+b")
+			self.mapTiles(max(self.getSlotCount(), initialCapacity))
+		self.tiles = {filename: (slot, mtime, size) for filename, slot, mtime, size in self.connection.execute("SELECT filename, slot, mtime, size FROM tiles WHERE mtime IS NOT NULL")}
+		self.uncommitted = []	#index rows for tiles written since the last commit()
+
+
+	#with self.transaction():  a write transaction, one process at a time
+	def transaction(self):
+		return Transaction(self.connection)
+
+
+	#Only call inside a transaction
+	def getSlotCount(self):
+		return self.connection.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM tiles").fetchone()[0]
+
+
+	#(Re)maps the tiles file with room for at least capacity tiles.  Only call with self.lock held, inside a transaction (or from __init__).
+	def mapTiles(self, capacity):
+		self.tilesFile.seek(0, os.SEEK_END)
+		if self.tilesFile.tell() < capacity * self.tileBytes:
+			self.tilesFile.truncate(capacity * self.tileBytes)
+		else:
+			capacity = self.tilesFile.tell() // self.tileBytes	#another process made it bigger already
+		if self.tileMap is not None:
+			self.tileMap.flush()
+		self.tileMap = np.memmap(self.tilesFile, dtype=np.uint8, mode="r+", shape=(capacity, self.tileHeight, self.tileWidth, 3))
+
+
+	#(slot, mtime, size) for a finished tile, asking the index for ones another process made since.  Only call with self.lock held.
+	def getEntry(self, filename):
+		entry = self.tiles.get(filename)
+		if entry is None:
+			row = self.connection.execute("SELECT slot, mtime, size FROM tiles WHERE filename = ? AND mtime IS NOT NULL", (filename,)).fetchone()
+			if row is not None:
+				entry = self.tiles[filename] = row
+				if entry[0] >= len(self.tileMap):
+					with self.transaction():
+						self.mapTiles(entry[0] + 1)
+		return entry
+
+
+	#imageStat is an os.stat() of the source image, or None to not check whether the tile is out of date
+	def isUpToDate(self, filename, imageStat):
+		with self.lock:
+			entry = self.getEntry(filename)
+		return entry is not None and (imageStat is None or (entry[1] == imageStat.st_mtime and entry[2] == imageStat.st_size))
+
+
+	def hasTile(self, filename):
+		with self.lock:
+			return self.getEntry(filename) is not None
+
+
+	#A copy of the tile for filename, or None if there isn't one (or it's out of date, with an imageStat)
+	def getTile(self, filename, imageStat=None):
+		with self.lock:
+			entry = self.getEntry(filename)
+			if entry is None or (imageStat is not None and (entry[1] != imageStat.st_mtime or entry[2] != imageStat.st_size)):
+				return None
+			return np.array(self.tileMap[entry[0]])
+
+
+	#Readable with getTile() right away, but only in the index on disk (for other processes, and next time) after the next commit()
+	def putTile(self, filename, imageStat, tile):
+		self.putTiles([(filename, imageStat, tile)])
+
+
+	#[(filename, imageStat, tile)] - one transaction for all their slots
+	def putTiles(self, items):
+		with self.lock:
+			with self.transaction():
+				slotCount = self.getSlotCount()
+				slots = []
+				for filename, imageStat, tile in items:
+					row = self.connection.execute("SELECT slot FROM tiles WHERE filename = ?", (filename,)).fetchone()
+					if row is None:
+						self.connection.execute("INSERT INTO tiles (filename, slot, mtime, size) VALUES (?, ?, NULL, NULL)", (filename, slotCount))
+						row = (slotCount,)
+						slotCount += 1
+					slots.append(row[0])
+				if slotCount > len(self.tileMap):
+					self.mapTiles(max(slotCount, len(self.tileMap) * 2))
+			for (filename, imageStat, tile), slot in zip(items, slots):
+				self.tileMap[slot] = tile
+				self.tiles[filename] = (slot, imageStat.st_mtime, imageStat.st_size)
+				self.uncommitted.append((imageStat.st_mtime, imageStat.st_size, filename, slot))
+
+
+	#One flush + one transaction for all the tiles put since last time - doing that per tile would cost more than the decode it saves
+	def commit(self):
+		with self.lock:
+			if len(self.uncommitted) == 0:
+				return
+			self.tileMap.flush()	#the tiles are on disk before the index says they're there
+			with self.transaction():
+				self.connection.executemany("UPDATE tiles SET mtime = ?, size = ? WHERE filename = ? AND slot = ?", self.uncommitted)
+			self.uncommitted = []
+
+
+	def close(self):
+		self.commit()
+		with self.lock:
+			self.tileMap.flush()
+			self.tileMap = None
+			self.tilesFile.close()
+			self.connection.close()
+
+
+#BEGIN IMMEDIATE takes SQLite's write lock right away (waiting up to the connection's timeout for another process to finish),
+#instead of at the first write, so reading the slot count and writing the new rows can't interleave with another process doing the same.
+class Transaction:
+	def __init__(self, connection):
+		self.connection = connection
+
+
+	def __enter__(self):
+		self.connection.execute("BEGIN IMMEDIATE")
+		return self
+
+
+	def __exit__(self, excType, excValue, traceback):
+		self.connection.execute("COMMIT" if excType is None else "ROLLBACK")
+		return False
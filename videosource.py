@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import cv2  #pip install opencv-python
+from datasetfiles import getAnnotationFileName
+from splitvid import getSegments, extractSegment, getEncodeParams, getEmptyStats, printStats
+
+
+#Lets the labeler work straight off a video file instead of a directory of frames split out by splitvid.py first (which doubles the disk space and
+#pays for a jpeg encode + decode of every frame).  Each frame you label is shown under the name splitvid.py would have given it (frameN.jpg) and gets
+#the annotation file frameN.txt, so at the end exportLabeledFrames() only has to write out the frames that were actually labeled.
+#
+#Frames are decoded on demand, the same way splitvid.py's readFrame() gets to them:  short gaps are skipped with grab(), longer ones (or going backwards)
+#seek with CAP_PROP_POS_FRAMES, which uses the container's own index to start decoding from the nearest keyframe.
+#OpenCV doesn't give out the keyframe positions, so there is no index of our own - seeking through the container's is as close as it gets.
+
+
+def getFrameFilename(frameNumber, imageFormat="jpg"):
+	return "frame%d.%s" % (frameNumber, imageFormat)
+
+
+#"frame123.jpg" -> 123
+def getFrameNumber(frameFilename):
+	return int(os.path.splitext(os.path.basename(frameFilename))[0][len("frame"):])
+
+
+#One VideoCapture (they can't be shared between threads, so every read holds the lock) plus a byte limited LRU of decoded frames.
+#When getting to a frame means reading through other frames that are going to be labeled too (the prefetcher asked for the one after next first),
+#those are kept on the way past instead of being decoded again when they're asked for.
+class VideoFrameSource:
+	def __init__(self, videoFilename, budgetBytes=256 * 1024 * 1024, grabThreshold=100):
+		self.videoFilename = videoFilename
+		self.budgetBytes = budgetBytes
+		self.grabThreshold = grabThreshold
+		self.capture = cv2.VideoCapture(videoFilename)
+		if not self.capture.isOpened():
+			raise OSError("could not open video " + str(videoFilename))
+		self.framesPerSecond = self.capture.get(cv2.CAP_PROP_FPS)
+		self.frameCount = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+		self.position = 0	#the frame the next read() returns (None if a read failed and we don't know)
+		self.wantedFrames = set()
+		self.cache = OrderedDict()	#frameNumber -> BGR frame, least recently used first
+		self.cacheBytes = 0
+		self.lock = threading.Lock()
+
+
+	#The frames that are going to be labeled - the only ones worth keeping when they're read on the way to another one
+	def setWantedFrames(self, frameNumbers):
+		with self.lock:
+			self.wantedFrames = set(frameNumbers)
+
+
+	def getFrame(self, frameNumber):
+		with self.lock:
+			frame = self.cache.get(frameNumber)
+			if frame is not None:
+				self.cache.move_to_end(frameNumber)
+				return frame
+
+			if self.position is None or frameNumber < self.position or frameNumber - self.position > self.grabThreshold:
+				self.capture.set(cv2.CAP_PROP_POS_FRAMES, frameNumber)
+				self.position = frameNumber
+			while self.position < frameNumber:
+				if self.position in self.wantedFrames and self.position not in self.cache:
+					success, frame = self.capture.read()
+					if success:
+						self.cacheFrame(self.position, frame)
+				else:
+					success = self.capture.grab()
+				if not success:
+					failedFrameNumber = self.position
+					self.position = None	#unknown, seek next time
+					raise OSError("could not read frame " + str(failedFrameNumber) + " of " + str(self.videoFilename))
+				self.position += 1
+
+			success, frame = self.capture.read()
+			if not success:
+				self.position = None
+				raise OSError("could not read frame " + str(frameNumber) + " of " + str(self.videoFilename))
+			self.position = frameNumber + 1
+			self.cacheFrame(frameNumber, frame)
+			return frame
+
+
+	#Only call with self.lock held
+	def cacheFrame(self, frameNumber, frame):
+		self.cache[frameNumber] = frame
+		self.cacheBytes += frame.nbytes
+		while self.cacheBytes > self.budgetBytes and len(self.cache) > 1:
+			evictedFrameNumber, evictedFrame = self.cache.popitem(last=False)
+			self.cacheBytes -= evictedFrame.nbytes
+
+
+	def release(self):
+		with self.lock:
+			self.capture.release()
+			self.cache.clear()
+			self.cacheBytes = 0
+
+
+#Writes the frames that have an annotation file (boxes or not - an empty one is a frame with nothing in it, which YOLO needs too) and no image yet,
+#all in one go with splitvid.py's pipeline:  contiguous segments across processes, each with a decoder feeding encoder / writer threads.
+def exportLabeledFrames(videoFilename, frameNumbers, outputDirectory, imageFormat="jpg", quality=95, workers=1, grabThreshold=100):
+	toExport = [frameNumber for frameNumber in frameNumbers
+		if os.path.exists(getAnnotationFileName(outputDirectory, getFrameFilename(frameNumber, imageFormat)))
+		and not os.path.exists(os.path.join(outputDirectory, getFrameFilename(frameNumber, imageFormat)))]
+	if len(toExport) == 0:
+		print("No labeled frames to export.")
+		return
+	segments = getSegments(toExport, workers)
+	print("Exporting " + str(len(toExport)) + " labeled frames to " + str(outputDirectory) + " in " + str(len(segments)) + " segments with " + str(workers) + " processes.")
+
+	encodeParams = getEncodeParams(imageFormat, quality, 3)
+	startTime = time.perf_counter()
+	stats = getEmptyStats()
+	with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+		futures = [executor.submit(extractSegment, str(videoFilename), segment, str(outputDirectory), grabThreshold, 4, 16, imageFormat, encodeParams) for segment in segments]
+		for future in futures:
+			for key, value in future.result().items():
+				stats[key] += value
+	printStats(stats, time.perf_counter() - startTime)
@@ -0,0 +1,185 @@
+import math
+import threading
+import pygame
+
+
+#Big frames (4K / 8K sky cameras) don't fit on the screen, and the birds / bats on them are only a few pixels across.  So the window shows the image
+#through a viewport:  zoomed out to fit the window to start with, zoom in on the mouse with Ctrl + mouse wheel, drag with the middle mouse button to move around.
+#Boxes are always kept in full resolution image pixels - only what's drawn on the window goes through the viewport, and every mouse position is
+#mapped back to image pixels with screenToImage() before it's used for a box.
+
+
+#Biggest window that fits in maxWindowSize with the image's aspect ratio.  The window is never bigger than the image (zoom 1 is the most it starts at).
+def getWindowSize(imageWidth, imageHeight, maxWindowSize):
+	maxWindowWidth, maxWindowHeight = maxWindowSize
+	scale = min(1.0, maxWindowWidth / imageWidth, maxWindowHeight / imageHeight)
+	return max(1, int(imageWidth * scale)), max(1, int(imageHeight * scale))
+
+
+#zoom is screen pixels per image pixel, offsetX / offsetY is the image pixel at the top left corner of the window.
+class Viewport:
+	def __init__(self, imageWidth, imageHeight, windowWidth, windowHeight, maxZoom=16.0):
+		self.imageWidth = imageWidth
+		self.imageHeight = imageHeight
+		self.windowWidth = windowWidth
+		self.windowHeight = windowHeight
+		self.maxZoom = maxZoom
+		self.fitToWindow()
+
+
+	#The whole image in the window - also the furthest out you can zoom
+	def fitToWindow(self):
+		self.zoom = min(self.windowWidth / self.imageWidth, self.windowHeight / self.imageHeight)
+		self.minZoom = self.zoom
+		self.offsetX = 0.0
+		self.offsetY = 0.0
+		self.clamp()
+
+
+	#Keeps the image on screen:  centered along an axis if it's smaller than the window that way, otherwise no empty space past its edges
+	def clamp(self):
+		visibleWidth = self.windowWidth / self.zoom
+		visibleHeight = self.windowHeight / self.zoom
+		if visibleWidth >= self.imageWidth:
+			self.offsetX = (self.imageWidth - visibleWidth) / 2
+		else:
+			self.offsetX = min(max(self.offsetX, 0.0), self.imageWidth - visibleWidth)
+		if visibleHeight >= self.imageHeight:
+			self.offsetY = (self.imageHeight - visibleHeight) / 2
+		else:
+			self.offsetY = min(max(self.offsetY, 0.0), self.imageHeight - visibleHeight)
+
+
+	#Zoom by factor, keeping the image pixel under screenX, screenY where it is.  Returns True if anything changed.
+	def zoomAt(self, screenX, screenY, factor):
+		imageX, imageY = self.offsetX + screenX / self.zoom, self.offsetY + screenY / self.zoom
+		zoom = min(max(self.zoom * factor, self.minZoom), self.maxZoom)
+		if zoom == self.zoom:
+			return False
+		self.zoom = zoom
+		self.offsetX = imageX - screenX / self.zoom
+		self.offsetY = imageY - screenY / self.zoom
+		self.clamp()
+		return True
+
+
+	#Moves the image by screen pixels (the way the mouse moved while dragging it).  Returns True if anything changed.
+	def pan(self, screenDeltaX, screenDeltaY):
+		oldOffset = (self.offsetX, self.offsetY)
+		self.offsetX -= screenDeltaX / self.zoom
+		self.offsetY -= screenDeltaY / self.zoom
+		self.clamp()
+		return (self.offsetX, self.offsetY) != oldOffset
+
+
+	#Window position -> full resolution image position (kept on the image, so a click in the black border lands on the nearest edge)
+	def screenToImage(self, screenX, screenY):
+		imageX = min(max(self.offsetX + screenX / self.zoom, 0.0), float(self.imageWidth))
+		imageY = min(max(self.offsetY + screenY / self.zoom, 0.0), float(self.imageHeight))
+		return imageX, imageY
+
+
+	def imageToScreen(self, imageX, imageY):
+		return int(round((imageX - self.offsetX) * self.zoom)), int(round((imageY - self.offsetY) * self.zoom))
+
+
+	#The part of the image that is on screen, in image pixels
+	def getVisibleImageRect(self):
+		imageX1 = max(0.0, self.offsetX)
+		imageY1 = max(0.0, self.offsetY)
+		imageX2 = min(float(self.imageWidth), self.offsetX + self.windowWidth / self.zoom)
+		imageY2 = min(float(self.imageHeight), self.offsetY + self.windowHeight / self.zoom)
+		return imageX1, imageY1, imageX2, imageY2
+
+
+#The image at full resolution plus copies at 1/2, 1/4, 1/8 ... the size (each one smoothscaled from the one before, so it's averaged, not just
+#every other pixel).  Drawing the view starts from the smallest level that still has at least as many pixels as the screen needs, so zoomed out
+#on an 8K frame it scales a ~2K image instead of the whole 8K one.
+#The levels needed to fit the window are built by the prefetcher threads (see loadDataset() in pygamelabeler.py), any others the first time they're needed.
+class ImagePyramid:
+	def __init__(self, imageCleanSurface):
+		if imageCleanSurface.get_bitsize() not in (24, 32):
+			#smoothscale only works on 24 / 32 bit surfaces (8 bit pngs load as palette images) - convert() needs the display, so blit it instead
+			fullSurface = pygame.Surface(imageCleanSurface.get_size(), 0, 32)
+			fullSurface.blit(imageCleanSurface, (0, 0))
+			imageCleanSurface = fullSurface
+		self.levels = [imageCleanSurface]
+		self.lock = threading.Lock()	#the prefetcher threads build levels while the main thread draws
+		self.onGrow = None	#onGrow(byteCount) after levels are added, see trackSize()
+
+
+	def getSize(self):
+		return self.levels[0].get_size()
+
+
+	def getLevel(self, levelNumber):
+		grown = 0
+		with self.lock:
+			while len(self.levels) <= levelNumber:
+				previous = self.levels[-1]
+				width, height = previous.get_size()
+				if width == 1 and height == 1:
+					break
+				level = pygame.transform.smoothscale(previous, (max(1, width // 2), max(1, height // 2)))
+				self.levels.append(level)
+				grown += getSurfaceByteSize(level)
+			level = self.levels[min(levelNumber, len(self.levels) - 1)]
+			onGrow = self.onGrow
+		if grown > 0 and onGrow is not None:
+			onGrow(grown)	#outside the lock - the prefetcher takes its own lock in there, and holds it while it calls trackSize()
+		return level
+
+
+	#Smallest level with at least zoom screen pixels per image pixel (level n is 1 / 2^n of the full size)
+	def getLevelNumberForZoom(self, zoom):
+		if zoom >= 1:
+			return 0
+		return int(math.floor(math.log2(1 / zoom)))
+
+
+	def getByteSize(self):
+		with self.lock:
+			return sum(getSurfaceByteSize(level) for level in self.levels)
+
+
+	#The byte size right now, and onGrow(byteCount) gets called with the size of every level added from now on (nothing is missed or
+	#counted twice in between).  onGrow=None stops that.
+	def trackSize(self, onGrow):
+		with self.lock:
+			self.onGrow = onGrow
+			return sum(getSurfaceByteSize(level) for level in self.levels)
+
+
+	#Just the part of the image that's on screen, scaled to the window.  Past the edges of the image is black.
+	def renderView(self, viewport):
+		view = pygame.Surface((viewport.windowWidth, viewport.windowHeight))
+		imageX1, imageY1, imageX2, imageY2 = viewport.getVisibleImageRect()
+		if imageX2 <= imageX1 or imageY2 <= imageY1:
+			return view
+
+		levelNumber = self.getLevelNumberForZoom(viewport.zoom)
+		level = self.getLevel(levelNumber)
+		levelWidth, levelHeight = level.get_size()
+		levelScaleX = levelWidth / self.levels[0].get_width()
+		levelScaleY = levelHeight / self.levels[0].get_height()
+		#Whole level pixels around the visible part, then work out exactly where those land on the screen
+		levelX1 = int(math.floor(imageX1 * levelScaleX))
+		levelY1 = int(math.floor(imageY1 * levelScaleY))
+		levelX2 = min(levelWidth, int(math.ceil(imageX2 * levelScaleX)))
+		levelY2 = min(levelHeight, int(math.ceil(imageY2 * levelScaleY)))
+		screenX1, screenY1 = viewport.imageToScreen(levelX1 / levelScaleX, levelY1 / levelScaleY)
+		screenX2, screenY2 = viewport.imageToScreen(levelX2 / levelScaleX, levelY2 / levelScaleY)
+		if screenX2 <= screenX1 or screenY2 <= screenY1 or levelX2 <= levelX1 or levelY2 <= levelY1:
+			return view
+
+		visiblePart = level.subsurface((levelX1, levelY1, levelX2 - levelX1, levelY2 - levelY1))
+		if viewport.zoom >= 1:
+			scaled = pygame.transform.scale(visiblePart, (screenX2 - screenX1, screenY2 - screenY1))	#zoomed in:  keep the pixels sharp
+		else:
+			scaled = pygame.transform.smoothscale(visiblePart, (screenX2 - screenX1, screenY2 - screenY1))
+		view.blit(scaled, (screenX1, screenY1))
+		return view
+
+
+def getSurfaceByteSize(surface):
+	return surface.get_pitch() * surface.get_height()
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import socket
+import hashlib
+import logging
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+#--team:  several labelers on the same (network) directory, each working on its own images.
+#
+#Every image someone is working on has a lease file in .pygamelabeler-leases/ in the input directory.  A labeler claims a batch of images
+#that have no annotation file and no lease by creating their lease files with O_CREAT | O_EXCL - only one create can win, on a local disk and
+#on NFS (v3 and up) alike, so two labelers never get the same image.  The images are handed out in order, a batch at a time as you get near the
+#end of what you have, so each labeler gets runs of frames that go together (--propagate still works) and more labelers just means more batches
+#handed out at once.
+#
+#While the labeler runs, a heartbeat thread touches its lease files every leaseSeconds / 3.  If a labeler dies its leases stop being touched,
+#and once one is older than leaseSeconds anyone can take it over (renaming the old lease out of the way first, which only one of them can do).
+#"Older" is measured on the file server's clock:  each labeler touches a clock file of its own and reads back its mtime, so computers whose clocks
+#don't agree still agree on when a lease ran out.  A lease is given back once you've moved on from the image and its annotation file is written
+#(then it's done and nobody else will pick it up anyway), and quitting gives back the rest, so the images you didn't get to go back to everyone else.
+#Once there's nothing left to claim but other labelers' images, the claimer keeps looking every rescanSeconds for leases that were given back
+#or ran out.
+#
+#No SQLite in here on purpose, its locking isn't safe over NFS.
+
+
+leaseDirectoryName = ".pygamelabeler-leases"
+
+
+#"sub/frame12.jpg" -> lease file name (filenames can have directories in them, and the lease directory is flat)
+def getLeaseFilename(imageFilename):
+	return hashlib.blake2b(imageFilename.encode(), digest_size=16).hexdigest() + ".lease"
+
+
+def getOwnerName():
+	return socket.gethostname() + ":" + str(os.getpid()) + ":" + os.urandom(4).hex()
+
+
+class LeaseManager:
+	def __init__(self, inputDirectory, leaseSeconds=600):
+		self.leaseDirectory = os.path.join(inputDirectory, leaseDirectoryName)
+		self.leaseSeconds = leaseSeconds
+		self.owner = getOwnerName()
+		self.held = set()	#imageFilenames we have the lease for
+		self.leaving = set()	#imageFilenames to give back once their annotation file is written
+		self.lock = threading.Lock()
+		self.stopped = threading.Event()
+		os.makedirs(self.leaseDirectory, exist_ok=True)
+		self.clockFullpath = os.path.join(self.leaseDirectory, "clock-" + hashlib.blake2b(self.owner.encode(), digest_size=8).hexdigest())
+		open(self.clockFullpath, "a").close()
+		self.heartbeat = threading.Thread(target=self.heartbeatLoop, name="lease-heartbeat", daemon=True)
+		self.heartbeat.start()
+
+
+	#Now, by the file server's clock
+	def getServerTime(self):
+		os.utime(self.clockFullpath, None)
+		return os.stat(self.clockFullpath).st_mtime
+
+
+	#Names in the lease directory right now - one listing instead of a stat per image when most of them aren't leased
+	def getLeaseFilenames(self):
+		try:
+			return set(os.listdir(self.leaseDirectory))
+		except OSError:
+			return set()
+
+
+	def readOwner(self, leaseFullpath):
+		try:
+			with open(leaseFullpath, "r") as leaseFile:
+				return json.load(leaseFile).get("owner")
+		except (OSError, ValueError):
+			return None
+
+
+	#True if we got the lease.  leaseFilenames is a getLeaseFilenames() from a moment ago, serverTime a getServerTime().
+	def tryClaim(self, imageFilename, leaseFilenames, serverTime):
+		leaseFullpath = os.path.join(self.leaseDirectory, getLeaseFilename(imageFilename))
+		if getLeaseFilename(imageFilename) in leaseFilenames and not self.takeOverIfExpired(leaseFullpath, serverTime):
+			return False
+		try:
+			fileDescriptor = os.open(leaseFullpath, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+		except FileExistsError:
+			return False	#someone else just got it
+		with os.fdopen(fileDescriptor, "w") as leaseFile:
+			json.dump({"owner": self.owner, "image": imageFilename, "claimed": time.strftime("%Y-%m-%d %H:%M:%S")}, leaseFile)
+		with self.lock:
+			self.held.add(imageFilename)
+		return True
+
+
+	#Moves an expired lease out of the way (the rename only works for one of the labelers trying it) so it can be claimed.  False if it isn't expired.
+	def takeOverIfExpired(self, leaseFullpath, serverTime):
+		try:
+			if serverTime - os.stat(leaseFullpath).st_mtime < self.leaseSeconds:
+				return False
+			expiredFullpath = leaseFullpath + "." + hashlib.blake2b(self.owner.encode(), digest_size=8).hexdigest() + ".expired"
+			os.rename(leaseFullpath, expiredFullpath)
+			if serverTime - os.stat(expiredFullpath).st_mtime < self.leaseSeconds:
+				#Someone else took it over between the stat and the rename, that was their new lease - put it back (link() won't overwrite)
+				try:
+					os.link(expiredFullpath, leaseFullpath)
+				except OSError:
+					pass
+				os.remove(expiredFullpath)
+				return False
+			log.info("Took over an expired lease from " + str(self.readOwner(expiredFullpath)))
+			os.remove(expiredFullpath)
+		except FileNotFoundError:
+			pass	#released or taken over by someone else in the meantime - try to claim it anyway
+		except OSError as e:
+			log.warning("Could not take over the expired lease " + str(leaseFullpath) + ": " + str(e))
+			return False
+		return True
+
+
+	def release(self, imageFilename):
+		leaseFullpath = os.path.join(self.leaseDirectory, getLeaseFilename(imageFilename))
+		with self.lock:
+			self.held.discard(imageFilename)
+			self.leaving.discard(imageFilename)
+		if self.readOwner(leaseFullpath) == self.owner:
+			try:
+				os.remove(leaseFullpath)
+			except OSError:
+				pass
+
+
+	#The labeler moved on from this image:  give the lease back now if its annotation file is written, otherwise once it is
+	def releaseWhenWritten(self, imageFilename, isWritten):
+		if isWritten:
+			self.release(imageFilename)
+			return
+		with self.lock:
+			if imageFilename in self.held:
+				self.leaving.add(imageFilename)
+
+
+	#Back on the image before the write - keep the lease
+	def cancelRelease(self, imageFilename):
+		with self.lock:
+			self.leaving.discard(imageFilename)
+
+
+	#AnnotationStore onWrite (the writer thread)
+	def annotationWritten(self, imageFilename):
+		with self.lock:
+			leaving = imageFilename in self.leaving
+		if leaving:
+			self.release(imageFilename)
+
+
+	def heartbeatLoop(self):
+		while not self.stopped.wait(self.leaseSeconds / 3):
+			self.renew()
+
+
+	#Touches our leases, and lets go of any that someone else took over (we were stuck for longer than leaseSeconds)
+	def renew(self):
+		with self.lock:
+			held = list(self.held)
+		for imageFilename in held:
+			leaseFullpath = os.path.join(self.leaseDirectory, getLeaseFilename(imageFilename))
+			if self.readOwner(leaseFullpath) != self.owner:
+				log.warning("Lost the lease on " + imageFilename + " (it ran out and another labeler took it) - check its boxes")
+				with self.lock:
+					self.held.discard(imageFilename)
+				continue
+			try:
+				os.utime(leaseFullpath, None)
+			except OSError as e:
+				log.warning("Could not renew the lease on " + imageFilename + ": " + str(e))
+
+
+	#Stops the heartbeat and gives back every lease
+	def close(self):
+		self.stopped.set()
+		self.heartbeat.join()
+		with self.lock:
+			held = list(self.held)
+		for imageFilename in held:
+			self.release(imageFilename)
+		try:
+			os.remove(self.clockFullpath)
+		except OSError:
+			pass
+
+
+#The images this labeler has claimed, as a filenames list for the labeler (len(), [], waitFor() like StreamingFilenameList).
+#candidates is every image (a StreamingFilenameList, in order) and isDone(imageFilename) says whether it's labeled already.
+#A background thread claims the next batch once you're within refillMargin images of the end of what's claimed, so 's' doesn't wait on the lease files.
+#Each batch looks from where the last one stopped to the end and then from the start again, so leases given back earlier in the list are found too.
+#When a whole pass finds nothing to claim but other labelers still have leases on unlabeled images, waitFor() says there's nothing more right now
+#(so the window isn't stuck waiting on another labeler) and the thread looks again every rescanSeconds - those images come back if the other
+#labeler quits or their leases run out.  complete is only set once every image is labeled or ours.
+class ClaimedFilenameList:
+	def __init__(self, leaseManager, candidates, isDone, batchSize=16, refillMargin=6, rescanSeconds=60):
+		self.leaseManager = leaseManager
+		self.candidates = candidates
+		self.isDone = isDone
+		self.batchSize = batchSize
+		self.refillMargin = refillMargin
+		self.rescanSeconds = rescanSeconds
+		self.filenames = []
+		self.claimed = set()
+		self.wanted = 1		#claim until there are this many
+		self.scanPosition = 0	#next candidate to look at
+		self.othersLeased = 0	#unlabeled images other labelers had leases on, in the last pass that found nothing to claim
+		self.waiting = False	#the last pass found nothing, only other labelers' images are left - looking again every rescanSeconds
+		self.complete = False
+		self.condition = threading.Condition()
+		self.stopped = threading.Event()
+		self.thread = threading.Thread(target=self.claimLoop, name="lease-claims", daemon=True)
+		self.thread.start()
+
+
+	def claimLoop(self):
+		while not self.stopped.is_set():
+			with self.condition:
+				while len(self.filenames) >= self.wanted and not self.stopped.is_set():
+					self.condition.wait()
+			if self.stopped.is_set():
+				return
+			batch, othersLeased = self.claimBatch()
+			with self.condition:
+				self.filenames.extend(batch)
+				self.waiting = len(batch) == 0 and othersLeased > 0
+				self.othersLeased = othersLeased
+				if len(batch) == 0 and othersLeased == 0:
+					self.complete = True
+				self.condition.notify_all()
+			if self.complete:
+				return
+			if self.waiting:
+				self.stopped.wait(self.rescanSeconds)
+
+
+	#(claimed imageFilenames, how many unlabeled images other labelers have leases on - only counted when nothing could be claimed)
+	def claimBatch(self):
+		batch = []
+		othersLeased = 0
+		startPosition = self.scanPosition
+		wrapped = False
+		leaseFilenames = self.leaseManager.getLeaseFilenames()
+		serverTime = self.leaseManager.getServerTime()
+		while len(batch) < self.batchSize:
+			if wrapped and self.scanPosition >= startPosition:
+				break	#all the way around
+			if not self.candidates.waitFor(self.scanPosition):
+				if wrapped or startPosition == 0 or len(batch) > 0:
+					break
+				wrapped = True
+				self.scanPosition = 0
+				continue
+			imageFilename = self.candidates[self.scanPosition]
+			self.scanPosition += 1
+			if imageFilename in self.claimed or self.isDone(imageFilename):
+				continue
+			if self.leaseManager.tryClaim(imageFilename, leaseFilenames, serverTime):
+				batch.append(imageFilename)
+				self.claimed.add(imageFilename)
+			else:
+				othersLeased += 1
+		return batch, othersLeased
+
+
+	def __len__(self):
+		return len(self.filenames)
+
+
+	def __getitem__(self, position):
+		return self.filenames[position]
+
+
+	#False if position isn't claimed and there's nothing to claim right now (see waiting) or ever again (complete)
+	def waitFor(self, position):
+		with self.condition:
+			if position + self.refillMargin >= self.wanted:
+				self.wanted = position + self.refillMargin + 1
+				self.condition.notify_all()
+			while len(self.filenames) <= position and not self.complete and not self.waiting:
+				self.condition.wait()
+			return position < len(self.filenames)
+
+
+	def close(self):
+		self.stopped.set()
+		with self.condition:
+			self.condition.notify_all()
+		self.thread.join()